@@ -17,14 +17,11 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 
+from paskoocheh.config_updates import schedule_config_update
 from paskoocheh.helpers import disable_for_loaddata
-from paskoocheh.tasks import enable_latest_cloudfront_state_invalidate_flag
 
 
 @disable_for_loaddata
 def blogs_changed(sender, instance, **kwargs):
 
-    from blog.tasks import update_json_blog
-
-    update_json_blog()
-    enable_latest_cloudfront_state_invalidate_flag()
+    schedule_config_update('blog')
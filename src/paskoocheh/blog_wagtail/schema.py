@@ -24,7 +24,7 @@ from typing import List, Optional
 
 from wagtail.models import Page, Locale
 
-from paskoocheh.utils import Connection
+from paskoocheh.utils import Connection, cached_count
 
 from static_page.types.captioned_image import (
     CaptionedImageBlock, CaptionedImageNode)
@@ -280,7 +280,9 @@ class BlogQuery:
             first=first,
             last=last,
             after=after,
-            before=before)
+            before=before,
+            keyset=True,
+            count=cached_count)
 
     @strawberry.field
     def blog_index(self, locale: str) -> Optional[BlogIndexNode]:
@@ -0,0 +1,331 @@
+# -*- coding: utf-8 -*-
+# Paskoocheh - A tool marketplace for Iranian
+#
+# Copyright (C) 2024 ASL19 Organization
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+u"""
+Coalescing scheduler for config file regeneration.
+
+Model signals request a regeneration with schedule_config_update instead of
+regenerating the config files inside the save path. Requests for the same
+config type are merged in Redis until no new request has arrived for
+CONFIG_UPDATE_QUIET_WINDOW seconds (or the oldest request is older than
+CONFIG_UPDATE_MAX_DELAY seconds), then the config file is regenerated once.
+
+Pending requests are run either by a per-process timer
+(CONFIG_UPDATE_BACKEND = 'thread') or by the run_pending_config_updates
+management command on every cron tick (CONFIG_UPDATE_BACKEND = 'cron').
+Timers still armed when the process exits (e.g. at the end of a management
+command) are run at exit.
+"""
+
+import atexit
+import logging
+import threading
+import time
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+from django.utils.module_loading import import_string
+from paskoocheh.tasks import enable_latest_cloudfront_state_invalidate_flag
+
+logger = logging.getLogger(__name__)
+
+CONFIG_UPDATERS = {
+    'tools': 'tools.tasks.update_json_config',
+    'blog': 'blog.tasks.update_json_blog',
+    'texts': 'preferences.tasks.update_json_texts',
+}
+
+_timers = {}
+_timers_lock = threading.Lock()
+
+
+# ========================
+# === Helper functions ===
+# ========================
+def get_pending_cache_key(config_type):
+    return u'cache_type=config_update_pending&config_type={config_type}&'.format(
+        config_type=config_type,
+    )
+
+
+def get_stats_cache_key(config_type):
+    return u'cache_type=config_update_stats&config_type={config_type}&'.format(
+        config_type=config_type,
+    )
+
+
+def get_lock_cache_key(config_type):
+    return u'cache_type=config_update_lock&config_type={config_type}&'.format(
+        config_type=config_type,
+    )
+
+
+def merge_pending_update(pending, triggers, changed_version_ids, requested):
+    """
+    Merge triggers into a pending update record.
+
+    Args:
+        pending (dict): Pending update record, or None
+        triggers (int): Number of triggers being merged
+        changed_version_ids (set): Versions affected by the triggers, or None
+            if every version may be affected
+        requested (float): Timestamp of the most recent trigger
+
+    Returns:
+        dict
+    """
+    if pending is None:
+        pending = {
+            'triggers': 0,
+            'changed_version_ids': set(),
+            'first_requested': requested,
+            'last_requested': requested,
+        }
+
+    pending['triggers'] += triggers
+    pending['last_requested'] = max(pending['last_requested'], requested)
+
+    if changed_version_ids is None or pending['changed_version_ids'] is None:
+        pending['changed_version_ids'] = None
+    else:
+        pending['changed_version_ids'] |= set(changed_version_ids)
+
+    return pending
+
+
+# ==================
+# === Scheduling ===
+# ==================
+def schedule_config_update(config_type, changed_version_ids=None):
+    """
+    Request a regeneration of a config file.
+
+    Args:
+        config_type (str): Key of CONFIG_UPDATERS
+        changed_version_ids (set): Versions affected by the change (tools
+            config only). Defaults to None (every version may be affected)
+
+    Returns:
+        None
+    """
+    if config_type not in CONFIG_UPDATERS:
+        raise ValueError(u'Unknown config type: {}'.format(config_type))
+
+    now = time.time()
+
+    if settings.CONFIG_UPDATE_QUIET_WINDOW <= 0:
+        run_config_update(
+            config_type,
+            merge_pending_update(None, 1, changed_version_ids, now),
+        )
+        return
+
+    with cache.lock(get_lock_cache_key(config_type), timeout=30):
+        pending = merge_pending_update(
+            cache.get(get_pending_cache_key(config_type)),
+            1,
+            changed_version_ids,
+            now,
+        )
+        cache.set(get_pending_cache_key(config_type), pending, None)
+
+    logger.debug(
+        u'Scheduled {config_type} config update ({triggers} pending triggers)'.format(
+            config_type=config_type,
+            triggers=pending['triggers'],
+        )
+    )
+
+    if settings.CONFIG_UPDATE_BACKEND == 'thread':
+        start_timer(config_type, pending)
+
+
+def start_timer(config_type, pending):
+    """
+    (Re)start the in-process timer that runs the pending update of
+    config_type once the quiet window has elapsed, or once the oldest
+    request is CONFIG_UPDATE_MAX_DELAY seconds old, whichever comes first.
+    """
+    delay = max(0, min(
+        settings.CONFIG_UPDATE_QUIET_WINDOW,
+        pending['first_requested'] + settings.CONFIG_UPDATE_MAX_DELAY - time.time(),
+    ))
+
+    with _timers_lock:
+        timer = _timers.get(config_type)
+        if timer is not None:
+            timer.cancel()
+
+        timer = threading.Timer(
+            delay,
+            run_timer,
+            args=[config_type],
+        )
+        timer.daemon = True
+        _timers[config_type] = timer
+        timer.start()
+
+
+def run_timer(config_type):
+    with _timers_lock:
+        _timers.pop(config_type, None)
+
+    try:
+        run_pending_config_updates(config_types=[config_type])
+    finally:
+        # Timer threads get their own database connections
+        connections.close_all()
+
+
+@atexit.register
+def run_timers_at_exit():
+    u"""
+    Run the pending updates of the timers still armed when the process
+    exits, which would otherwise be lost with their daemon threads.
+    """
+    with _timers_lock:
+        config_types = list(_timers)
+        for timer in _timers.values():
+            timer.cancel()
+        _timers.clear()
+
+    if config_types:
+        run_pending_config_updates(config_types=config_types, force=True)
+
+
+# =================
+# === Execution ===
+# =================
+def run_pending_config_updates(config_types=None, force=False):
+    """
+    Run the pending config updates whose quiet window has elapsed.
+
+    Args:
+        config_types (list): Config types to run. Defaults to None (all)
+        force (bool): Run pending updates even if their quiet window hasn't
+            elapsed yet
+
+    Returns:
+        dict: Number of merged triggers by config type, for the updates that
+            were run
+    """
+    merged_triggers = {}
+    now = time.time()
+
+    for config_type in config_types or CONFIG_UPDATERS:
+        with cache.lock(get_lock_cache_key(config_type), timeout=30):
+            pending = cache.get(get_pending_cache_key(config_type))
+
+            if pending is None:
+                continue
+
+            if (
+                not force and
+                now - pending['last_requested'] < settings.CONFIG_UPDATE_QUIET_WINDOW and
+                now - pending['first_requested'] < settings.CONFIG_UPDATE_MAX_DELAY
+            ):
+                continue
+
+            cache.delete(get_pending_cache_key(config_type))
+
+        try:
+            run_config_update(config_type, pending)
+        except Exception as exc:
+            logger.error(
+                u'{config_type} config update failed, rescheduling (error={exc})'.format(
+                    config_type=config_type,
+                    exc=exc,
+                )
+            )
+
+            with cache.lock(get_lock_cache_key(config_type), timeout=30):
+                cache.set(
+                    get_pending_cache_key(config_type),
+                    merge_pending_update(
+                        cache.get(get_pending_cache_key(config_type)),
+                        pending['triggers'],
+                        pending['changed_version_ids'],
+                        pending['last_requested'],
+                    ),
+                    None,
+                )
+
+            continue
+
+        merged_triggers[config_type] = pending['triggers']
+
+    return merged_triggers
+
+
+def run_config_update(config_type, pending):
+    """
+    Regenerate a config file and record how many triggers were merged into
+    the regeneration.
+
+    Args:
+        config_type (str): Key of CONFIG_UPDATERS
+        pending (dict): Pending update record (see merge_pending_update)
+
+    Returns:
+        None
+    """
+    updater = import_string(CONFIG_UPDATERS[config_type])
+
+    if config_type == 'tools':
+        updater(pending['changed_version_ids'])
+    else:
+        updater()
+
+    enable_latest_cloudfront_state_invalidate_flag()
+
+    stats = cache.get(get_stats_cache_key(config_type)) or {'runs': 0, 'triggers': 0}
+    stats['runs'] += 1
+    stats['triggers'] += pending['triggers']
+    cache.set(get_stats_cache_key(config_type), stats, None)
+
+    logger.info(
+        u'Updated {config_type} config ({triggers} triggers merged)'.format(
+            config_type=config_type,
+            triggers=pending['triggers'],
+        )
+    )
+
+
+def get_config_update_stats():
+    """
+    Return config update counters by config type.
+
+    Returns:
+        dict: {config_type: {'runs', 'triggers', 'merged', 'pending'}} where
+            merged is the number of triggers that didn't cause a regeneration
+            of their own
+    """
+    stats = {}
+
+    for config_type in CONFIG_UPDATERS:
+        config_type_stats = cache.get(get_stats_cache_key(config_type)) or {'runs': 0, 'triggers': 0}
+        pending = cache.get(get_pending_cache_key(config_type))
+
+        stats[config_type] = {
+            'runs': config_type_stats['runs'],
+            'triggers': config_type_stats['triggers'],
+            'merged': config_type_stats['triggers'] - config_type_stats['runs'],
+            'pending': pending['triggers'] if pending else 0,
+        }
+
+    return stats
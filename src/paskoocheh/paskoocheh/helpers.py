@@ -18,9 +18,12 @@
 
 
 import hashlib
+import icu
 import re
+import threading
 from collections import namedtuple
 from functools import wraps
+from django.conf import settings
 from django.core.cache import cache
 from django.core.exceptions import ValidationError
 from django.contrib.postgres.search import TrigramSimilarity
@@ -113,6 +116,59 @@ def get_hashed_filename(file):
     return filename_with_hash
 
 
+_transliterators = threading.local()
+
+
+def get_transliterator():
+    u"""
+    Return the ICU transliterator of the platform’s language (Arabic for
+    Zanga, Persian otherwise) to Latin. Creating one is expensive and
+    using one isn’t thread-safe, so there is one per thread.
+    """
+    transliterator = getattr(_transliterators, 'transliterator', None)
+
+    if transliterator is None:
+        transliterator = icu.Transliterator.createInstance(
+            'Arabic-Latin/BGN' if settings.PLATFORM == 'zanga' else 'Persian-Latin/BGN')
+        _transliterators.transliterator = transliterator
+
+    return transliterator
+
+
+def get_sort_key(name):
+    u"""
+    Return the transliterated sort key of a name, which orders names by their
+    Latin transliteration.
+    """
+    return get_transliterator().transliterate(name or '')
+
+
+# Arabic letters and digits folded to their Persian or ASCII forms, and
+# zero-width non-joiners replaced with spaces, for search
+_search_text_translation = str.maketrans({
+    u'\u064a': u'\u06cc',     # Arabic yeh
+    u'\u0649': u'\u06cc',     # Alef maksura
+    u'\u0643': u'\u06a9',     # Arabic kaf
+    u'\u200c': u' ',         # Zero-width non-joiner
+    **{chr(0x06f0 + digit): str(digit) for digit in range(10)},    # Persian digits
+    **{chr(0x0660 + digit): str(digit) for digit in range(10)},    # Arabic-Indic digits
+})
+
+# Harakat, superscript alef and tatweel
+_search_text_diacritics_regex = re.compile(u'[\u064b-\u065f\u0670\u0640]')
+
+
+def normalize_search_text(text):
+    u"""
+    Return text folded for search: Arabic yeh and kaf to their Persian forms,
+    Persian and Arabic-Indic digits to ASCII, zero-width non-joiners to
+    spaces, without diacritics, lowercased and with collapsed whitespace.
+    """
+    text = _search_text_diacritics_regex.sub(u'', (text or u'').translate(_search_text_translation))
+
+    return u' '.join(text.lower().split())
+
+
 strict_slug_regex = re.compile(r'^[a-z][a-z-]*[a-z]$')
 
 
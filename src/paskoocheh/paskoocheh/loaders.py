@@ -0,0 +1,174 @@
+# -*- coding: utf-8 -*-
+# Paskoocheh - A tool marketplace for Iranian
+#
+# Copyright (C) 2024 ASL19 Organization
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+u"""
+Per-request batch loaders for GraphQL resolvers.
+
+The schema is executed synchronously, so resolvers of sibling nodes run one
+after the other and can't be batched by awaiting them together. Instead,
+connections prime the loaders with the keys of every node of the page (see
+prime_batch_loaders), and the first resolver that loads a relation loads it
+for every primed key at once. The following siblings are then served from
+the loader. Nodes returned by a loader prime the loaders in turn, so nested
+relations are batched across the whole page too.
+
+Loaders live for one GraphQL operation (see BatchLoaderExtension). Outside
+of an operation a throwaway registry is used, so resolvers behave the same
+and just load their own key.
+"""
+
+import contextvars
+from collections import defaultdict
+
+from strawberry.extensions import SchemaExtension
+
+_batch_loaders = contextvars.ContextVar('batch_loaders', default=None)
+
+# Model class -> function returning the {key group: keys} of an instance
+_primers = {}
+
+
+class BatchLoader:
+    """
+    Loads the values of a group of keys with a single call.
+
+    Args:
+        registry (BatchLoaders): Registry holding the primed keys
+        group (str): Key group whose primed keys are loaded together
+        load_many (callable): Returns a dict of values by key for a set of
+            keys (missing keys get default_factory())
+        default_factory (callable): Value of the keys load_many didn't return
+    """
+
+    def __init__(self, registry, group, load_many, default_factory):
+        self.registry = registry
+        self.group = group
+        self.load_many = load_many
+        self.default_factory = default_factory
+        self.results = {}
+
+    def load(self, key):
+        if key not in self.results:
+            keys = (self.registry.primed[self.group] | {key}) - self.results.keys()
+            values = self.load_many(keys)
+
+            for loaded_key in keys:
+                self.results[loaded_key] = values.get(loaded_key, self.default_factory())
+
+            # The loaded nodes are siblings too (e.g. the versions of every
+            # tool of a page), so their own relations get batched as well
+            for value in values.values():
+                self.registry.prime_nodes(value if isinstance(value, list) else [value])
+
+        return self.results[key]
+
+
+class BatchLoaders:
+    """
+    Registry of the batch loaders and primed keys of a GraphQL operation.
+    """
+
+    def __init__(self):
+        self.loaders = {}
+        self.primed = defaultdict(set)
+
+    def get(self, name, group, load_many, default_factory=lambda: None):
+        """
+        Return the loader registered under name, creating it if needed.
+
+        Args:
+            name (hashable): Loader name, including any argument the loaded
+                values depend on (e.g. ordering)
+            group (str): Key group of the loader
+            load_many (callable): See BatchLoader
+            default_factory (callable): See BatchLoader
+
+        Returns:
+            BatchLoader
+        """
+        loader = self.loaders.get(name)
+
+        if loader is None:
+            loader = BatchLoader(self, group, load_many, default_factory)
+            self.loaders[name] = loader
+
+        return loader
+
+    def prime(self, group, keys):
+        self.primed[group].update(keys)
+
+    def prime_nodes(self, nodes):
+        for node in nodes:
+            primer = _primers.get(type(node))
+            if primer is None:
+                continue
+
+            for group, keys in primer(node).items():
+                self.prime(group, keys)
+
+
+class BatchLoaderExtension(SchemaExtension):
+    """
+    Give every GraphQL operation its own batch loaders.
+    """
+
+    def on_operation(self):
+        token = _batch_loaders.set(BatchLoaders())
+        yield
+        _batch_loaders.reset(token)
+
+
+def get_batch_loaders():
+    """
+    Return the batch loaders of the current GraphQL operation.
+
+    Returns:
+        BatchLoaders
+    """
+    return _batch_loaders.get() or BatchLoaders()
+
+
+def register_batch_loader_primer(model, primer):
+    """
+    Register the function returning the keys a model instance primes.
+
+    Args:
+        model: Model class
+        primer (callable): Returns a {key group: keys} dict for an instance
+
+    Returns:
+        None
+    """
+    _primers[model] = primer
+
+
+def prime_batch_loaders(nodes):
+    """
+    Prime the batch loaders with the keys of sibling nodes.
+
+    Args:
+        nodes (iterable): Model instances resolved together
+
+    Returns:
+        None
+    """
+    batch_loaders = _batch_loaders.get()
+    if batch_loaders is None:
+        return
+
+    batch_loaders.prime_nodes(nodes)
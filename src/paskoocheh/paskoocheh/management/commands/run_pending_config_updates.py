@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+# Paskoocheh - A tool marketplace for Iranian
+#
+# Copyright (C) 2024 ASL19 Organization
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+from django.core.management.base import BaseCommand
+
+from ...config_updates import (
+    get_config_update_stats,
+    run_pending_config_updates,
+)
+
+
+class Command(BaseCommand):
+    u"""
+    Runs the config file regenerations requested by app code (e.g. model
+    signals) whose quiet window has elapsed.
+
+    Meant to be run on every cron tick when CONFIG_UPDATE_BACKEND is 'cron'.
+
+    If the --force argument is passed to the command, pending regenerations
+    will run even if their quiet window hasn’t elapsed yet.
+    """
+
+    help = u'Runs the config file regenerations requested by app code (e.g. model signals).'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--force',
+            action='store_true'
+        )
+
+    def handle(self, *args, **options):
+
+        merged_triggers = run_pending_config_updates(force=options['force'])
+
+        if not merged_triggers:
+            self.stdout.write(u'No config file needed to be updated')
+
+        for config_type, triggers in merged_triggers.items():
+            self.stdout.write(f'Updated {config_type} config ({triggers} triggers merged)')
+
+        for config_type, stats in get_config_update_stats().items():
+            self.stdout.write(
+                f'{config_type}: {stats["runs"]} updates, {stats["triggers"]} triggers, '
+                f'{stats["merged"]} merged, {stats["pending"]} pending'
+            )
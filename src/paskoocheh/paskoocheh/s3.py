@@ -18,9 +18,10 @@
 
 import logging
 import boto3
+import hashlib
 import json
 import gzip
-import io
+import threading
 from django.conf import settings
 from pyskoocheh import crypto
 
@@ -28,6 +29,67 @@ from botocore.exceptions import ClientError
 
 logger = logging.getLogger(__name__)
 
+# Metadata of config signatures holding the sha256 hash of the JSON content
+# they were made for
+CONTENT_HASH_METADATA = 'content-sha256'
+
+_s3_client = None
+_signer = None
+_lock = threading.Lock()
+
+
+def get_s3_client():
+    u"""
+    Return the S3 client configs are written with. It's created once and
+    shared, boto3 clients are thread-safe.
+    """
+    global _s3_client
+
+    with _lock:
+        if _s3_client is None:
+            _s3_client = boto3.client(
+                's3',
+                region_name=settings.S3_REGION,
+                config=boto3.session.Config(signature_version='s3v4'),
+                aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
+                aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY
+            )
+
+    return _s3_client
+
+
+def get_signer():
+    u"""
+    Return the SignatureManager configs are signed with. It's created once,
+    so the private key is only decoded and parsed once.
+    """
+    global _signer
+
+    with _lock:
+        if _signer is None:
+            _signer = crypto.SignatureManager(settings.PGP_PRIVATE_KEY, settings.PGP_KEY_PASSWORD)
+
+    return _signer
+
+
+def compress_gzip(content):
+    # No modification time in the header, so the same content is always
+    # compressed the same
+    return gzip.compress(content, compresslevel=9, mtime=0)
+
+
+def compress_brotli(content):
+    import brotli
+
+    return brotli.compress(content)
+
+
+# Compressed config encodings: file extension and compression function
+CONFIG_ENCODINGS = {
+    'gzip': ('.gz', compress_gzip),
+    'br': ('.br', compress_brotli),
+}
+
 
 def write_content_to_s3(content, key):
     """
@@ -38,60 +100,106 @@ def write_content_to_s3(content, key):
         key: The target key on S3
     """
 
-    s3_res = boto3.resource(
-        's3',
-        region_name=settings.S3_REGION,
-        config=boto3.session.Config(signature_version='s3v4'),
-        aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
-        aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY
-    )
-    s3_res.Bucket(settings.AWS_STORAGE_BUCKET_NAME).put_object(
+    get_s3_client().put_object(
+        Bucket=settings.AWS_STORAGE_BUCKET_NAME,
         StorageClass='REDUCED_REDUNDANCY',
         Key=key,
         Body=content)
 
 
-def write_config_to_s3(config_data, key, gzipped=False):
+def get_published_content_hash(key):
     """
-        Writes the JSON config file to S3
+        Return the content hash of a published config file
 
         Args:
-        config_data: A dictionary containing all the data to be written
+        key: The key of the config file on S3
+
+        Returns:
+        The sha256 hash its signature was made for, None if it
+        hasn't been published (or was published without it)
     """
-    if settings.IS_DEVELOPMENT:
-        return
 
-    s3_res = boto3.resource(
-        's3',
-        region_name=settings.S3_REGION,
-        config=boto3.session.Config(signature_version='s3v4'),
-        aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
-        aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY
-    )
+    try:
+        response = get_s3_client().head_object(
+            Bucket=settings.AWS_STORAGE_BUCKET_NAME,
+            Key=key + '.asc')
+    except ClientError as e:
+        if e.response['ResponseMetadata']['HTTPStatusCode'] != 404:
+            logger.error(f'S3 header reading of "{key}.asc" failed with error: {e}')
+        return None
 
-    signer = crypto.SignatureManager(settings.PGP_PRIVATE_KEY, settings.PGP_KEY_PASSWORD)
-    buffer = json.dumps(config_data)
-    if gzipped:
-        buffer = io.StringIO()
-        writer = gzip.GzipFile(None, 'wb', 9, buffer)
-        writer.write(json.dumps(config_data))
-        writer.close()
-        buffer.seek(0)
-        key += '.gz'
+    return response['Metadata'].get(CONTENT_HASH_METADATA)
 
-    signature = signer.sign_string(buffer)
 
-    s3_res.Bucket(settings.AWS_STORAGE_BUCKET_NAME).put_object(
-        StorageClass='REDUCED_REDUNDANCY',
-        Key=key,
-        Body=buffer)
-    s3_res.Bucket(settings.AWS_STORAGE_BUCKET_NAME).put_object(
+def publish_config_file(key, content, content_hash, compress=None):
+    """
+        Write a config file and its signature to S3, unless the same
+        content has already been published
+
+        The signature, which holds the content hash, is written last,
+        so a file is only skipped once both have been written.
+
+        Args:
+        key: The target key on S3
+        content: The JSON content (bytes)
+        content_hash: The sha256 hash of content
+        compress: Function compressing the content, if any
+
+        Returns:
+        Whether the file was written
+    """
+
+    if get_published_content_hash(key) == content_hash:
+        logger.info(f'"{key}" is up to date')
+        return False
+
+    body = compress(content) if compress is not None else content
+    signature = get_signer().sign_string(body)
+
+    write_content_to_s3(body, key)
+    get_s3_client().put_object(
+        Bucket=settings.AWS_STORAGE_BUCKET_NAME,
         StorageClass='REDUCED_REDUNDANCY',
         Key=key + '.asc',
-        Body=signature)
+        Body=signature.encode('utf-8'),
+        Metadata={CONTENT_HASH_METADATA: content_hash})
+
+    logger.info(f'"{key}" was written')
+    return True
+
+
+def write_config_to_s3(config_data, key, gzipped=False, encodings=None):
+    """
+        Writes the JSON config file to S3, along with its compressed
+        siblings (key + '.gz', key + '.br'), and their signatures
+
+        Files whose content hasn't changed since they were last written
+        are skipped, without signing them again.
+
+        Args:
+        config_data: A dictionary containing all the data to be written
+        key: The target key on S3
+        gzipped: Write the gzipped file only, instead of the JSON file
+            and its siblings
+        encodings: Encodings of the compressed siblings ('gzip', 'br'),
+            defaults to S3_CONFIG_ENCODINGS
+    """
+    if settings.IS_DEVELOPMENT:
+        return
+
+    content = json.dumps(config_data).encode('utf-8')
+    content_hash = hashlib.sha256(content).hexdigest()
 
     if gzipped:
-        buffer.close()
+        files = [CONFIG_ENCODINGS['gzip']]
+    else:
+        if encodings is None:
+            encodings = settings.S3_CONFIG_ENCODINGS
+
+        files = [('', None)] + [CONFIG_ENCODINGS[encoding] for encoding in encodings]
+
+    for extension, compress in files:
+        publish_config_file(key + extension, content, content_hash, compress)
 
 
 def iterate_s3_objects(s3client, bucket, prefix):
@@ -23,6 +23,8 @@ from graphql.validation import NoSchemaIntrospectionCustomRule
 
 from django.conf import settings
 
+from paskoocheh.loaders import BatchLoaderExtension
+
 from accounts.schema import UserQuery, UserMutation
 
 from tools.schema import (
@@ -69,6 +71,7 @@ class Mutation(
 
 extensions = [
     DjangoOptimizerExtension,
+    BatchLoaderExtension,
 ]
 
 # Disable Introspection in production
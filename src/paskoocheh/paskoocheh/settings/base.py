@@ -680,6 +680,26 @@ WEBFRONTEND_CACHE_RESPONSE_TIMEOUT = (
     else 86400  # 24 hours
 )
 
+# When enabled, purged cached responses are marked stale instead of being
+# deleted. Stale responses keep being served while a single worker (holding a
+# lock for at most WEBFRONTEND_CACHE_RESPONSE_REVALIDATION_LOCK_TIMEOUT
+# seconds) re-renders them in the background. With
+# WEBFRONTEND_CACHE_RESPONSE_REWARM, purged responses are re-rendered right
+# away instead of on their next request.
+WEBFRONTEND_CACHE_RESPONSE_STALE_WHILE_REVALIDATE = (
+    os.environ.get('WEBFRONTEND_CACHE_RESPONSE_STALE_WHILE_REVALIDATE') == 'true'
+)
+WEBFRONTEND_CACHE_RESPONSE_REWARM = (
+    os.environ.get('WEBFRONTEND_CACHE_RESPONSE_REWARM') == 'true'
+)
+WEBFRONTEND_CACHE_RESPONSE_REVALIDATION_LOCK_TIMEOUT = int(
+    os.environ.get('WEBFRONTEND_CACHE_RESPONSE_REVALIDATION_LOCK_TIMEOUT', 60)
+)
+
+# How long each process trusts its in-memory copy of the stats cache before
+# checking whether the stats have been updated
+WEBFRONTEND_STATS_SNAPSHOT_TTL = int(os.environ.get('WEBFRONTEND_STATS_SNAPSHOT_TTL', 60))
+
 WEBFRONTEND_DEFAULT_IMAGE_PATH = f'/static/webfrontend/images/{PLATFORM}-logo.svg'
 
 WEBFRONTEND_CANONICAL_HOST = os.environ.get('WEBFRONTEND_CANONICAL_HOST')
@@ -699,6 +719,88 @@ S3_INTERNET_SHUTDOWN_DIR = 'internet-shutdown'
 # non installable file extension checklist for config file (configfile.py)
 NON_INSTALLABLE_FILE_EXTENSIONS = ['pdf', 'html']
 
+# Lifetime of the per-version fragments the config file (configfile.py) is
+# spliced from. The signals of tools.signals schedule the re-rendering of the
+# fragments a change affects (versions, version codes, images, FAQs, guides,
+# tutorials and the tool's own changes), the timeout only bounds how long
+# changes that don't send one (e.g. edits of Android device profiles or
+# queryset updates) can go unpublished.
+CONFIG_VERSION_FRAGMENT_TIMEOUT = (
+    int(os.environ['CONFIG_VERSION_FRAGMENT_TIMEOUT'])
+    if os.environ.get('CONFIG_VERSION_FRAGMENT_TIMEOUT')
+    else 86400  # 24 hours
+)
+
+# Config file regeneration requested by model signals (config_updates.py) is
+# delayed until no new request has arrived for CONFIG_UPDATE_QUIET_WINDOW
+# seconds, but no longer than CONFIG_UPDATE_MAX_DELAY seconds. Pending
+# regenerations are run by an in-process timer ('thread') or by the
+# run_pending_config_updates management command ('cron'). Timer updates still
+# pending when a process exits are run at exit. A quiet window of 0
+# regenerates synchronously.
+CONFIG_UPDATE_QUIET_WINDOW = int(os.environ.get('CONFIG_UPDATE_QUIET_WINDOW', 10))
+CONFIG_UPDATE_MAX_DELAY = int(os.environ.get('CONFIG_UPDATE_MAX_DELAY', 300))
+CONFIG_UPDATE_BACKEND = os.environ.get('CONFIG_UPDATE_BACKEND', 'thread')
+
+# Cached results of the GraphQL stats queries (stats/query_cache.py) are
+# invalidated whenever the stats tables are updated, the timeout is only a
+# safety net and expires the entries of invalidated generations.
+STATS_QUERY_CACHE_TIMEOUT = int(os.environ.get('STATS_QUERY_CACHE_TIMEOUT', 86400))
+# Seconds between additions of the in-process stats query cache hit and miss
+# counts to the shared counters
+STATS_QUERY_COUNTER_FLUSH_INTERVAL = int(os.environ.get('STATS_QUERY_COUNTER_FLUSH_INTERVAL', 60))
+
+# How long Connection total counts served by paskoocheh.utils.cached_count
+# are cached
+CONNECTION_COUNT_CACHE_TIMEOUT = int(os.environ.get('CONNECTION_COUNT_CACHE_TIMEOUT', 300))
+
+# api_engine (remote stats database) connections are kept open for
+# STATS_DB_CONN_MAX_AGE seconds and checked before being reused when they have
+# been idle for more than STATS_DB_HEALTH_CHECK_INTERVAL seconds. The stats
+# tasks stream the api_engine rows in chunks of STATS_QUERY_CHUNK_SIZE.
+STATS_DB_CONN_MAX_AGE = int(os.environ.get('STATS_DB_CONN_MAX_AGE', 600))
+STATS_DB_HEALTH_CHECK_INTERVAL = int(os.environ.get('STATS_DB_HEALTH_CHECK_INTERVAL', 30))
+STATS_QUERY_CHUNK_SIZE = int(os.environ.get('STATS_QUERY_CHUNK_SIZE', 10000))
+
+# With STATS_DOWNLOAD_BUFFER_ENABLED, downloads are appended to a Redis stream
+# (stats/download_buffer.py) and inserted into the stats database in batches
+# of STATS_DOWNLOAD_BUFFER_BATCH_SIZE by the flushdownloads management command,
+# which must then run on cron. Downloads are refused once
+# STATS_DOWNLOAD_BUFFER_MAX_LENGTH records are waiting to be flushed.
+STATS_DOWNLOAD_BUFFER_ENABLED = os.environ.get('STATS_DOWNLOAD_BUFFER_ENABLED') == 'true'
+STATS_DOWNLOAD_BUFFER_BATCH_SIZE = int(os.environ.get('STATS_DOWNLOAD_BUFFER_BATCH_SIZE', 500))
+STATS_DOWNLOAD_BUFFER_MAX_LENGTH = int(os.environ.get('STATS_DOWNLOAD_BUFFER_MAX_LENGTH', 100000))
+
+# Uploaded release files larger than S3_MULTIPART_THRESHOLD bytes are streamed
+# to S3 in S3_MULTIPART_CHUNKSIZE byte parts, S3_MULTIPART_MAX_CONCURRENCY at
+# a time, so at most chunk size * concurrency bytes are held in memory
+S3_MULTIPART_THRESHOLD = int(os.environ.get('S3_MULTIPART_THRESHOLD', 8 * 1024 * 1024))
+S3_MULTIPART_CHUNKSIZE = int(os.environ.get('S3_MULTIPART_CHUNKSIZE', 8 * 1024 * 1024))
+S3_MULTIPART_MAX_CONCURRENCY = int(os.environ.get('S3_MULTIPART_MAX_CONCURRENCY', 4))
+
+# Config files are also written gzip- and/or brotli-compressed next to the
+# JSON files, as <key>.gz and <key>.br, for the comma-separated encodings
+# (gzip, br) in S3_CONFIG_ENCODINGS
+S3_CONFIG_ENCODINGS = [
+    encoding
+    for encoding in os.environ.get('S3_CONFIG_ENCODINGS', '').split(',')
+    if encoding
+]
+
+# The Android updater updates up to UPDATER_MAX_WORKERS apps of a device at a
+# time, and makes at most UPDATER_REQUESTS_PER_SECOND Google Play API requests
+# per second across all of them
+UPDATER_MAX_WORKERS = int(os.environ.get('UPDATER_MAX_WORKERS', 4))
+UPDATER_REQUESTS_PER_SECOND = float(os.environ.get('UPDATER_REQUESTS_PER_SECOND', 2))
+
+# Downloaded APKs, splits and bundles are cached on disk in UPDATER_APK_CACHE_DIR,
+# the least recently used ones are evicted past UPDATER_APK_CACHE_MAX_BYTES
+UPDATER_APK_CACHE_DIR = os.environ.get('UPDATER_APK_CACHE_DIR', '/tmp/paskoocheh/apk_cache')
+UPDATER_APK_CACHE_MAX_BYTES = int(os.environ.get('UPDATER_APK_CACHE_MAX_BYTES', 5 * 1024 * 1024 * 1024))
+# Blobs used in the last UPDATER_APK_CACHE_MIN_AGE seconds aren't evicted, as
+# updates in progress may still open them
+UPDATER_APK_CACHE_MIN_AGE = int(os.environ.get('UPDATER_APK_CACHE_MIN_AGE', 3600))
+
 # Wagtail setting to use a custom image model
 WAGTAILIMAGES_IMAGE_MODEL = 'static_page.CaptionedImage'
 
@@ -132,6 +132,7 @@ if 'test' not in sys.argv:
         'PASSWORD': STATS_DB_PASSWORD,
         'HOST': STATS_DB_HOST,
         'PORT': '5432',
+        'CONN_MAX_AGE': STATS_DB_CONN_MAX_AGE,  # noqa
     }
 
 # if 'test' not in sys.argv:
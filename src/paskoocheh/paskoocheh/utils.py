@@ -16,11 +16,14 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import hashlib
 import inspect
+import json
 
 import strawberry
-from strawberry.relay.types import NodeIterableType
+from strawberry.relay.types import NodeIterableType, PageInfo
 from strawberry.relay.utils import from_base64, to_base64
+from strawberry.type import StrawberryContainer, get_object_definition
 from strawberry.types.info import Info
 from strawberry.utils.await_maybe import AwaitableOrValue
 
@@ -31,7 +34,16 @@ from strawberry_django.utils.typing import UserType
 
 from gqlauth.core.types_ import MutationNormalOutput
 
-from typing import Optional, ClassVar, Callable, Any, cast
+from paskoocheh.loaders import prime_batch_loaders
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import EmptyResultSet, FieldDoesNotExist
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q, QuerySet
+from django.db.models.constants import LOOKUP_SEP
+
+from typing import Optional, ClassVar, Callable, Any, List, Sized, Tuple, cast
 from typing_extensions import Self
 
 
@@ -41,10 +53,28 @@ class Connection(relay.ListConnectionWithTotalCount[strawberry.relay.NodeType]):
     A strawberry connection to count the number of query results
     """
 
+    count_nodes: strawberry.Private[Optional[Callable[[Any], Optional[int]]]] = None
+
     @strawberry.field
     def edge_count(root, info: Info) -> Optional[int]:
         return len(root.edges)
 
+    @strawberry.field(description="Total quantity of existing nodes.")
+    @django_resolver
+    def total_count(self) -> Optional[int]:
+        assert self.nodes is not None
+
+        if self.count_nodes is not None:
+            return self.count_nodes(self.nodes)
+
+        try:
+            return cast(QuerySet, self.nodes).count()
+        except (AttributeError, ValueError, TypeError):
+            if isinstance(self.nodes, Sized):
+                return len(self.nodes)
+
+        return None
+
     # Adding offset argument to custom connection
     @classmethod
     def resolve_connection(
@@ -57,8 +87,39 @@ class Connection(relay.ListConnectionWithTotalCount[strawberry.relay.NodeType]):
         first: Optional[int] = None,
         last: Optional[int] = None,
         offset: Optional[int] = None,
+        keyset: bool = False,
+        count: Optional[Callable[[Any], Optional[int]]] = None,
         **kwargs: Any,
     ) -> AwaitableOrValue[Self]:
+        """
+        Resolve a connection from a list or queryset of nodes.
+
+        Args:
+            keyset (bool): Paginate querysets by seeking past the ordering
+                key of the last row instead of using OFFSET. Falls back to
+                offset pagination when offset or an offset cursor is passed,
+                or when the queryset isn't ordered by plain fields
+            count (callable): Returns the total count of nodes (e.g.
+                cached_count), defaults to counting them
+        """
+
+        ordering = get_keyset_ordering(nodes) if keyset and not offset else None
+
+        if ordering is not None and is_keyset_cursor(after) and is_keyset_cursor(before):
+            conn = cls.resolve_keyset_connection(
+                nodes,
+                ordering,
+                info=info,
+                before=before,
+                after=after,
+                first=first,
+                last=last,
+                **kwargs,
+            )
+            conn.nodes = nodes
+            conn.count_nodes = count
+            prime_batch_loaders(edge.node for edge in conn.edges)
+            return conn
 
         # This implemntation is based on the graphene
         # implementation of first/offset pagination
@@ -83,14 +144,271 @@ class Connection(relay.ListConnectionWithTotalCount[strawberry.relay.NodeType]):
             async def wrapper():
                 resolved = await conn
                 resolved.nodes = nodes
+                resolved.count_nodes = count
+                prime_batch_loaders(edge.node for edge in resolved.edges)
                 return resolved
 
             return wrapper()
 
         conn = cast(Self, conn)
         conn.nodes = nodes
+        conn.count_nodes = count
+        prime_batch_loaders(edge.node for edge in conn.edges)
         return conn
 
+    @classmethod
+    def resolve_keyset_connection(
+        cls,
+        nodes: QuerySet,
+        ordering: List[Tuple[str, bool]],
+        *,
+        info: Info,
+        before: Optional[str] = None,
+        after: Optional[str] = None,
+        first: Optional[int] = None,
+        last: Optional[int] = None,
+        **kwargs: Any,
+    ) -> Self:
+        """
+        Resolve a connection by seeking past the ordering key of the cursors,
+        so that every page costs one indexed range scan however deep it is.
+
+        Args:
+            nodes (QuerySet): Ordered queryset of nodes
+            ordering (list): (field name, descending) tuples, ending with a
+                unique field (see get_keyset_ordering)
+
+        Returns:
+            Connection
+        """
+        max_results = info.schema.config.relay_max_results
+
+        for name, value in (('first', first), ('last', last)):
+            if isinstance(value, int):
+                if value < 0:
+                    raise ValueError(f"Argument '{name}' must be a non-negative integer.")
+                if value > max_results:
+                    raise ValueError(f"Argument '{name}' cannot be higher than {max_results}.")
+
+        queryset = nodes
+        if after:
+            queryset = queryset.filter(get_keyset_filter(ordering, decode_keyset_cursor(after), False))
+        if before:
+            queryset = queryset.filter(get_keyset_filter(ordering, decode_keyset_cursor(before), True))
+
+        if isinstance(last, int) and not isinstance(first, int):
+            # Seek backwards from the end (or before) and restore the order
+            reverse_ordering = [('-' if not descending else '') + name for name, descending in ordering]
+            rows = list(queryset.order_by(*reverse_ordering)[:last + 1])
+            has_previous_page = len(rows) > last
+            rows = list(reversed(rows[:last]))
+            has_next_page = bool(before)
+        else:
+            limit = first if isinstance(first, int) else max_results
+            rows = list(queryset.order_by(*[('-' if descending else '') + name for name, descending in ordering])[:limit + 1])
+            has_next_page = len(rows) > limit
+            rows = rows[:limit]
+            if isinstance(last, int):
+                rows = rows[-last:] if last else []
+            has_previous_page = bool(after)
+
+        edge_class = get_edge_class(cls)
+        edges = [
+            edge_class(
+                cursor=encode_keyset_cursor(ordering, row),
+                node=cls.resolve_node(row, info=info, **kwargs),
+            )
+            for row in rows
+        ]
+
+        return cls(
+            edges=edges,
+            page_info=PageInfo(
+                start_cursor=edges[0].cursor if edges else None,
+                end_cursor=edges[-1].cursor if edges else None,
+                has_previous_page=has_previous_page,
+                has_next_page=has_next_page,
+            ),
+        )
+
+
+def get_connection_node_limit(info, before=None, after=None, first=None, last=None, offset=None):
+    """
+    Return the number of leading nodes a list connection reads for a page,
+    so that loaders can fetch no more than those.
+
+    Args:
+        info (Info): Resolver info
+        before, after, first, last, offset: Connection arguments
+
+    Returns:
+        int: Number of nodes from the start of the list, including the one
+            fetched to tell whether there's a next page, or None if the
+            page is counted from the end of the list (last or before)
+    """
+    if before or isinstance(last, int):
+        return None
+
+    start = 0
+    if after:
+        start = int(from_base64(after)[1]) + 1
+    if offset:
+        start += offset
+
+    limit = first if isinstance(first, int) else info.schema.config.relay_max_results
+
+    return start + limit + 1
+
+
+# =========================
+# === Keyset pagination ===
+# =========================
+KEYSET_CURSOR_PREFIX = "keyset"
+
+
+def get_keyset_ordering(nodes):
+    """
+    Return the keyset ordering of a queryset.
+
+    Args:
+        nodes: Queryset (or any other iterable) of nodes
+
+    Returns:
+        list: (field name, descending) tuples ending with pk, or None if the
+            nodes can't be paginated by keyset (not a queryset, or ordered by
+            an expression, an annotation, a relation, a nullable field or
+            randomly)
+    """
+    if not isinstance(nodes, QuerySet):
+        return None
+
+    order_by = nodes.query.order_by
+    if not order_by and nodes.query.default_ordering:
+        order_by = nodes.model._meta.ordering
+
+    ordering = []
+    for field in order_by:
+        if not isinstance(field, str) or field == '?' or LOOKUP_SEP in field:
+            return None
+
+        descending = field.startswith('-')
+        name = field.lstrip('-')
+        if name == 'pk' or name == nodes.model._meta.pk.name:
+            name = 'pk'
+        else:
+            try:
+                model_field = nodes.model._meta.get_field(name)
+            except FieldDoesNotExist:
+                return None
+
+            if model_field.is_relation or model_field.null:
+                return None
+
+        ordering.append((name, descending))
+
+        if name == 'pk':
+            # The pk is unique, following fields never break ties
+            return ordering
+
+    ordering.append(('pk', False))
+
+    return ordering
+
+
+def is_keyset_cursor(cursor):
+    if not cursor:
+        return True
+
+    try:
+        return from_base64(cursor)[0] == KEYSET_CURSOR_PREFIX
+    except ValueError:
+        return False
+
+
+def encode_keyset_cursor(ordering, row):
+    return to_base64(
+        KEYSET_CURSOR_PREFIX,
+        json.dumps([getattr(row, name) for name, descending in ordering], cls=DjangoJSONEncoder),
+    )
+
+
+def decode_keyset_cursor(cursor):
+    try:
+        return json.loads(from_base64(cursor)[1])
+    except ValueError as e:
+        raise TypeError("Argument contains an invalid cursor.") from e
+
+
+def get_keyset_filter(ordering, values, before):
+    """
+    Build the filter matching the rows after (or before) a keyset cursor.
+
+    (a, b, pk) > (x, y, z) is expanded to
+    a > x OR (a = x AND b > y) OR (a = x AND b = y AND pk > z),
+    with the comparison flipped for descending fields.
+
+    Args:
+        ordering (list): (field name, descending) tuples
+        values (list): Ordering key of the cursor
+        before (bool): Match the rows before the cursor instead
+
+    Returns:
+        Q
+    """
+    if len(values) != len(ordering):
+        raise TypeError("Argument contains a cursor of another ordering.")
+
+    condition = Q()
+    equal = Q()
+    for (name, descending), value in zip(ordering, values):
+        lookup = 'lt' if descending != before else 'gt'
+        condition |= equal & Q(**{f'{name}__{lookup}': value})
+        equal &= Q(**{name: value})
+
+    return condition
+
+
+def get_edge_class(connection_class):
+    type_def = get_object_definition(connection_class)
+    field = type_def.get_field("edges").resolve_type(type_definition=type_def)
+    while isinstance(field, StrawberryContainer):
+        field = field.of_type
+
+    return field
+
+
+def cached_count(nodes, timeout=None):
+    """
+    Return the count of a queryset, cached by SQL query.
+
+    Meant to be passed as Connection.resolve_connection count argument, for
+    lists whose exact total count isn't worth a COUNT(*) on every page.
+
+    Args:
+        nodes (QuerySet): Queryset to count
+        timeout (int): Cache timeout, defaults to CONNECTION_COUNT_CACHE_TIMEOUT
+
+    Returns:
+        int
+    """
+    if not isinstance(nodes, QuerySet):
+        return len(nodes)
+
+    try:
+        sql, params = nodes.query.sql_with_params()
+    except EmptyResultSet:
+        return 0
+
+    cache_key = u'cache_type=connection_count&query={query_hash}&'.format(
+        query_hash=hashlib.sha256(f'{sql}{params}'.encode()).hexdigest(),
+    )
+
+    return cache.get_or_set(
+        cache_key,
+        nodes.count,
+        settings.CONNECTION_COUNT_CACHE_TIMEOUT if timeout is None else timeout,
+    )
+
 
 class IsAuthenticatedMutation(DjangoPermissionExtension):
     """
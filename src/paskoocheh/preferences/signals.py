@@ -17,8 +17,8 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 
+from paskoocheh.config_updates import schedule_config_update
 from paskoocheh.helpers import disable_for_loaddata
-from paskoocheh.tasks import enable_latest_cloudfront_state_invalidate_flag
 from django.conf import settings
 
 
@@ -26,7 +26,4 @@ from django.conf import settings
 def texts_changed(sender, instance, **kwargs):
 
     if settings.BUILD_ENV != 'local':
-        from preferences.tasks import update_json_texts
-
-        update_json_texts()
-        enable_latest_cloudfront_state_invalidate_flag()
+        schedule_config_update('texts')
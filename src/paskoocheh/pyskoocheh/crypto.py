@@ -23,10 +23,22 @@
 import pgpy
 import hashlib
 import base64
+import threading
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.asymmetric.utils import Prehashed
+from pgpy.constants import HashAlgorithm, KeyFlags, PubKeyAlgorithm, SignatureType
+from pgpy.decorators import KeyAction
+from pgpy.packet.packets import PrivKeyV4
+
+# Number of bytes read from a file at once
+CHUNK_SIZE = 1024 * 1024
 
 
 class SignatureManager:
     """ decrypt the signing private key and sign the files on demand
+
+    A SignatureManager can be shared across threads: the key is only
+    unlocked by one of them at a time.
     """
     def __init__(self, signing_key, signing_key_password):
         """ decrypt and store the signing private key for later use.
@@ -38,22 +50,23 @@ class SignatureManager:
         # load the key from environment
         self.signing_key, _ = pgpy.PGPKey.from_blob(base64.b64decode(signing_key))
         self.signing_key_password = signing_key_password
+        # Unlocking the key decrypts it in place, and locking it again
+        # clears it, so it must not be unlocked concurrently
+        self.lock = threading.Lock()
 
-    def calc_signature(self, file_to_be_signed):
+    def calc_signature(self, file_to_be_signed, chunk_size=CHUNK_SIZE):
         """
         Computes the pgp armored signature of the content of the file and return
         it as a string
 
         Args:
             file_to_be_signed:  FileField object which contain the submission to be signed
+            chunk_size: number of bytes read from the file at once
 
         Returns:
             Armored pgp signature of the file content
         """
-        with self.signing_key.unlock(self.signing_key_password):
-            file_to_be_signed.seek(0)
-            message_to_be_signed = pgpy.PGPMessage.new(file_to_be_signed.read())
-            return str(self.signing_key.sign(message_to_be_signed))
+        return self.sign_digest(hash_file(file_to_be_signed, chunk_size))
 
     def sign_string(self, string_to_be_signed):
         """
@@ -65,20 +78,112 @@ class SignatureManager:
         Return:
             Armored pgp signature of the file content of string_to_be_signed
         """
-        with self.signing_key.unlock(self.signing_key_password):
+        with self.lock, self.signing_key.unlock(self.signing_key_password):
             return str(self.signing_key.sign(string_to_be_signed))
 
-    def calc_compute_checksum(self, file_to_be_summed):
+    def calc_compute_checksum(self, file_to_be_summed, chunk_size=CHUNK_SIZE):
         """
         Computes the sha256 hash of the file content and returns it as a hex
         string
 
         Args:
             file_to_be_summed:  FileField object which contain the submission whose checksum is seeked
+            chunk_size: number of bytes read from the file at once
 
         Return:
             the sha256 hash value of the binary content of the file in hexadecimal representation.
 
         """
-        file_to_be_summed.seek(0)
-        return hashlib.sha256(file_to_be_summed.read()).hexdigest()
+        return hash_file(file_to_be_summed, chunk_size).hexdigest()
+
+    def calc_signature_and_checksum(self, file_to_be_signed, chunk_size=CHUNK_SIZE):
+        """
+        Computes the pgp armored signature and the sha256 hash of the content
+        of the file in a single pass over the file, holding one chunk of the
+        file in memory at a time
+
+        Args:
+            file_to_be_signed:  FileField object which contain the submission to be signed
+            chunk_size: number of bytes read from the file at once
+
+        Return:
+            A tuple: (armored pgp signature of the file content, sha256 hash
+            value of the file content in hexadecimal representation)
+        """
+        digest = hash_file(file_to_be_signed, chunk_size)
+
+        return self.sign_digest(digest), digest.hexdigest()
+
+    def sign_digest(self, digest):
+        """
+        Computes the detached pgp armored signature of content whose sha256
+        hash has already been computed, e.g. while it was being written or
+        downloaded
+
+        The signature is made over the hash of the content followed by the
+        signature's own trailer, so the hash object itself (not its final
+        digest) is needed. It isn't modified.
+
+        It relies on pgpy internals, so PGPy is pinned to the version it's
+        tested with (see pyskoocheh/tests.py)
+
+        Args:
+            digest: hashlib sha256 object fed with the whole content
+
+        Return:
+            Armored pgp signature of the content
+        """
+        with self.lock, self.signing_key.unlock(self.signing_key_password):
+            # Signs with the signing subkey if the primary key can't sign,
+            # like PGPKey.sign
+            with KeyAction(KeyFlags.Sign).usage(self.signing_key, None) as key:
+                signature = pgpy.PGPSignature.new(
+                    SignatureType.BinaryDocument,
+                    key.key_algorithm,
+                    HashAlgorithm.SHA256,
+                    key.fingerprint.keyid)
+
+                if isinstance(key._key, PrivKeyV4):
+                    signature._signature.subpackets.addnew(
+                        'IssuerFingerprint', hashed=True, _version=4, _issuer_fpr=key.fingerprint)
+
+                # For binary documents, the signed data is the content
+                # followed by the trailer, so hashing no content yields
+                # the trailer alone
+                signed_digest = digest.copy()
+                signed_digest.update(signature.hashdata(b''))
+                signed_digest = signed_digest.digest()
+
+                signature._signature.hash2 = bytearray(signed_digest[:2])
+
+                if key.key_algorithm == PubKeyAlgorithm.EdDSA:
+                    # EdDSA signs the hash itself (see pgpy's EdDSAPriv.sign)
+                    signed = key._key.keymaterial.__privkey__().sign(signed_digest)
+                else:
+                    signed = key._key.sign(signed_digest, Prehashed(hashes.SHA256()))
+
+                signature._signature.signature.from_signer(signed)
+                signature._signature.update_hlen()
+
+                return str(signature)
+
+
+def hash_file(file_to_be_hashed, chunk_size=CHUNK_SIZE):
+    """
+    Computes the sha256 hash of the content of a file, reading it in chunks
+
+    Args:
+        file_to_be_hashed: file object (or FileField) to be hashed
+        chunk_size: number of bytes read from the file at once
+
+    Return:
+        The hashlib sha256 object, to be signed with SignatureManager.sign_digest
+        or turned into a checksum with hexdigest()
+    """
+    digest = hashlib.sha256()
+
+    file_to_be_hashed.seek(0)
+    for chunk in iter(lambda: file_to_be_hashed.read(chunk_size), b''):
+        digest.update(chunk)
+
+    return digest
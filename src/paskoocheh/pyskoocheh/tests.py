@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+# Paskoocheh - A tool marketplace for Iranian
+#
+# Copyright (C) 2024 ASL19 Organization
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import base64
+import hashlib
+import io
+import os
+
+import pgpy
+from django.test import SimpleTestCase
+from pgpy.constants import (
+    CompressionAlgorithm,
+    EllipticCurveOID,
+    HashAlgorithm,
+    KeyFlags,
+    PubKeyAlgorithm,
+    SymmetricKeyAlgorithm,
+)
+
+from pyskoocheh.crypto import SignatureManager
+
+PASSWORD = 'password'
+
+
+class SignatureManagerTestCase(SimpleTestCase):
+    """
+    Testing the signatures of files signed from their streamed hash, which
+    rely on pgpy internals (see SignatureManager.sign_digest)
+    """
+
+    def create_key(self, algorithm, size, subkey=None):
+        """
+        Return a new passphrase-protected key that signs with its primary
+        key, or with its subkey if one is given
+        """
+        key = pgpy.PGPKey.new(algorithm, size)
+        key.add_uid(
+            pgpy.PGPUID.new('Paskoocheh'),
+            usage={KeyFlags.Certify} if subkey else {KeyFlags.Certify, KeyFlags.Sign},
+            hashes=[HashAlgorithm.SHA256],
+            ciphers=[SymmetricKeyAlgorithm.AES256],
+            compression=[CompressionAlgorithm.Uncompressed])
+
+        if subkey:
+            key.add_subkey(subkey, usage={KeyFlags.Sign})
+
+        key.protect(PASSWORD, SymmetricKeyAlgorithm.AES256, HashAlgorithm.SHA256)
+
+        return key
+
+    def assertSignsFile(self, key):
+        content = os.urandom(3 * 1024 + 5)
+        signature_manager = SignatureManager(base64.b64encode(bytes(key)), PASSWORD)
+
+        # Chunks smaller than the file, which doesn't end on a chunk boundary
+        signature, checksum = signature_manager.calc_signature_and_checksum(
+            io.BytesIO(content), chunk_size=1024)
+
+        self.assertEqual(checksum, hashlib.sha256(content).hexdigest())
+
+        signature = pgpy.PGPSignature.from_blob(signature)
+        self.assertTrue(key.pubkey.verify(content, signature))
+        self.assertFalse(key.pubkey.verify(content + b'\0', signature))
+
+    def test_sign_rsa(self):
+        self.assertSignsFile(self.create_key(PubKeyAlgorithm.RSAEncryptOrSign, 2048))
+
+    def test_sign_ecdsa(self):
+        self.assertSignsFile(self.create_key(PubKeyAlgorithm.ECDSA, EllipticCurveOID.NIST_P256))
+
+    def test_sign_eddsa(self):
+        self.assertSignsFile(self.create_key(PubKeyAlgorithm.EdDSA, EllipticCurveOID.Ed25519))
+
+    def test_sign_with_subkey(self):
+        self.assertSignsFile(self.create_key(
+            PubKeyAlgorithm.RSAEncryptOrSign,
+            2048,
+            subkey=pgpy.PGPKey.new(PubKeyAlgorithm.RSAEncryptOrSign, 2048)))
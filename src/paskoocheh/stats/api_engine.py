@@ -18,6 +18,9 @@
 
 
 import logging
+import time
+from collections import namedtuple
+from django.conf import settings
 from django.db import (
     connections,
     transaction,
@@ -59,25 +62,78 @@ def create_platform_map():
     return platform_map
 
 
-def get_cursor():
+def get_cursor(chunked=False):
     """
         Return a cursor from api_engine cursor
 
+        The api_engine connection is persistent (see STATS_DB_CONN_MAX_AGE).
+        Connections that errored or outlived their maximum age are dropped,
+        and an idle connection is checked before it's reused, so a
+        connection the remote database has closed is replaced instead of
+        failing the query. Connections in a transaction are left as is.
+
+        Args:
+        chunked: Return a server-side cursor, which fetches the rows in
+            chunks instead of all at once (see iter_chunks)
         Returns:
         A cursor from api_engine
     """
 
+    connection = connections['api_engine']
+    now = time.monotonic()
+
     try:
-        cursor = connections['api_engine'].cursor()
+        # Inside a transaction (e.g. add_downloads) autocommit is off and
+        # the connection must be kept until the transaction ends
+        if not connection.in_atomic_block:
+            connection.close_if_unusable_or_obsolete()
+
+            last_used = getattr(connection, 'stats_last_used', None)
+            if (
+                connection.connection is not None and
+                last_used is not None and
+                now - last_used > settings.STATS_DB_HEALTH_CHECK_INTERVAL and
+                not connection.is_usable()
+            ):
+                logger.warning('Replacing unusable Remote Database connection')
+                connection.close()
+
+        cursor = connection.chunked_cursor() if chunked else connection.cursor()
     except Exception as exc:
         logger.error('Error connecting to Remote Database ({})'.format(str(exc)))
         raise RemoteConnectionException
 
+    connection.stats_last_used = now
+
     return cursor
 
 
+def iter_chunks(cursor, chunk_size):
+    """
+        Iterate over the rows of a cursor in chunks
+
+        Args:
+        cursor: Executed cursor
+        chunk_size: Number of rows per chunk
+        Returns:
+        A generator of lists of namedtuples
+    """
+
+    nt_result = namedtuple('Result', [col[0] for col in cursor.description])
+
+    try:
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+
+            yield [nt_result(*row) for row in rows]
+    finally:
+        cursor.close()
+
+
 @transaction.atomic
-def query_table(main_query, maxid_query, prev_id):
+def query_table(main_query, maxid_query, prev_id, chunk_size=None):
     """
         Query the table and return the results for highest
         ID and the main query
@@ -89,8 +145,11 @@ def query_table(main_query, maxid_query, prev_id):
         main_query: Main query to get the data out of the target table
         maxid_query: Query to get the maximum id of the target table
         prev_id: The last ID in remote database that was queried.
+        chunk_size: If set, stream the result of the main query from a
+            server-side cursor in chunks of chunk_size rows
         Returns:
-        A tuple: (Highest ID queried, result of the query)
+        A tuple: (Highest ID queried, result of the query), the result
+        being a generator of chunks (lists) if chunk_size is set
     """
 
     cursor = get_cursor()
@@ -99,37 +158,67 @@ def query_table(main_query, maxid_query, prev_id):
 
     cursor.execute(maxid_query)
     highest_id = cursor.fetchone()[0]
-    cursor.execute(main_query, [prev_id, highest_id])
 
-    return highest_id, namedtuplefetchall(cursor)
+    if chunk_size is None:
+        cursor.execute(main_query, [prev_id, highest_id])
+
+        return highest_id, namedtuplefetchall(cursor)
+
+    chunked_cursor = get_cursor(chunked=True)
+    chunked_cursor.execute(main_query, [prev_id, highest_id])
+
+    return highest_id, iter_chunks(chunked_cursor, chunk_size)
 
 
-def query_download(prev_id):
+DOWNLOAD_ROLLUP_QUERY = "SELECT " \
+                        "    DATE(timestamp) date, tool, platform, tool_id, channel, COUNT(*) count " \
+                        "FROM " \
+                        "    download " \
+                        "WHERE " \
+                        "    id > %s AND id <= %s " \
+                        "GROUP BY " \
+                        "    date, tool, tool_id, platform, channel"
+
+
+def query_download(prev_id, chunk_size=None):
     """
         Atomically get the highest record for the download table
-        and query the number of download per tool-platform.
+        and query the number of download per day-tool-platform-channel.
 
         Args:
         prev_id: The last ID in remote database that was queried.
+        chunk_size: Stream the result in chunks (see query_table)
         Returns:
         A tuple: (Highest ID queried, result of the query)
     """
 
-    main_query = "SELECT " \
-                 "    tool, platform, tool_id, COUNT(*) count " \
-                 "FROM " \
-                 "    download " \
-                 "WHERE " \
-                 "    id > %s AND id <= %s " \
-                 "GROUP BY " \
-                 "    tool, tool_id, platform"
-
     id_query = "SELECT MAX(id) from download"
 
-    return query_table(main_query, id_query, prev_id)
+    return query_table(DOWNLOAD_ROLLUP_QUERY, id_query, prev_id, chunk_size)
 
 
-def query_rating(prev_id):
+def query_download_range(prev_id, last_id):
+    """
+        Query the number of download per day-tool-platform-channel
+        of a range of IDs of the download table.
+
+        Args:
+        prev_id: The range start (exclusive)
+        last_id: The range end (inclusive)
+        Returns:
+        Result of the query
+    """
+
+    cursor = get_cursor()
+    if cursor is None:
+        return None
+
+    cursor.execute(DOWNLOAD_ROLLUP_QUERY, [prev_id, last_id])
+
+    return namedtuplefetchall(cursor)
+
+
+def query_rating(prev_id, chunk_size=None):
     """
         Atomically get the highest record for the rating table
         and query the aggregate for AVG rating and number of
@@ -137,6 +226,7 @@ def query_rating(prev_id):
 
         Args:
         prev_id: The last ID in remote database that was queried.
+        chunk_size: Stream the result in chunks (see query_table)
         Returns:
         A tuple: (Highest ID queried, result of the query)
     """
@@ -150,16 +240,17 @@ def query_rating(prev_id):
 
     id_query = "SELECT MAX(id) from rating"
 
-    return query_table(main_query, id_query, prev_id)
+    return query_table(main_query, id_query, prev_id, chunk_size)
 
 
-def query_review(prev_id):
+def query_review(prev_id, chunk_size=None):
     """
         Atomically get the highest record for the rating table
         and query fot the reviews added
 
         Args:
         prev_id: The last ID in remote database that was queried.
+        chunk_size: Stream the result in chunks (see query_table)
         Returns:
         A tuple: (Highest ID queried, result of the query)
     """
@@ -173,16 +264,17 @@ def query_review(prev_id):
 
     id_query = "SELECT MAX(id) from rating"
 
-    return query_table(main_query, id_query, prev_id)
+    return query_table(main_query, id_query, prev_id, chunk_size)
 
 
-def query_feedback(prev_id):
+def query_feedback(prev_id, chunk_size=None):
     """
         Atomically get the highest record for the feedback table
         and query fot the feedbacks added
 
         Args:
         prev_id: The last ID in remote database that was queried.
+        chunk_size: Stream the result in chunks (see query_table)
         Returns:
         A tuple: (Highest ID queried, result of the query)
     """
@@ -196,57 +288,88 @@ def query_feedback(prev_id):
 
     id_query = "SELECT MAX(id) from feedback"
 
-    return query_table(main_query, id_query, prev_id)
+    return query_table(main_query, id_query, prev_id, chunk_size)
+
+
+DOWNLOAD_FIELDS = [
+    'user_uuid',
+    'timestamp',
+    'tool',
+    'tool_id',
+    'channel',
+    'platform',
+    'tool_version',
+    'platform_version',
+    'download_time',
+    'downloaded_via',
+    'country',
+    'city',
+    'network_type',
+    'file_size',
+    'network_name',
+    'channel_version',
+    'network_country',
+    'timezone',
+]
+
+ADD_DOWNLOAD_QUERY = "INSERT INTO " \
+                     "    download " \
+                     "        (user_uuid, " \
+                     "         timestamp, " \
+                     "         tool, " \
+                     "         tool_id, " \
+                     "         channel, " \
+                     "         platform, " \
+                     "         tool_version, " \
+                     "         platform_version, " \
+                     "         download_time, " \
+                     "         downloaded_via, " \
+                     "         country, " \
+                     "         city, " \
+                     "         network_type, " \
+                     "         file_size, " \
+                     "         network_name, " \
+                     "         channel_version, " \
+                     "         network_country, " \
+                     "         timezone) " \
+                     "VALUES " \
+                     "         (%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s) "
 
 
 def add_download(dl_dict):
 
-    query = "INSERT INTO " \
-            "    download " \
-            "        (user_uuid, " \
-            "         timestamp, " \
-            "         tool, " \
-            "         tool_id, " \
-            "         channel, " \
-            "         platform, " \
-            "         tool_version, " \
-            "         platform_version, " \
-            "         download_time, " \
-            "         downloaded_via, " \
-            "         country, " \
-            "         city, " \
-            "         network_type, " \
-            "         file_size, " \
-            "         network_name, " \
-            "         channel_version, " \
-            "         network_country, " \
-            "         timezone) " \
-            "VALUES " \
-            "         (%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s) "
+    cursor = get_cursor()
+    if cursor is None:
+        raise RemoteConnectionException
+
+    cursor.execute(ADD_DOWNLOAD_QUERY, [dl_dict[field] for field in DOWNLOAD_FIELDS])
+
+    return True
+
+
+@transaction.atomic(using='api_engine')
+def add_downloads(dl_dicts, batch_size=500):
+    """
+        Insert download records in a single transaction, with one
+        multi-row INSERT per batch
+
+        Args:
+        dl_dicts: List of download records (see add_download)
+        batch_size: Number of records per INSERT
+    """
 
     cursor = get_cursor()
     if cursor is None:
         raise RemoteConnectionException
 
-    cursor.execute(query, [
-        dl_dict['user_uuid'],
-        dl_dict['timestamp'],
-        dl_dict['tool'],
-        dl_dict['tool_id'],
-        dl_dict['channel'],
-        dl_dict['platform'],
-        dl_dict['tool_version'],
-        dl_dict['platform_version'],
-        dl_dict['download_time'],
-        dl_dict['downloaded_via'],
-        dl_dict['country'],
-        dl_dict['city'],
-        dl_dict['network_type'],
-        dl_dict['file_size'],
-        dl_dict['network_name'],
-        dl_dict['channel_version'],
-        dl_dict['network_country'],
-        dl_dict['timezone']])
+    values = "(" + ",".join(["%s"] * len(DOWNLOAD_FIELDS)) + ")"
+
+    for start in range(0, len(dl_dicts), batch_size):
+        batch = dl_dicts[start:start + batch_size]
+
+        cursor.execute(
+            ADD_DOWNLOAD_QUERY.replace(values, ",".join([values] * len(batch))),
+            [dl_dict[field] for dl_dict in batch for field in DOWNLOAD_FIELDS])
 
     return True
 
@@ -329,33 +452,55 @@ def add_feedback(fb_dict):
         fb_dict['timezone']])
 
 
-def get_tools_total_download(start, end):
+def get_download_period_filter(start, end, after_id=None):
+    """
+        Build the WHERE clause of the download table queries
+
+        Args:
+        start: Start date (inclusive), if None start from beginning
+        end: End date (exclusive), if None get the latest
+        after_id: Only match the downloads with a higher ID, if None match all
+        Returns:
+        A tuple: (WHERE clause, query parameters)
+    """
+
+    conditions = []
+    params = []
+
+    if start is not None:
+        conditions.append("timestamp >= %s")
+        params.append(start)
+    if end is not None:
+        conditions.append("timestamp < %s")
+        params.append(end)
+    if after_id is not None:
+        conditions.append("id > %s")
+        params.append(after_id)
+
+    if not conditions:
+        return "", params
+
+    return " WHERE " + " AND ".join(conditions) + " ", params
+
+
+def get_tools_total_download(start, end, after_id=None):
     """
         Retrieve the total download for all tools in a period
 
         Args:
         start: Start date (inclusive), if None start from beginning
         end: End date (exclusive), if None get the latest
+        after_id: Only count the downloads with a higher ID, if None count all
         Returns:
         A list of tuples: (tool, tool_id, total download)
     """
 
-    params = []
+    where, params = get_download_period_filter(start, end, after_id)
 
     query = "SELECT " \
             "    tool_id, tool, COUNT(*) count " \
             "FROM " \
-            "    download "
-    if start is not None:
-        query += " WHERE timestamp >= %s "
-        params.append(start)
-        if end is not None:
-            query += "AND timestamp < %s "
-            params.append(end)
-    else:
-        if end is not None:
-            query += " WHERE timestamp < %s "
-            params.append(end)
+            "    download " + where
 
     query += "GROUP BY tool, tool_id"
 
@@ -368,33 +513,24 @@ def get_tools_total_download(start, end):
     return dictfetchall(cursor)
 
 
-def get_daily_total_download(start, end):
+def get_daily_total_download(start, end, after_id=None):
     """
         Retrieve the daily total download for all tools in a period
 
         Args:
         start: Start date (inclusive), if None start from beginning
         end: End date (exclusive), if None get the latest
+        after_id: Only count the downloads with a higher ID, if None count all
         Returns:
         A list of tuples: (date, total download)
     """
 
-    params = []
+    where, params = get_download_period_filter(start, end, after_id)
 
     query = "SELECT " \
             "    DATE(timestamp) date, COUNT(*) count " \
             "FROM " \
-            "    download "
-    if start is not None:
-        query += " WHERE timestamp >= %s "
-        params.append(start)
-        if end is not None:
-            query += "AND timestamp < %s "
-            params.append(end)
-    else:
-        if end is not None:
-            query += " WHERE timestamp < %s "
-            params.append(end)
+            "    download " + where
 
     query += "GROUP BY date "
     query += "ORDER BY date"
@@ -408,7 +544,7 @@ def get_daily_total_download(start, end):
     return dictfetchall(cursor)
 
 
-def get_daily_total_download_per_channel(start, end):
+def get_daily_total_download_per_channel(start, end, after_id=None):
     """
         Retrieve the daily total download for all tools in a period
         for all channels
@@ -416,26 +552,17 @@ def get_daily_total_download_per_channel(start, end):
         Args:
         start: Start date (inclusive), if None start from beginning
         end: End date (exclusive), if None get the latest
+        after_id: Only count the downloads with a higher ID, if None count all
         Returns:
         A list of tuples: (date, channel, total download)
     """
 
-    params = []
+    where, params = get_download_period_filter(start, end, after_id)
 
     query = "SELECT " \
             "    DATE(timestamp) date, channel, COUNT(*) count " \
             "FROM " \
-            "    download "
-    if start is not None:
-        query += " WHERE timestamp >= %s "
-        params.append(start)
-        if end is not None:
-            query += "AND timestamp < %s "
-            params.append(end)
-    else:
-        if end is not None:
-            query += " WHERE timestamp < %s "
-            params.append(end)
+            "    download " + where
 
     query += "GROUP BY date, channel "
     query += "ORDER BY date "
@@ -449,7 +576,7 @@ def get_daily_total_download_per_channel(start, end):
     return dictfetchall(cursor)
 
 
-def get_daily_total_download_per_tool(start, end):
+def get_daily_total_download_per_tool(start, end, after_id=None):
     """
         Retrieve the daily total download for all tools in a period
         for all tools
@@ -457,26 +584,17 @@ def get_daily_total_download_per_tool(start, end):
         Args:
         start: Start date (inclusive), if None start from beginning
         end: End date (exclusive), if None get the latest
+        after_id: Only count the downloads with a higher ID, if None count all
         Returns:
         A list of tuples: (date, tool, tool_id, total download)
     """
 
-    params = []
+    where, params = get_download_period_filter(start, end, after_id)
 
     query = "SELECT " \
             "    DATE(timestamp) date, tool, tool_id, COUNT(*) count " \
             "FROM " \
-            "    download "
-    if start is not None:
-        query += " WHERE timestamp >= %s "
-        params.append(start)
-        if end is not None:
-            query += "AND timestamp < %s "
-            params.append(end)
-    else:
-        if end is not None:
-            query += " WHERE timestamp < %s "
-            params.append(end)
+            "    download " + where
 
     query += "GROUP BY date, tool, tool_id "
     query += "ORDER BY date"
@@ -490,7 +608,7 @@ def get_daily_total_download_per_tool(start, end):
     return dictfetchall(cursor)
 
 
-def get_daily_total_download_per_platform(start, end):
+def get_daily_total_download_per_platform(start, end, after_id=None):
     """
         Retrieve the daily total download for all tools in a period
         for all platforms
@@ -498,26 +616,17 @@ def get_daily_total_download_per_platform(start, end):
         Args:
         start: Start date (inclusive), if None start from beginning
         end: End date (exclusive), if None get the latest
+        after_id: Only count the downloads with a higher ID, if None count all
         Returns:
         A list of tuples: (date, platform, total download)
     """
 
-    params = []
+    where, params = get_download_period_filter(start, end, after_id)
 
     query = "SELECT " \
             "    DATE(timestamp) date, platform, COUNT(*) count " \
             "FROM " \
-            "    download "
-    if start is not None:
-        query += " WHERE timestamp >= %s "
-        params.append(start)
-        if end is not None:
-            query += "AND timestamp < %s "
-            params.append(end)
-    else:
-        if end is not None:
-            query += " WHERE timestamp < %s "
-            params.append(end)
+            "    download " + where
 
     query += "GROUP BY date, platform "
     query += "ORDER BY date"
@@ -531,33 +640,24 @@ def get_daily_total_download_per_platform(start, end):
     return dictfetchall(cursor)
 
 
-def get_monthly_total_download(start, end):
+def get_monthly_total_download(start, end, after_id=None):
     """
         Retrieve the monthly total download for all tools in a period
 
         Args:
         start: Start date (inclusive), if None start from beginning
         end: End date (exclusive), if None get the latest
+        after_id: Only count the downloads with a higher ID, if None count all
         Returns:
         A list of tuples: (year, month, total download)
     """
 
-    params = []
+    where, params = get_download_period_filter(start, end, after_id)
 
     query = "SELECT " \
             "    MONTH(timestamp) month, YEAR(timestamp) year, COUNT(*) count " \
             "FROM " \
-            "    download "
-    if start is not None:
-        query += " WHERE timestamp >= %s "
-        params.append(start)
-        if end is not None:
-            query += "AND timestamp < %s "
-            params.append(end)
-    else:
-        if end is not None:
-            query += " WHERE timestamp < %s "
-            params.append(end)
+            "    download " + where
 
     query += "GROUP BY year, month "
     query += "ORDER BY year, month"
@@ -571,7 +671,7 @@ def get_monthly_total_download(start, end):
     return dictfetchall(cursor)
 
 
-def get_monthly_total_download_per_channel(start, end):
+def get_monthly_total_download_per_channel(start, end, after_id=None):
     """
         Retrieve the monthly total download for all tools in a period
         for all channels
@@ -579,26 +679,17 @@ def get_monthly_total_download_per_channel(start, end):
         Args:
         start: Start date (inclusive), if None start from beginning
         end: End date (exclusive), if None get the latest
+        after_id: Only count the downloads with a higher ID, if None count all
         Returns:
         A list of tuples: (year, month, channel, total download)
     """
 
-    params = []
+    where, params = get_download_period_filter(start, end, after_id)
 
     query = "SELECT " \
             "    MONTH(timestamp) month, YEAR(timestamp) year, channel, COUNT(*) count " \
             "FROM " \
-            "    download "
-    if start is not None:
-        query += " WHERE timestamp >= %s "
-        params.append(start)
-        if end is not None:
-            query += "AND timestamp < %s "
-            params.append(end)
-    else:
-        if end is not None:
-            query += " WHERE timestamp < %s "
-            params.append(end)
+            "    download " + where
 
     query += "GROUP BY year, month, channel "
     query += "ORDER BY year, month"
@@ -612,7 +703,7 @@ def get_monthly_total_download_per_channel(start, end):
     return dictfetchall(cursor)
 
 
-def get_monthly_total_download_per_tool(start, end):
+def get_monthly_total_download_per_tool(start, end, after_id=None):
     """
         Retrieve the monthly total download for all tools in a period
         for all tools
@@ -620,26 +711,17 @@ def get_monthly_total_download_per_tool(start, end):
         Args:
         start: Start date (inclusive), if None start from beginning
         end: End date (exclusive), if None get the latest
+        after_id: Only count the downloads with a higher ID, if None count all
         Returns:
         A list of tuples: (yaer, month, tool, tool_id, total download)
     """
 
-    params = []
+    where, params = get_download_period_filter(start, end, after_id)
 
     query = "SELECT " \
             "    MONTH(timestamp) month, YEAR(timestamp) year, tool, tool_id, COUNT(*) count " \
             "FROM " \
-            "    download "
-    if start is not None:
-        query += " WHERE timestamp >= %s "
-        params.append(start)
-        if end is not None:
-            query += "AND timestamp < %s "
-            params.append(end)
-    else:
-        if end is not None:
-            query += " WHERE timestamp < %s "
-            params.append(end)
+            "    download " + where
 
     query += "GROUP BY year, month, tool, tool_id "
     query += "ORDER BY year, month"
@@ -653,7 +735,7 @@ def get_monthly_total_download_per_tool(start, end):
     return dictfetchall(cursor)
 
 
-def get_monthly_total_download_per_platform(start, end):
+def get_monthly_total_download_per_platform(start, end, after_id=None):
     """
         Retrieve the monthly total download for all tools in a period
         for all platforms
@@ -661,26 +743,17 @@ def get_monthly_total_download_per_platform(start, end):
         Args:
         start: Start date (inclusive), if None start from beginning
         end: End date (exclusive), if None get the latest
+        after_id: Only count the downloads with a higher ID, if None count all
         Returns:
         A list of tuples: (yaer, month, platform, total download)
     """
 
-    params = []
+    where, params = get_download_period_filter(start, end, after_id)
 
     query = "SELECT " \
             "    MONTH(timestamp) month, YEAR(timestamp) year, platform, COUNT(*) count " \
             "FROM " \
-            "    download "
-    if start is not None:
-        query += " WHERE timestamp >= %s "
-        params.append(start)
-        if end is not None:
-            query += "AND timestamp < %s "
-            params.append(end)
-    else:
-        if end is not None:
-            query += " WHERE timestamp < %s "
-            params.append(end)
+            "    download " + where
 
     query += "GROUP BY year, month, platform "
     query += "ORDER BY year, month"
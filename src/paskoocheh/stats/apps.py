@@ -23,3 +23,12 @@ from django.apps import AppConfig
 class StatsConfig(AppConfig):
     name = 'stats'
     verbose_name = u'Stats'
+
+    def ready(self):
+        """
+        Runs once when app is initialized.
+        https://stackoverflow.com/a/16111968/7949868
+        """
+        from .query_cache import register_query_cache_signal_handlers
+
+        register_query_cache_signal_handlers()
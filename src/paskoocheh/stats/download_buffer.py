@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+# Paskoocheh - A tool marketplace for Iranian
+#
+# Copyright (C) 2024 ASL19 Organization
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+u"""
+Write-behind buffer of api_engine download records.
+
+Requests append download records to a Redis stream instead of inserting
+them into the stats database, and the flushdownloads management command
+inserts them in batches. Records are acknowledged only once their batch has
+been committed, and records a previous flush read but didn't acknowledge
+are read again first, so every record is inserted at least once.
+
+The stream is capped at STATS_DOWNLOAD_BUFFER_MAX_LENGTH records: when the
+flush falls behind that much, new records are refused (DownloadBufferFull)
+rather than growing the buffer without bound.
+"""
+
+import json
+import logging
+from django.conf import settings
+from django.core.cache import cache
+from django_redis import get_redis_connection
+from redis.exceptions import ResponseError
+from pyskoocheh import errors
+
+logger = logging.getLogger(__name__)
+
+STREAM_CACHE_KEY = u'cache_type=stats_download_buffer&'
+LOCK_CACHE_KEY = u'cache_type=stats_download_buffer_lock&'
+# Seconds the flush lock is held for after each batch
+LOCK_TIMEOUT = 600
+
+# The stream is flushed by a single consumer at a time (see flush_downloads)
+CONSUMER_GROUP = 'stats'
+CONSUMER = 'flushdownloads'
+
+
+class DownloadBufferFull(errors.DBError):
+    """ The download buffer has reached its maximum length """
+
+
+# ========================
+# === Helper functions ===
+# ========================
+def get_stream_key():
+    return cache.make_key(STREAM_CACHE_KEY)
+
+
+def ensure_consumer_group(redis):
+    try:
+        redis.xgroup_create(get_stream_key(), CONSUMER_GROUP, id='0', mkstream=True)
+    except ResponseError as exc:
+        # BUSYGROUP: the group already exists
+        if 'BUSYGROUP' not in str(exc):
+            raise
+
+
+def read_records(redis, batch_size):
+    u"""
+    Return the next (stream ID, record) tuples to flush, starting with the
+    records a previous flush read but didn't acknowledge.
+    """
+    for start_id in ('0', '>'):
+        response = redis.xreadgroup(
+            CONSUMER_GROUP,
+            CONSUMER,
+            {get_stream_key(): start_id},
+            count=batch_size,
+        )
+
+        entries = response[0][1] if response else []
+        if entries:
+            return [
+                (entry_id, json.loads(fields[b'record']))
+                for entry_id, fields in entries
+            ]
+
+    return []
+
+
+# ===============
+# === Enqueue ===
+# ===============
+def buffer_download(dl_dict):
+    """
+    Append a download record to the buffer.
+
+    Args:
+        dl_dict (dict): api_engine download record (see
+            stats.tasks.get_download_record)
+
+    Returns:
+        None
+    """
+    redis = get_redis_connection()
+
+    if redis.xlen(get_stream_key()) >= settings.STATS_DOWNLOAD_BUFFER_MAX_LENGTH:
+        logger.error('Download buffer is full, refusing record {}'.format(str(dl_dict)))
+        raise DownloadBufferFull('The download buffer is full')
+
+    redis.xadd(get_stream_key(), {'record': json.dumps(dl_dict)})
+
+
+# =============
+# === Flush ===
+# =============
+def flush_downloads(batch_size=None):
+    """
+    Insert the buffered download records into the stats database.
+
+    Args:
+        batch_size (int): Number of records inserted at once. Defaults to
+            STATS_DOWNLOAD_BUFFER_BATCH_SIZE
+
+    Returns:
+        int: Number of records inserted
+    """
+    from .api_engine import add_downloads
+
+    batch_size = batch_size or settings.STATS_DOWNLOAD_BUFFER_BATCH_SIZE
+    redis = get_redis_connection()
+    flushed = 0
+
+    with cache.lock(LOCK_CACHE_KEY, timeout=LOCK_TIMEOUT) as lock:
+        ensure_consumer_group(redis)
+
+        while True:
+            records = read_records(redis, batch_size)
+            if not records:
+                break
+
+            entry_ids = [entry_id for entry_id, dl_dict in records]
+
+            add_downloads([dl_dict for entry_id, dl_dict in records])
+
+            with redis.pipeline() as pipeline:
+                pipeline.xack(get_stream_key(), CONSUMER_GROUP, *entry_ids)
+                pipeline.xdel(get_stream_key(), *entry_ids)
+                pipeline.execute()
+
+            flushed += len(records)
+            logger.info('Flushed {} buffered download records'.format(len(records)))
+
+            # Flushing a large backlog takes longer than LOCK_TIMEOUT, so the
+            # lock is renewed after every batch for a concurrent flush not to
+            # read the same records. Raises LockNotOwnedError if a batch
+            # alone took longer and the lock was lost
+            lock.extend(LOCK_TIMEOUT, replace_ttl=True)
+
+    return flushed
@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+# Paskoocheh - A tool marketplace for Iranian
+#
+# Copyright (C) 2024 ASL19 Organization
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+from django.core.management.base import BaseCommand
+from stats.rollups import rebuild_download_rollups
+
+
+class Command(BaseCommand):
+    """
+        Management command to rebuild the daily and monthly
+        download rollups from the remote database.
+    """
+
+    help = 'Rebuild the download rollups from the remote database'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=100000,
+            help='Number of download IDs queried at once')
+
+    def handle(self, *args, **options):
+        """
+            Main entry point for the command
+        """
+
+        download_last = rebuild_download_rollups(options['batch_size'])
+
+        msg = 'Rebuilt the download rollups up to download ID {}'.format(download_last)
+        self.stdout.write(msg)
+        self.stdout.flush()
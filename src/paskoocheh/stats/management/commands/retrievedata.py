@@ -18,6 +18,7 @@
 
 
 from django.core.management.base import BaseCommand
+from stats.query_cache import get_query_cache_counters
 from stats.tasks import (
     update_download,
     update_rating,
@@ -65,6 +66,11 @@ class Command(BaseCommand):
         self.stdout.flush()
         update_feedback(self)
 
+        counters = get_query_cache_counters()
+        msg = 'Stats query cache: {} hits, {} misses'.format(counters['hits'], counters['misses'])
+        self.stdout.write(msg)
+        self.stdout.flush()
+
         msg = 'Successfully updated the local database'
         self.stdout.write(msg)
         self.stdout.flush()
@@ -0,0 +1,45 @@
+# Generated by Django 3.2.23 on 2026-10-18 10:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stats', '0002_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyDownloadRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tool_id', models.IntegerField(blank=True, null=True, verbose_name='Tool ID')),
+                ('tool_name', models.CharField(blank=True, max_length=128, null=True, verbose_name='Tool name')),
+                ('platform_name', models.CharField(blank=True, max_length=128, null=True, verbose_name='Platform Name')),
+                ('channel', models.CharField(blank=True, max_length=128, null=True, verbose_name='Channel')),
+                ('download_count', models.PositiveIntegerField(default=0)),
+                ('date', models.DateField(db_index=True, verbose_name='Date')),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='MonthlyDownloadRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tool_id', models.IntegerField(blank=True, null=True, verbose_name='Tool ID')),
+                ('tool_name', models.CharField(blank=True, max_length=128, null=True, verbose_name='Tool name')),
+                ('platform_name', models.CharField(blank=True, max_length=128, null=True, verbose_name='Platform Name')),
+                ('channel', models.CharField(blank=True, max_length=128, null=True, verbose_name='Channel')),
+                ('download_count', models.PositiveIntegerField(default=0)),
+                ('year', models.PositiveSmallIntegerField(verbose_name='Year')),
+                ('month', models.PositiveSmallIntegerField(verbose_name='Month')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='monthlydownloadrollup',
+            index=models.Index(fields=['year', 'month'], name='stats_month_year_6e3304_idx'),
+        ),
+    ]
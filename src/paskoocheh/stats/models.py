@@ -148,6 +148,74 @@ class VersionDownload(VersionInstance):
         return self.tool_name + ' ' + self.platform_name
 
 
+class DownloadRollup(models.Model):
+    """
+        DownloadRollup as a base model for the pre-aggregated
+        download counts of the api_engine download table
+    """
+
+    tool_id = models.IntegerField(
+        null=True,
+        blank=True,
+        verbose_name=_('Tool ID'))
+    tool_name = models.CharField(
+        max_length=128,
+        null=True,
+        blank=True,
+        verbose_name=_('Tool name'))
+    platform_name = models.CharField(
+        max_length=128,
+        null=True,
+        blank=True,
+        verbose_name=_('Platform Name'))
+    channel = models.CharField(
+        max_length=128,
+        null=True,
+        blank=True,
+        verbose_name=_('Channel'))
+    download_count = models.PositiveIntegerField(
+        default=0)
+
+    class Meta:
+
+        abstract = True
+
+
+class DailyDownloadRollup(DownloadRollup):
+    """
+        Number of downloads per day, tool, platform and channel
+    """
+
+    date = models.DateField(
+        db_index=True,
+        verbose_name=_('Date'))
+
+    def __str__(self):
+
+        return f'{self.date} {self.tool_name} {self.platform_name} {self.channel}'
+
+
+class MonthlyDownloadRollup(DownloadRollup):
+    """
+        Number of downloads per month, tool, platform and channel
+    """
+
+    year = models.PositiveSmallIntegerField(
+        verbose_name=_('Year'))
+    month = models.PositiveSmallIntegerField(
+        verbose_name=_('Month'))
+
+    def __str__(self):
+
+        return f'{self.year}-{self.month} {self.tool_name} {self.platform_name} {self.channel}'
+
+    class Meta:
+
+        indexes = [
+            models.Index(fields=['year', 'month']),
+        ]
+
+
 class VersionReview(VersionInstance):
     """
         Review model to keep track of reviews for each version
@@ -0,0 +1,266 @@
+# -*- coding: utf-8 -*-
+# Paskoocheh - A tool marketplace for Iranian
+#
+# Copyright (C) 2024 ASL19 Organization
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+u"""
+Read-through cache of the GraphQL download and rating stats queries.
+
+The stats tables only change when stats.tasks ingests a batch (which sends
+post_batch_update) or when a record is edited in the admin, so the cached
+results of a model are invalidated on both and otherwise kept for
+STATS_QUERY_CACHE_TIMEOUT seconds. Cache keys include a generation number per
+model, which invalidation increments, rather than scanning the cache for the
+keys to delete. Entries of previous generations are left to expire.
+
+Connections cache the whole ordered result list of a platform, so every
+pagination window of the same query is served from the same entry.
+
+Cache hits and misses are counted in process and added to the shared
+counters every STATS_QUERY_COUNTER_FLUSH_INTERVAL seconds (and at exit),
+rather than with a cache round trip per read.
+"""
+
+import atexit
+import logging
+import threading
+import time
+from collections import Counter
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models.signals import post_delete, post_save
+from stats.signals import post_batch_update
+
+logger = logging.getLogger(__name__)
+
+# Returned by cache.get when a key is missing (None is a valid cached value)
+MISSING = object()
+
+_pending_counts = Counter()
+_pending_counts_lock = threading.Lock()
+_last_counter_flush = time.time()
+
+
+# ========================
+# === Helper functions ===
+# ========================
+def get_generation_cache_key(model):
+    return u'cache_type=stats_query_generation&model={model}&'.format(
+        model=model._meta.model_name,
+    )
+
+
+def get_generation(model):
+    u"""Return the current generation of the cached queries of a model."""
+    cache_key = get_generation_cache_key(model)
+    generation = cache.get(cache_key)
+
+    if generation is None:
+        # Start from the current time rather than 0, so that an evicted
+        # generation doesn't go back to one whose entries are still cached
+        generation = int(time.time() * 1000)
+        cache.add(cache_key, generation, None)
+        generation = cache.get(cache_key, generation)
+
+    return generation
+
+
+def get_query_cache_key(model, query, **params):
+    cache_key = u'cache_type=stats_query&model={model}&generation={generation}&query={query}&'.format(
+        model=model._meta.model_name,
+        generation=get_generation(model),
+        query=query,
+    )
+
+    for key in sorted(params):
+        cache_key += u'{key}={value}&'.format(
+            key=key,
+            value=params[key],
+        )
+
+    return cache_key
+
+
+def get_counter_cache_key(counter):
+    return u'cache_type=stats_query_counter&counter={counter}&'.format(
+        counter=counter,
+    )
+
+
+def increment_counter(counter):
+    global _last_counter_flush
+
+    with _pending_counts_lock:
+        _pending_counts[counter] += 1
+
+        now = time.time()
+        if now - _last_counter_flush < settings.STATS_QUERY_COUNTER_FLUSH_INTERVAL:
+            return
+
+        _last_counter_flush = now
+
+    flush_counters()
+
+
+@atexit.register
+def flush_counters():
+    u"""Add the counts of the process to the shared counters."""
+    with _pending_counts_lock:
+        counts = dict(_pending_counts)
+        _pending_counts.clear()
+
+    for counter, count in counts.items():
+        try:
+            cache.incr(get_counter_cache_key(counter), count)
+        except ValueError:
+            cache.set(get_counter_cache_key(counter), count, None)
+
+
+# =============
+# === Reads ===
+# =============
+def get_cached_query(cache_key, query):
+    """
+    Return the cached result of a query, running and caching it on a miss.
+
+    Args:
+        cache_key (str): Cache key of the query (see get_query_cache_key)
+        query (callable): Returns the result of the query
+
+    Returns:
+        The result of the query
+    """
+    result = cache.get(cache_key, MISSING)
+
+    if result is not MISSING:
+        increment_counter('hits')
+        return result
+
+    increment_counter('misses')
+
+    result = query()
+    cache.set(cache_key, result, settings.STATS_QUERY_CACHE_TIMEOUT)
+
+    return result
+
+
+def get_cached_stats(model, platform_slug, order):
+    """
+    Return the stats records of a platform, in order.
+
+    Args:
+        model: VersionDownload or VersionRating
+        platform_slug (str): Platform slug name
+        order (list): order_by arguments
+
+    Returns:
+        list
+    """
+    return get_cached_query(
+        get_query_cache_key(
+            model,
+            'list',
+            platform_slug=platform_slug,
+            order_by=u','.join(order),
+        ),
+        lambda: list(
+            model.objects
+            .filter(platform_name=platform_slug)
+            .select_related('tool')
+            .order_by(*order)
+        ),
+    )
+
+
+def get_cached_tool_stats(model, platform_slug, tool_pk, tool_slug):
+    """
+    Return the stats record of a tool on a platform.
+
+    Args:
+        model: VersionDownload or VersionRating
+        platform_slug (str): Platform slug name
+        tool_pk (int): Tool pk, or None
+        tool_slug (str): Tool slug, or None
+
+    Returns:
+        model instance, or None if it doesn't exist
+    """
+    from tools.utils import get_object_by_tool_pk_or_slug
+
+    def query():
+        try:
+            return get_object_by_tool_pk_or_slug(
+                model,
+                tool_pk,
+                tool_slug,
+                platform_name=platform_slug)
+        except model.DoesNotExist:
+            return None
+
+    return get_cached_query(
+        get_query_cache_key(
+            model,
+            'tool',
+            platform_slug=platform_slug,
+            tool_pk=tool_pk,
+            tool_slug=tool_slug,
+        ),
+        query,
+    )
+
+
+def get_query_cache_counters():
+    """
+    Return the stats query cache hit and miss counters. Counts of running
+    processes are added every STATS_QUERY_COUNTER_FLUSH_INTERVAL seconds.
+
+    Returns:
+        dict: {'hits', 'misses'}
+    """
+    counters = cache.get_many([
+        get_counter_cache_key('hits'),
+        get_counter_cache_key('misses'),
+    ])
+
+    return {
+        'hits': counters.get(get_counter_cache_key('hits'), 0),
+        'misses': counters.get(get_counter_cache_key('misses'), 0),
+    }
+
+
+# ====================
+# === Invalidation ===
+# ====================
+def purge_stats_queries(sender, **kwargs):
+    logger.info(u'purge_stats_queries {}'.format(sender._meta.model_name))
+
+    try:
+        cache.incr(get_generation_cache_key(sender))
+    except ValueError:
+        # The generation was evicted, get_generation starts a new one
+        pass
+
+
+def register_query_cache_signal_handlers():
+    from stats.models import VersionDownload, VersionRating
+
+    for sender in (VersionDownload, VersionRating):
+        for signal in (post_batch_update, post_save, post_delete):
+            signal.connect(
+                purge_stats_queries,
+                sender=sender,
+                dispatch_uid=u'purge_stats_queries',
+            )
@@ -0,0 +1,324 @@
+# -*- coding: utf-8 -*-
+# Paskoocheh - A tool marketplace for Iranian
+#
+# Copyright (C) 2024 ASL19 Organization
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+u"""
+Daily and monthly download rollups.
+
+The rollup tables hold the number of downloads of the api_engine download
+table per day (or month), tool, platform and channel, up to the
+StatsLastRecords.download_last watermark. They are updated incrementally by
+stats.tasks.update_download.
+
+The get_*_total_download functions have the same signature and results as
+their stats.api_engine counterparts. They read the rollups and only query
+the download table for the downloads that haven't been rolled up yet (or
+when the period doesn't fall on day boundaries).
+"""
+
+import logging
+from collections import defaultdict
+from functools import reduce
+from operator import or_
+from django.db import transaction
+from django.db.models import F, Q, Sum
+from django.db.models.functions import ExtractMonth, ExtractYear
+from django.utils.dateparse import parse_date, parse_datetime
+from . import api_engine
+
+logger = logging.getLogger(__name__)
+
+# Number of rows per INSERT/UPDATE statement
+ROLLUP_BATCH_SIZE = 500
+
+# Rollup dimensions: api_engine column name -> rollup field name
+ROLLUP_DIMENSIONS = {
+    'tool_id': 'tool_id',
+    'tool': 'tool_name',
+    'platform': 'platform_name',
+    'channel': 'channel',
+}
+
+
+# ===============
+# === Updates ===
+# ===============
+def apply_download_rollups(records):
+    """
+        Add api_engine download counts to the rollups
+
+        Args:
+        records: api_engine records with date, tool, tool_id, platform,
+            channel and count fields (see api_engine.query_download)
+    """
+
+    from .models import DailyDownloadRollup, MonthlyDownloadRollup
+
+    daily_counts = defaultdict(int)
+    monthly_counts = defaultdict(int)
+    for rec in records:
+        if rec.date is None:
+            logger.warning('Download record without a date {}'.format(str(rec)))
+            continue
+
+        dimensions = (rec.tool_id, rec.tool, rec.platform, rec.channel)
+        daily_counts[(rec.date,) + dimensions] += rec.count
+        monthly_counts[(rec.date.year, rec.date.month) + dimensions] += rec.count
+
+    if not daily_counts:
+        return
+
+    upsert_rollups(
+        DailyDownloadRollup,
+        DailyDownloadRollup.objects.filter(date__in={key[0] for key in daily_counts}),
+        ('date',),
+        daily_counts)
+
+    months = {key[:2] for key in monthly_counts}
+    upsert_rollups(
+        MonthlyDownloadRollup,
+        MonthlyDownloadRollup.objects.filter(
+            reduce(or_, (Q(year=year, month=month) for year, month in months))),
+        ('year', 'month'),
+        monthly_counts)
+
+
+def upsert_rollups(model, queryset, period_fields, counts):
+    """
+        Increment the download counts of rollup rows, creating the missing
+        ones
+
+        Args:
+        model: Rollup model
+        queryset: Rollup rows that may match the counts
+        period_fields: Names of the period fields of the model
+        counts: Dictionary of download counts by (period fields + dimensions)
+    """
+
+    fields = period_fields + tuple(ROLLUP_DIMENSIONS.values())
+
+    existing = {}
+    for obj in queryset.select_for_update():
+        existing[tuple(getattr(obj, field) for field in fields)] = obj
+
+    updated = []
+    created = []
+    for key, count in counts.items():
+        obj = existing.get(key)
+        if obj is None:
+            created.append(model(download_count=count, **dict(zip(fields, key))))
+        else:
+            obj.download_count += count
+            updated.append(obj)
+
+    model.objects.bulk_update(updated, ['download_count'], batch_size=ROLLUP_BATCH_SIZE)
+    model.objects.bulk_create(created, batch_size=ROLLUP_BATCH_SIZE)
+
+
+def rebuild_download_rollups(batch_size):
+    """
+        Rebuild the rollups from the download table, up to the
+        download_last watermark
+
+        Args:
+        batch_size: Number of download IDs queried at once
+        Returns:
+        The watermark the rollups were rebuilt up to
+    """
+
+    from .models import StatsLastRecords, DailyDownloadRollup, MonthlyDownloadRollup
+
+    with transaction.atomic():
+        # Locking the watermark keeps update_download from adding to the
+        # rollups while they are rebuilt
+        StatsLastRecords.objects.get_or_create()
+        last_recs = StatsLastRecords.objects.select_for_update().get()
+
+        DailyDownloadRollup.objects.all().delete()
+        MonthlyDownloadRollup.objects.all().delete()
+
+        for prev_id in range(0, last_recs.download_last, batch_size):
+            last_id = min(prev_id + batch_size, last_recs.download_last)
+            apply_download_rollups(api_engine.query_download_range(prev_id, last_id) or [])
+            logger.info('Rolled up downloads up to ID {}'.format(last_id))
+
+    return last_recs.download_last
+
+
+# ===============
+# === Queries ===
+# ===============
+def get_rollup_days(start, end):
+    """
+        Convert a period to rollup days
+
+        Args:
+        start: Start date (inclusive), if None start from beginning
+        end: End date (exclusive), if None get the latest
+        Returns:
+        A tuple: (start date or None, end date or None), or None if the
+        period doesn't fall on day boundaries
+    """
+
+    days = []
+    for value in (start, end):
+        if value is None:
+            days.append(None)
+            continue
+
+        try:
+            day = parse_date(value)
+            if day is None:
+                moment = parse_datetime(value)
+                if moment is not None and moment.tzinfo is None and moment == moment.replace(hour=0, minute=0, second=0, microsecond=0):
+                    day = moment.date()
+        except ValueError:
+            day = None
+
+        if day is None:
+            return None
+
+        days.append(day)
+
+    return tuple(days)
+
+
+def query_daily_rollups(start_day, end_day):
+    from .models import DailyDownloadRollup
+
+    queryset = DailyDownloadRollup.objects.all()
+    if start_day is not None:
+        queryset = queryset.filter(date__gte=start_day)
+    if end_day is not None:
+        queryset = queryset.filter(date__lt=end_day)
+
+    return queryset
+
+
+def query_monthly_rollups(start_day, end_day):
+    from .models import MonthlyDownloadRollup
+
+    queryset = MonthlyDownloadRollup.objects.all()
+    if start_day is not None:
+        queryset = queryset.filter(
+            Q(year__gt=start_day.year) | Q(year=start_day.year, month__gte=start_day.month))
+    if end_day is not None:
+        queryset = queryset.filter(
+            Q(year__lt=end_day.year) | Q(year=end_day.year, month__lt=end_day.month))
+
+    return queryset
+
+
+def get_download_counts(raw_query, start, end, dimensions, period=None):
+    """
+        Retrieve download counts from the rollups and the downloads that
+        haven't been rolled up yet
+
+        Args:
+        raw_query: stats.api_engine function of the same counts
+        start: Start date (inclusive), if None start from beginning
+        end: End date (exclusive), if None get the latest
+        dimensions: api_engine column names the counts are grouped by
+        period: 'daily', 'monthly' or None (whole period)
+        Returns:
+        A list of dictionaries, see raw_query
+    """
+
+    from .models import StatsLastRecords
+
+    days = get_rollup_days(start, end)
+    if days is None:
+        return raw_query(start, end)
+
+    start_day, end_day = days
+    last_recs, created = StatsLastRecords.objects.get_or_create()
+
+    period_fields = []
+    period_expressions = {}
+    if period == 'daily':
+        period_fields = ['date']
+        queryset = query_daily_rollups(start_day, end_day)
+    elif period == 'monthly' and all(day is None or day.day == 1 for day in days):
+        queryset = query_monthly_rollups(start_day, end_day)
+        period_fields = ['year', 'month']
+    elif period == 'monthly':
+        queryset = query_daily_rollups(start_day, end_day)
+        period_expressions = {'year': ExtractYear('date'), 'month': ExtractMonth('date')}
+    else:
+        queryset = query_daily_rollups(start_day, end_day)
+
+    dimension_expressions = {
+        name: F(ROLLUP_DIMENSIONS[name])
+        for name in dimensions
+        if name != ROLLUP_DIMENSIONS[name]
+    }
+    dimension_fields = [name for name in dimensions if name not in dimension_expressions]
+
+    rows = queryset \
+        .values(*period_fields, *dimension_fields, **period_expressions, **dimension_expressions) \
+        .annotate(count=Sum('download_count')) \
+        .order_by()
+
+    key_fields = period_fields + list(period_expressions) + dimensions
+
+    counts = {}
+    for row in list(rows) + list(raw_query(start, end, after_id=last_recs.download_last) or []):
+        key = tuple(row[field] for field in key_fields)
+        if key in counts:
+            counts[key]['count'] += row['count']
+        else:
+            counts[key] = dict(row)
+
+    ordering = [field for field in ('year', 'month', 'date') if field in key_fields]
+
+    return sorted(counts.values(), key=lambda row: [row[field] for field in ordering])
+
+
+def get_tools_total_download(start, end):
+    return get_download_counts(api_engine.get_tools_total_download, start, end, ['tool_id', 'tool'])
+
+
+def get_daily_total_download(start, end):
+    return get_download_counts(api_engine.get_daily_total_download, start, end, [], 'daily')
+
+
+def get_daily_total_download_per_channel(start, end):
+    return get_download_counts(api_engine.get_daily_total_download_per_channel, start, end, ['channel'], 'daily')
+
+
+def get_daily_total_download_per_tool(start, end):
+    return get_download_counts(api_engine.get_daily_total_download_per_tool, start, end, ['tool', 'tool_id'], 'daily')
+
+
+def get_daily_total_download_per_platform(start, end):
+    return get_download_counts(api_engine.get_daily_total_download_per_platform, start, end, ['platform'], 'daily')
+
+
+def get_monthly_total_download(start, end):
+    return get_download_counts(api_engine.get_monthly_total_download, start, end, [], 'monthly')
+
+
+def get_monthly_total_download_per_channel(start, end):
+    return get_download_counts(api_engine.get_monthly_total_download_per_channel, start, end, ['channel'], 'monthly')
+
+
+def get_monthly_total_download_per_tool(start, end):
+    return get_download_counts(api_engine.get_monthly_total_download_per_tool, start, end, ['tool', 'tool_id'], 'monthly')
+
+
+def get_monthly_total_download_per_platform(start, end):
+    return get_download_counts(api_engine.get_monthly_total_download_per_platform, start, end, ['platform'], 'monthly')
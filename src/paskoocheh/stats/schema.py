@@ -32,7 +32,7 @@ from typing import Optional, List, Annotated, TYPE_CHECKING
 from gqlauth.core.types_ import MutationNormalOutput
 
 from paskoocheh.helpers import get_client_ip
-from paskoocheh.utils import Connection, IsAuthenticatedMutation
+from paskoocheh.utils import Connection, IsAuthenticatedMutation, cached_count
 
 from django.conf import settings
 from django.contrib.auth import get_user_model
@@ -49,9 +49,8 @@ from stats.models import (
     VersionReviewVote,
 )
 from tools.models import Version
-from tools.utils import (
-    get_object_by_tool_pk_or_slug,
-    filter_objects_by_tool_pk_or_slug)
+from tools.utils import filter_objects_by_tool_pk_or_slug
+from stats.query_cache import get_cached_stats, get_cached_tool_stats
 from stats.utils import save_download
 
 
@@ -268,18 +267,11 @@ class StatsQuery:
         tool_pk: Optional[int] = None,
         tool_slug: Optional[str] = None
     ) -> Optional[VersionRatingNode]:
-        filters = {
-            'platform_name': platform_slug
-        }
-        try:
-            rating = get_object_by_tool_pk_or_slug(
-                VersionRating,
-                tool_pk,
-                tool_slug,
-                **filters)
-        except VersionRating.DoesNotExist:
-            return None
-        return rating
+        return get_cached_tool_stats(
+            VersionRating,
+            platform_slug,
+            tool_pk,
+            tool_slug)
 
     @strawberry.field
     def tools_ratings(
@@ -294,8 +286,7 @@ class StatsQuery:
         order_by: Optional[List[Optional[str]]] = strawberry.UNSET,
     ) -> Optional[Connection[VersionRatingNode]]:
         order = [] if order_by is strawberry.UNSET else order_by
-        ratings = VersionRating.objects.filter(
-            platform_name=platform_slug).order_by(*order)
+        ratings = get_cached_stats(VersionRating, platform_slug, order)
         return Connection[VersionRatingNode].resolve_connection(
             info=info,
             nodes=ratings,
@@ -312,18 +303,11 @@ class StatsQuery:
         tool_pk: Optional[int] = None,
         tool_slug: Optional[str] = None
     ) -> Optional[VersionDownloadNode]:
-        filters = {
-            'platform_name': platform_slug
-        }
-        try:
-            download = get_object_by_tool_pk_or_slug(
-                VersionDownload,
-                tool_pk,
-                tool_slug,
-                **filters)
-        except VersionDownload.DoesNotExist:
-            return None
-        return download
+        return get_cached_tool_stats(
+            VersionDownload,
+            platform_slug,
+            tool_pk,
+            tool_slug)
 
     @strawberry.field
     def tools_downloads(
@@ -338,8 +322,7 @@ class StatsQuery:
         order_by: Optional[List[Optional[str]]] = strawberry.UNSET,
     ) -> Optional[Connection[VersionDownloadNode]]:
         order = [] if order_by is strawberry.UNSET else order_by
-        downloads = VersionDownload.objects.filter(
-            platform_name=platform_slug).order_by(*order)
+        downloads = get_cached_stats(VersionDownload, platform_slug, order)
         return Connection[VersionDownloadNode].resolve_connection(
             info=info,
             nodes=downloads,
@@ -383,7 +366,9 @@ class StatsQuery:
             first=first,
             last=last,
             after=after,
-            before=before)
+            before=before,
+            keyset=True,
+            count=cached_count)
 
     @strawberry.field
     def user_tool_reviews(
@@ -420,7 +405,7 @@ class StatsQuery:
             tool_pk,
             tool_slug,
             **filters)
-        if version_reviews:
+        if version_reviews is not None:
             version_reviews = version_reviews.order_by(*order)
             return Connection[VersionReviewNode].resolve_connection(
                 info=info,
@@ -429,7 +414,9 @@ class StatsQuery:
                 first=first,
                 last=last,
                 after=after,
-                before=before)
+                before=before,
+                keyset=True,
+                count=cached_count)
         return Connection[VersionReviewNode].resolve_connection(
             info=info,
             nodes=VersionReview.objects.none(),
@@ -457,7 +444,7 @@ class StatsQuery:
             VersionReview,
             tool_pk,
             tool_slug)
-        if version_reviews:
+        if version_reviews is not None:
             version_reviews = version_reviews.order_by(*order)
             return Connection[VersionReviewNode].resolve_connection(
                 info=info,
@@ -466,7 +453,9 @@ class StatsQuery:
                 first=first,
                 last=last,
                 after=after,
-                before=before)
+                before=before,
+                keyset=True,
+                count=cached_count)
         return Connection[VersionReviewNode].resolve_connection(
             info=info,
             nodes=VersionReview.objects.none(),
@@ -498,7 +487,9 @@ class StatsQuery:
             first=first,
             last=last,
             after=after,
-            before=before)
+            before=before,
+            keyset=True,
+            count=cached_count)
 
 
 @strawberry.input
@@ -710,7 +701,9 @@ class StatsMutation:
             )
 
         try:
-            Version.objects.get(pk=version_id)
+            version = Version.objects \
+                .select_related('tool', 'supported_os') \
+                .get(pk=version_id)
         except Version.DoesNotExist:
             error_code = 'version'
             error_message = 'Version not found'
@@ -726,7 +719,7 @@ class StatsMutation:
 
         try:
             save_download(
-                version_id=version_id,
+                version=version,
                 channel_version=channel_version,
                 downloaded_via=downloaded_via.value,
                 request_ip=request_ip.encode('utf-8'))
@@ -19,13 +19,21 @@
 
 import pytz
 import logging
+import time
+from collections import defaultdict
 from django.conf import settings
+from django.db import transaction
+from django.db.models.functions import Lower
+from django.utils import timezone
 from stats.signals import post_batch_update
 from pyskoocheh import errors
 
 app = settings.PLATFORM
 logger = logging.getLogger(__name__)
 
+# Number of rows per INSERT/UPDATE statement of the bulk ingestion
+BULK_BATCH_SIZE = 500
+
 
 def backoff(attempts):
     """
@@ -63,6 +71,106 @@ def get_tool(tool_id, tool_name):
     return tool
 
 
+def get_tools(records):
+    """
+        Retrieves the tools of a batch of api_engine records in (at most) two
+        queries, see get_tool
+
+        Args:
+        records: api_engine records with tool_id and tool (name) fields
+
+        Returns:
+        A function returning the Tool record (or None) of a record
+    """
+
+    from tools.models import Tool
+
+    tool_ids = {rec.tool_id for rec in records if rec.tool_id is not None}
+    tool_names = {rec.tool.lower() for rec in records if rec.tool_id is None and rec.tool}
+
+    tools_by_id = Tool.objects.in_bulk(tool_ids) if tool_ids else {}
+
+    tools_by_name = {}
+    if tool_names:
+        tools = Tool.objects \
+            .annotate(lower_name=Lower('name')) \
+            .filter(lower_name__in=tool_names) \
+            .order_by('id')
+        for tool in tools:
+            tools_by_name.setdefault(tool.lower_name, tool)
+
+    def get_record_tool(rec):
+        if rec.tool_id is not None:
+            return tools_by_id.get(rec.tool_id)
+
+        return tools_by_name.get(rec.tool.lower()) if rec.tool else None
+
+    return get_record_tool
+
+
+def log_ingestion_rate(name, rows, started):
+    """
+        Log the number of rows ingested by a stats task and the rate at which
+        they were ingested
+
+        Args:
+        name: Name of the ingested data
+        rows: Number of rows ingested
+        started: time.monotonic() when the ingestion started
+    """
+
+    elapsed = time.monotonic() - started
+    rate = rows / elapsed if elapsed > 0 else rows
+
+    logger.info('Ingested {} {} rows in {:.2f}s ({:.0f} rows/sec)'.format(rows, name, elapsed, rate))
+
+
+def count_downloads(ndownload, tools, download_counts):
+    """
+        Add a chunk of api_engine download records to the download counts
+
+        Args:
+        ndownload: api_engine download records (see api_engine.query_download)
+        tools: Dict of the records' tools by id, updated in place
+        download_counts: Dict of counts by (tool id, platform), updated in place
+    """
+
+    get_record_tool = get_tools(ndownload)
+
+    for dl in ndownload:
+
+        tool = get_record_tool(dl)
+        if tool is None:
+            logger.error('Tool does not exist Record {}'.format(str(dl)))
+            continue
+
+        tools[tool.id] = tool
+        download_counts[(tool.id, dl.platform)] += dl.count
+
+
+def collect_ratings(nrating, tools, ratings):
+    """
+        Add a chunk of api_engine rating records to the latest ratings
+
+        Args:
+        nrating: api_engine rating records (see api_engine.query_rating)
+        tools: Dict of the records' tools by id, updated in place
+        ratings: Dict of records by (tool id, platform), updated in place
+    """
+
+    get_record_tool = get_tools(nrating)
+
+    for rt in nrating:
+
+        tool = get_record_tool(rt)
+        if tool is None:
+            logger.error('Tool does not exist Record {}'.format(str(rt)))
+            continue
+
+        tools[tool.id] = tool
+        ratings[(tool.id, rt.platform)] = rt
+
+
 def update_download(self):
     """
         Update the download table from api_engine
@@ -71,38 +179,59 @@ def update_download(self):
 
     from .models import StatsLastRecords, VersionDownload
     from .api_engine import query_download
+    from .rollups import apply_download_rollups
     from tools.configfile import update_download_rating_json
 
     last_recs, created = StatsLastRecords.objects.get_or_create()
 
     try:
-        highest_id, ndownload = query_download(last_recs.download_last)
+        highest_id, chunks = query_download(last_recs.download_last, settings.STATS_QUERY_CHUNK_SIZE)
     except Exception as exc:
         raise self.retry(countdown=backoff(self.request.retries), exc=exc)
 
-    if highest_id is None or ndownload is None:
+    if highest_id is None or chunks is None:
         return
 
-    last_recs.download_last = highest_id
-    last_recs.save()
-
-    for dl in ndownload:
-
-        tool = get_tool(dl.tool_id, dl.tool)
-        if tool is None:
-            logger.error('Tool does not exist Record {}'.format(str(dl)))
-            continue
-
-        obj, created = VersionDownload.objects.get_or_create(
-            tool=tool,
-            platform_name=dl.platform)
-        if created:
-            obj.download_count = dl.count
-        else:
-            obj.download_count += dl.count
-
-        obj.tool_name = tool.name
-        obj.save()
+    started = time.monotonic()
+    rows = 0
+    tools = {}
+    download_counts = defaultdict(int)
+
+    with transaction.atomic():
+        for ndownload in chunks:
+            count_downloads(ndownload, tools, download_counts)
+            apply_download_rollups(ndownload)
+            rows += len(ndownload)
+
+        last_recs.download_last = highest_id
+        last_recs.save()
+
+        existing = {}
+        for obj in VersionDownload.objects.select_for_update().filter(tool_id__in=tools):
+            existing.setdefault((obj.tool_id, obj.platform_name), obj)
+
+        now = timezone.now()
+        updated = []
+        created = []
+        for (tool_id, platform), count in download_counts.items():
+            obj = existing.get((tool_id, platform))
+            if obj is None:
+                created.append(VersionDownload(
+                    tool=tools[tool_id],
+                    tool_name=tools[tool_id].name,
+                    platform_name=platform,
+                    download_count=count))
+            else:
+                obj.download_count += count
+                obj.tool_name = tools[tool_id].name
+                obj.last_modified = now
+                updated.append(obj)
+
+        VersionDownload.objects.bulk_update(
+            updated, ['download_count', 'tool_name', 'last_modified'], batch_size=BULK_BATCH_SIZE)
+        VersionDownload.objects.bulk_create(created, batch_size=BULK_BATCH_SIZE)
+
+    log_ingestion_rate('download', rows, started)
 
     if settings.BUILD_ENV != 'local':
         update_download_rating_json()
@@ -123,36 +252,160 @@ def update_rating(self):
     last_recs, created = StatsLastRecords.objects.get_or_create()
 
     try:
-        highest_id, nrating = query_rating(last_recs.rating_last)
+        highest_id, chunks = query_rating(last_recs.rating_last, settings.STATS_QUERY_CHUNK_SIZE)
     except Exception as exc:
         raise self.retry(countdown=backoff(self.request.retries), exc=exc)
 
-    if highest_id is None or nrating is None:
+    if highest_id is None or chunks is None:
         return
 
-    last_recs.rating_last = highest_id
-    last_recs.save()
+    started = time.monotonic()
+    rows = 0
+    tools = {}
+    ratings = {}
+    for nrating in chunks:
+        collect_ratings(nrating, tools, ratings)
+        rows += len(nrating)
+
+    with transaction.atomic():
+        last_recs.rating_last = highest_id
+        last_recs.save()
+
+        existing = {}
+        for obj in VersionRating.objects.select_for_update().filter(tool_id__in=tools):
+            existing.setdefault((obj.tool_id, obj.platform_name), obj)
+
+        now = timezone.now()
+        updated = []
+        created = []
+        for (tool_id, platform), rt in ratings.items():
+            obj = existing.get((tool_id, platform))
+            if obj is None:
+                created.append(VersionRating(
+                    tool=tools[tool_id],
+                    tool_name=tools[tool_id].name,
+                    platform_name=platform,
+                    rating_count=rt.count,
+                    star_rating=rt.star))
+            else:
+                obj.rating_count = rt.count
+                obj.tool_name = tools[tool_id].name
+                obj.star_rating = rt.star
+                obj.last_modified = now
+                updated.append(obj)
+
+        VersionRating.objects.bulk_update(
+            updated, ['rating_count', 'tool_name', 'star_rating', 'last_modified'], batch_size=BULK_BATCH_SIZE)
+        VersionRating.objects.bulk_create(created, batch_size=BULK_BATCH_SIZE)
+
+    log_ingestion_rate('rating', rows, started)
+
+    if settings.BUILD_ENV != 'local':
+        update_download_rating_json()
 
+    post_batch_update.send(sender=VersionRating)
+
+
+def localize_timestamp(timestamp, tz):
+    """
+        Localize a naive api_engine timestamp
+
+        Args:
+        timestamp: Naive datetime
+        tz: Name of the timezone of the timestamp (TIME_ZONE if None or
+            invalid)
+
+        Returns:
+        An aware datetime
+    """
+
+    try:
+        return pytz.timezone(tz if tz else settings.TIME_ZONE).localize(timestamp)
+    except Exception:
+        return pytz.timezone(settings.TIME_ZONE).localize(timestamp)
+
+
+def set_review_fields(obj, rt, tool):
+    """
+        Copy the fields of an api_engine review record to a VersionReview
+
+        Args:
+        obj: VersionReview record
+        rt: api_engine review record
+        tool: The Tool record of the review
+    """
+
+    if rt.timestamp:
+        obj.timestamp = localize_timestamp(rt.timestamp, rt.timezone)
+
+    obj.language = rt.language
+    obj.tool_name = tool.name
+    obj.rating = rt.rating
+    obj.title = rt.title
+    obj.text = rt.text
+
+
+def save_reviews(nrating):
+    """
+        Create or update the VersionReview records of a chunk of api_engine
+        review records
+
+        Args:
+        nrating: api_engine review records (see api_engine.query_review)
+
+        Returns:
+        The set of (tool id, platform) tuples of the saved reviews
+    """
+
+    from .models import VersionReview
+
+    get_record_tool = get_tools(nrating)
+
+    tools = {}
+    reviews = {}
     for rt in nrating:
 
-        tool = get_tool(rt.tool_id, rt.tool)
+        tool = get_record_tool(rt)
         if tool is None:
             logger.error('Tool does not exist Record {}'.format(str(rt)))
             continue
 
-        obj, created = VersionRating.objects.get_or_create(
-            tool=tool,
-            platform_name=rt.platform)
+        tools[tool.id] = tool
+        reviews[(tool.id, rt.platform, rt.user_uuid, rt.tool_version, rt.user_id)] = rt
+
+    existing = {}
+    user_ids = {key[4] for key in reviews}
+    for obj in VersionReview.objects.select_for_update().filter(tool_id__in=tools, user_id__in=user_ids):
+        existing.setdefault(
+            (obj.tool_id, obj.platform_name, obj.username, obj.tool_version, obj.user_id), obj)
+
+    now = timezone.now()
+    updated = []
+    created = []
+    for key, rt in reviews.items():
+        obj = existing.get(key)
+        if obj is None:
+            tool_id, platform, user_uuid, tool_version, user_id = key
+            obj = VersionReview(
+                tool=tools[tool_id],
+                platform_name=platform,
+                username=user_uuid,
+                tool_version=tool_version,
+                user_id=user_id)
+            created.append(obj)
+        else:
+            obj.last_modified = now
+            updated.append(obj)
 
-        obj.rating_count = rt.count
-        obj.tool_name = tool.name
-        obj.star_rating = rt.star
-        obj.save()
+        set_review_fields(obj, rt, tools[obj.tool_id])
 
-    if settings.BUILD_ENV != 'local':
-        update_download_rating_json()
+    VersionReview.objects.bulk_update(
+        updated,
+        ['timestamp', 'language', 'tool_name', 'rating', 'title', 'text', 'last_modified'],
+        batch_size=BULK_BATCH_SIZE)
+    VersionReview.objects.bulk_create(created, batch_size=BULK_BATCH_SIZE)
 
-    post_batch_update.send(sender=VersionRating)
+    return {(tool_id, platform) for tool_id, platform, *rest in reviews}
 
 
 def update_review(self):
@@ -161,52 +414,40 @@ def update_review(self):
         database.
     """
 
-    from .models import StatsLastRecords, VersionReview
+    from .models import StatsLastRecords
     from .api_engine import query_review
     from tools.configfile import update_review_json
+    from webfrontend.caches.responses.signal_handlers import purge_versionreviews
 
     last_recs, created = StatsLastRecords.objects.get_or_create()
 
     try:
-        highest_id, nrating = query_review(last_recs.review_last)
+        highest_id, chunks = query_review(last_recs.review_last, settings.STATS_QUERY_CHUNK_SIZE)
     except Exception as exc:
         raise self.retry(countdown=backoff(self.request.retries), exc=exc)
 
-    if highest_id is None or nrating is None:
+    if highest_id is None or chunks is None:
         return
 
-    last_recs.review_last = highest_id
-    last_recs.save()
+    started = time.monotonic()
+    rows = 0
+    tool_platforms = set()
 
-    for rt in nrating:
+    with transaction.atomic():
+        # Chunks are saved one at a time, so a review that appears in several
+        # chunks updates the record an earlier chunk created
+        for nrating in chunks:
+            tool_platforms |= save_reviews(nrating)
+            rows += len(nrating)
 
-        tool = get_tool(rt.tool_id, rt.tool)
-        if tool is None:
-            logger.error('Tool does not exist Record {}'.format(str(rt)))
-            continue
+        last_recs.review_last = highest_id
+        last_recs.save()
 
-        obj, created = VersionReview.objects.get_or_create(
-            tool=tool,
-            platform_name=rt.platform,
-            username=rt.user_uuid,
-            tool_version=rt.tool_version,
-            user_id=rt.user_id)
-        if rt.timestamp:
-            timestamp = rt.timestamp
-            tz = rt.timezone if rt.timezone else settings.TIME_ZONE
-            try:
-                timestamp = pytz.timezone(tz).localize(timestamp)
-            except Exception:
-                timestamp = pytz.timezone(settings.TIME_ZONE).localize(timestamp)
-
-            obj.timestamp = timestamp
+    # Bulk operations don't send post_save, so the cached responses
+    # purge_versionreview would have purged are purged once per tool/platform
+    purge_versionreviews(tool_platforms)
 
-        obj.language = rt.language
-        obj.tool_name = tool.name
-        obj.rating = rt.rating
-        obj.title = rt.title
-        obj.text = rt.text
-        obj.save()
+    log_ingestion_rate('review', rows, started)
 
     if settings.BUILD_ENV != 'local':
         update_review_json()
@@ -224,28 +465,23 @@ def update_feedback(self):
     last_recs, created = StatsLastRecords.objects.get_or_create()
 
     try:
-        highest_id, nfeedback = query_feedback(last_recs.feedback_last)
+        highest_id, chunks = query_feedback(last_recs.feedback_last, settings.STATS_QUERY_CHUNK_SIZE)
     except Exception as exc:
         raise self.retry(countdown=backoff(self.request.retries), exc=exc)
 
-    if highest_id is None or nfeedback is None:
+    if highest_id is None or chunks is None:
         return
 
     last_recs.feedback_last = highest_id
     last_recs.save()
 
-    for fb in nfeedback:
-        if fb.timestamp:
-            timestamp = fb.timestamp
-            tz = fb.timezone if fb.timezone else settings.TIME_ZONE
-            try:
-                timestamp = pytz.timezone(tz).localize(timestamp)
-            except Exception:
-                timestamp = pytz.timezone(settings.TIME_ZONE).localize(timestamp)
+    started = time.monotonic()
+    rows = 0
 
-        try:
-            Feedback.objects.create(
-                timestamp=timestamp,
+    for nfeedback in chunks:
+        feedbacks = []
+        for fb in nfeedback:
+            feedback = Feedback(
                 title=fb.title,
                 text=fb.text,
                 user_id=fb.user_id,
@@ -253,25 +489,61 @@ def update_feedback(self):
                 channel_version=fb.channel_version,
                 platform_name=fb.platform,
                 platform_version=fb.platform_version)
-        except Exception as e:
-            logger.error('Feedback creation failed with exception ({})'.format(str(e)))
-            logger.error('Feedback raw data: {}'.format(str(fb)))
-            continue
+            if fb.timestamp:
+                feedback.timestamp = localize_timestamp(fb.timestamp, fb.timezone)
 
+            feedbacks.append((fb, feedback))
 
-def insert_download(user_uuid,
-                    timestamp,
-                    tool_name,
-                    tool_id,
-                    platform,
-                    tool_version,
-                    file_size,
-                    downloaded_via,
-                    channel_version):
+        create_feedbacks(feedbacks)
+        rows += len(nfeedback)
+
+    log_ingestion_rate('feedback', rows, started)
 
-    from .api_engine import add_download
 
-    dl_dict = {
+def create_feedbacks(feedbacks):
+    """
+        Insert a batch of Feedback records, skipping the invalid ones
+
+        Args:
+        feedbacks: List of (api_engine record, Feedback record) tuples
+    """
+
+    from .models import Feedback
+
+    try:
+        with transaction.atomic():
+            Feedback.objects.bulk_create(
+                [feedback for fb, feedback in feedbacks], batch_size=BULK_BATCH_SIZE)
+    except Exception as e:
+        # Fall back to inserting one by one to only skip the invalid records
+        logger.error('Feedback bulk creation failed with exception ({})'.format(str(e)))
+
+        for fb, feedback in feedbacks:
+            try:
+                feedback.save()
+            except Exception as e:
+                logger.error('Feedback creation failed with exception ({})'.format(str(e)))
+                logger.error('Feedback raw data: {}'.format(str(fb)))
+                continue
+
+
+def get_download_record(user_uuid,
+                        timestamp,
+                        tool_name,
+                        tool_id,
+                        platform,
+                        tool_version,
+                        file_size,
+                        downloaded_via,
+                        channel_version):
+    """
+        Build an api_engine download record
+
+        Returns:
+        A dictionary of the download table fields
+    """
+
+    return {
         'user_uuid': user_uuid,
         'timestamp': timestamp,
         'tool': tool_name,
@@ -292,6 +564,17 @@ def insert_download(user_uuid,
         'timezone': None,
     }
 
+
+def insert_download(*args):
+    """
+        Insert a download record in api_engine (see get_download_record
+        for the arguments)
+    """
+
+    from .api_engine import add_download
+
+    dl_dict = get_download_record(*args)
+
     try:
         add_download(dl_dict)
     except Exception as exc:
@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+# Paskoocheh - A tool marketplace for Iranian
+#
+# Copyright (C) 2024 ASL19 Organization
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from unittest import mock, skipIf
+
+from django.conf import settings
+from django.db import connections
+from django.test import TestCase
+
+from stats import api_engine
+
+
+@skipIf(settings.BUILD_ENV != 'local', 'Disabled in CI')
+class ApiEngineTestCase(TestCase):
+    """
+    Testing the api_engine (remote stats database) queries, run against the
+    default test database
+    """
+
+    def setUp(self):
+        # The test database stands in for api_engine
+        self.connection = connections['default']
+        patcher = mock.patch.object(api_engine, 'connections', {'api_engine': self.connection})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                'CREATE TEMPORARY TABLE download ({})'.format(
+                    ', '.join('{} text'.format(field) for field in api_engine.DOWNLOAD_FIELDS)))
+
+    def get_download_record(self, index):
+        dl_dict = {field: '' for field in api_engine.DOWNLOAD_FIELDS}
+        dl_dict['user_uuid'] = str(index)
+
+        return dl_dict
+
+    def test_add_downloads_in_transaction(self):
+        # TestCase runs in a transaction, like add_downloads (which is
+        # called unwrapped since there's no api_engine database to open a
+        # transaction on): the connection must not be closed under it
+        self.assertTrue(self.connection.in_atomic_block)
+
+        api_engine.add_downloads.__wrapped__(
+            [self.get_download_record(index) for index in range(5)],
+            batch_size=2)
+
+        with api_engine.get_cursor() as cursor:
+            cursor.execute('SELECT user_uuid FROM download ORDER BY user_uuid')
+            self.assertEqual(
+                [row[0] for row in cursor.fetchall()],
+                [str(index) for index in range(5)])
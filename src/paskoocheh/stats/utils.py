@@ -20,8 +20,11 @@ import hashlib
 import logging
 
 from datetime import datetime
+from django.conf import settings
 # from django.core.exceptions import DoesNotExist
+from .download_buffer import buffer_download
 from .tasks import (
+    get_download_record,
     insert_download,
     insert_feedback,
     insert_rating,
@@ -130,15 +133,20 @@ def save_download(**kwargs):
         Record a download from user
 
         kwargs: kwargs for the function:
-            'version_id': id of the Version downloaded
+            'version_id': id of the Version downloaded (or 'version': the
+                Version downloaded, if it's already loaded)
             'channel_version': version of webapp
             'downloaded_via': source of download
             'request_ip': IP address of the feedback request (use
                 paskoocheh.helpers.get_client_ip),
+
+        With STATS_DOWNLOAD_BUFFER_ENABLED, the download is appended to the
+        write-behind buffer (see stats.download_buffer) instead of being
+        inserted in the stats database.
     """
     try:
         request_ip = kwargs['request_ip']
-        version_id = kwargs['version_id']
+        version_id = kwargs['version'].id if 'version' in kwargs else kwargs['version_id']
         downloaded_via = kwargs['downloaded_via']
     except KeyError as error:
         raise TypeError(
@@ -150,19 +158,23 @@ def save_download(**kwargs):
     timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
     user_uuid = hashlib.sha512(request_ip).hexdigest()
 
-    try:
-        ver = Version.objects.get(pk=version_id)
-    except Version.DoesNotExist:
-        raise Version.DoesNotExist(
-            'Version with ID {} does not exist'.format(str(version_id))
-        )
+    ver = kwargs.get('version')
+    if ver is None:
+        try:
+            ver = Version.objects \
+                .select_related('tool', 'supported_os') \
+                .get(pk=version_id)
+        except Version.DoesNotExist:
+            raise Version.DoesNotExist(
+                'Version with ID {} does not exist'.format(str(version_id))
+            )
 
     version_size = 0
-    version_codes = ver.version_codes.all()
-    if version_codes:
-        version_size = ver.version_codes.first().size
+    version_code = ver.version_codes.first()
+    if version_code is not None:
+        version_size = version_code.size
 
-    insert_download(
+    download = (
         user_uuid,
         timestamp,
         ver.tool.name,
@@ -171,6 +183,12 @@ def save_download(**kwargs):
         ver.version_number,
         version_size,
         downloaded_via,
-        channel_version)
+        channel_version,
+    )
+
+    if settings.STATS_DOWNLOAD_BUFFER_ENABLED:
+        buffer_download(get_download_record(*download))
+    else:
+        insert_download(*download)
 
     return True
@@ -32,7 +32,7 @@ from .serializers import (
     MonthlyTotalDownloadPerPlatformSerializer,
 )
 from .models import VersionDownload
-from .api_engine import (
+from .rollups import (
     get_tools_total_download,
     get_daily_total_download,
     get_daily_total_download_per_channel,
@@ -0,0 +1,329 @@
+# -*- coding: utf-8 -*-
+# Paskoocheh - A tool marketplace for Iranian
+#
+# Copyright (C) 2024 ASL19 Organization
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+u"""
+On-disk cache of the files downloaded by the updater (tools.updater).
+
+Files are stored once per content, under their sha256 checksum (blobs), and
+looked up by package name, version code and file name (base, split name or
+bundle) through small key files pointing to the blobs. Cached files are read
+memory-mapped (see MappedFile) so they aren't copied into memory.
+
+The least recently used blobs are evicted once the cache holds more than
+UPDATER_APK_CACHE_MAX_BYTES bytes. Blobs used (stored or looked up) in the
+last UPDATER_APK_CACHE_MIN_AGE seconds are never evicted, so that a blob
+isn't deleted between the time an update gets its checksum and the time it
+opens it, even when concurrent updates fill the cache. Key files of evicted
+blobs are dropped when they are next looked up.
+"""
+
+import hashlib
+import io
+import logging
+import mmap
+import os
+import tempfile
+import threading
+import time
+from django.conf import settings
+from django.core.files import File
+
+logger = logging.getLogger('updater')
+
+CHUNK_SIZE = 1024 * 1024
+
+_eviction_lock = threading.Lock()
+
+
+class MappedFile(File):
+    """
+        Read-only, memory-mapped cached file
+    """
+
+    def __init__(self, checksum, name=None):
+        self.path = get_blob_path(checksum)
+        self.fileobj = open(self.path, 'rb')
+
+        size = os.fstat(self.fileobj.fileno()).st_size
+
+        # Empty files can't be mapped
+        if size > 0:
+            mapped = mmap.mmap(self.fileobj.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            mapped = io.BytesIO()
+
+        super(MappedFile, self).__init__(mapped, name or self.path)
+        self.size = size
+        self.checksum = checksum
+
+    def close(self):
+        self.file.close()
+        self.fileobj.close()
+
+
+class BlobWriter(object):
+    """
+        Write-only, unseekable file object writing a new blob into
+        the cache. The content is hashed as it's written, so it's
+        never read back, and extra digests (objects with an update
+        method) can be fed the same bytes.
+
+        Args:
+        digests: Extra digests
+    """
+
+    def __init__(self, digests=()):
+        self.temp = get_temp_file()
+        self.digest = hashlib.sha256()
+        self.digests = [self.digest] + list(digests)
+        self.size = 0
+
+    def write(self, data):
+        self.temp.write(data)
+        for digest in self.digests:
+            digest.update(data)
+        self.size += len(data)
+
+        return len(data)
+
+    def flush(self):
+        self.temp.flush()
+
+    def commit(self):
+        """
+            Move the written content into the cache
+
+            Returns:
+            The sha256 checksum of the content
+        """
+
+        self.temp.close()
+
+        checksum = self.digest.hexdigest()
+
+        # Room is made before the blob is moved in, so it's never evicted
+        # itself, even if it's larger than the cache
+        evict(reserved_bytes=self.size)
+        os.replace(self.temp.name, get_blob_path(checksum))
+
+        return checksum
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        # Drop the content if it hasn't been committed
+        self.temp.close()
+        try:
+            os.remove(self.temp.name)
+        except FileNotFoundError:
+            pass
+
+
+# ========================
+# === Helper functions ===
+# ========================
+def get_blob_path(checksum):
+    return os.path.join(settings.UPDATER_APK_CACHE_DIR, 'blobs', checksum)
+
+
+def get_key_path(package, version_code, name):
+    key = u'package={}&version_code={}&name={}&'.format(package, version_code, name)
+
+    return os.path.join(
+        settings.UPDATER_APK_CACHE_DIR, 'keys', hashlib.sha256(key.encode('utf-8')).hexdigest())
+
+
+def make_dirs():
+    for dirname in ('blobs', 'keys', 'tmp'):
+        os.makedirs(os.path.join(settings.UPDATER_APK_CACHE_DIR, dirname), exist_ok=True)
+
+
+def get_temp_file():
+    u"""Return a temporary file on the cache's file system, to be moved into it."""
+    make_dirs()
+
+    return tempfile.NamedTemporaryFile(
+        dir=os.path.join(settings.UPDATER_APK_CACHE_DIR, 'tmp'), delete=False)
+
+
+def write_atomically(path, data):
+    with get_temp_file() as temp:
+        temp.write(data)
+
+    os.replace(temp.name, path)
+
+
+def evict(max_bytes=None, reserved_bytes=0):
+    """
+        Delete the least recently used blobs until the cache
+        holds at most max_bytes - reserved_bytes bytes, or until
+        only blobs used in the last UPDATER_APK_CACHE_MIN_AGE
+        seconds are left
+
+        Args:
+        max_bytes: Defaults to UPDATER_APK_CACHE_MAX_BYTES
+        reserved_bytes: Size of a blob about to be added
+    """
+
+    if max_bytes is None:
+        max_bytes = settings.UPDATER_APK_CACHE_MAX_BYTES
+
+    make_dirs()
+    blobs_dir = os.path.join(settings.UPDATER_APK_CACHE_DIR, 'blobs')
+    min_mtime = time.time() - settings.UPDATER_APK_CACHE_MIN_AGE
+
+    with _eviction_lock:
+        blobs = []
+        for entry in os.scandir(blobs_dir):
+            stat = entry.stat()
+            blobs.append((stat.st_mtime, stat.st_size, entry.path))
+
+        total = sum(size for mtime, size, path in blobs) + reserved_bytes
+
+        for mtime, size, path in sorted(blobs):
+            if total <= max_bytes or mtime > min_mtime:
+                break
+
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+            total -= size
+            logger.info(f"Evicted [{os.path.basename(path)}] ({size} bytes) from the APK cache")
+
+
+# ==============
+# === Lookup ===
+# ==============
+def has_blob(checksum):
+    return bool(checksum) and os.path.exists(get_blob_path(checksum))
+
+
+def get_checksum(package, version_code, name):
+    """
+        Return the checksum of a cached file
+
+        Args:
+        package: Package name of the app
+        version_code: Version code of the app
+        name: 'base', 'bundle' or the name of a split
+
+        Returns:
+        The sha256 checksum of the file if cached, None otherwise
+    """
+
+    key_path = get_key_path(package, version_code, name)
+
+    try:
+        with open(key_path) as key_file:
+            checksum = key_file.read()
+    except FileNotFoundError:
+        return None
+
+    try:
+        # Mark the blob as recently used
+        os.utime(get_blob_path(checksum))
+    except FileNotFoundError:
+        # The blob has been evicted
+        try:
+            os.remove(key_path)
+        except FileNotFoundError:
+            pass
+        return None
+
+    return checksum
+
+
+def open_file(checksum, name=None):
+    """
+        Open a cached file
+
+        Args:
+        checksum: The sha256 checksum of the file
+        name: Name of the returned file, defaults to the blob path
+
+        Returns:
+        A MappedFile
+    """
+
+    return MappedFile(checksum, name)
+
+
+# =============
+# === Store ===
+# =============
+def link(package, version_code, name, checksum):
+    """
+        Point the key of a file to a cached blob
+
+        Args:
+        package: Package name of the app
+        version_code: Version code of the app
+        name: 'base', 'bundle' or the name of a split
+        checksum: The sha256 checksum of the blob
+    """
+
+    make_dirs()
+    write_atomically(get_key_path(package, version_code, name), checksum.encode('utf-8'))
+
+
+def store(chunks):
+    """
+        Write downloaded content into the cache
+
+        Args:
+        chunks: Iterable of the bytes of the content
+
+        Returns:
+        The sha256 checksum of the content
+    """
+
+    with BlobWriter() as writer:
+        for chunk in chunks:
+            if chunk:       # filter out keep-alive new chunks
+                writer.write(chunk)
+
+        return writer.commit()
+
+
+def cache_file(package, version_code, name, chunks):
+    """
+        Write a downloaded file into the cache, unless it's already cached
+
+        Args:
+        package: Package name of the app
+        version_code: Version code of the app
+        name: 'base', 'bundle' or the name of a split
+        chunks: Iterable of the bytes of the file, only consumed
+            if the file isn't cached yet
+
+        Returns:
+        The sha256 checksum of the file
+    """
+
+    checksum = get_checksum(package, version_code, name)
+    if checksum is not None:
+        logger.info(f"[{package}] ({version_code}) [{name}] was found in the APK cache")
+        return checksum
+
+    checksum = store(chunks)
+    link(package, version_code, name, checksum)
+
+    return checksum
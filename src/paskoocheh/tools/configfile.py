@@ -25,11 +25,13 @@ import html2text
 import markdown
 from urllib.parse import urlparse
 from django.conf import settings
-from django.db.models import Q
+from django.core.cache import cache
+from django.db.models import Prefetch, Q, prefetch_related_objects
 from django.db import connection
 from paskoocheh.helpers import namedtuplefetchall
 from paskoocheh.s3 import write_config_to_s3
 from tools.models import (
+    Image,
     Info,
     Tool,
     Version,
@@ -40,7 +42,10 @@ from tools.models import (
 )
 from stats.models import VersionReview
 from preferences.models import (
-    Text
+    AndroidDeviceProfile,
+    Platform,
+    Text,
+    ToolType,
 )
 from pyskoocheh.telegraph import (
     telegraph_tame_text,
@@ -67,23 +72,22 @@ def get_tool_infos(internet_shutdown_filter=False):
     else:
         infos = Info.objects.filter(tool__tooltype__slug='internet-shutdown-ir')
 
+    infos = infos.values('tool__name', 'language', 'last_modified', 'name', 'company', 'description')
+
     tool_info = {}
     for inf in infos:
-        if inf.tool.name not in tool_info:
+        if inf['tool__name'] not in tool_info:
             # We should keep minimum en and ar/fa in translation
-            tool_info[inf.tool.name] = {
+            tool_info[inf['tool__name']] = {
                 language_code: {},
                 'en': {}
             }
 
-        if inf.language not in tool_info[inf.tool.name]:
-            tool_info[inf.tool.name][inf.language] = {}
-
-        tool_info[inf.tool.name][inf.language] = {
-            'last_modified': inf.last_modified.strftime('%Y-%m-%d %H:%M:%S'),
-            'name': inf.name,
-            'company': inf.company,
-            'description': inf.description
+        tool_info[inf['tool__name']][inf['language']] = {
+            'last_modified': inf['last_modified'].strftime('%Y-%m-%d %H:%M:%S'),
+            'name': inf['name'],
+            'company': inf['company'],
+            'description': inf['description']
         }
 
     return tool_info
@@ -105,6 +109,14 @@ def get_tools(tool_info, internet_shutdown_filter=False):
     else:
         tools = Tool.objects.filter(publishable=True, tooltype__slug='internet-shutdown-ir')
 
+    # We only store screenshots and logos
+    tools = tools.prefetch_related(
+        Prefetch(
+            'images',
+            queryset=Image.objects.filter(image_type__in=['logo', 'screenshot']),
+        )
+    )
+
     alltools = {}
 
     for tool in tools:
@@ -130,59 +142,73 @@ def get_tools(tool_info, internet_shutdown_filter=False):
                 'screenshot': []
             }
             for img in tool.images.all():
-                if img.image_type not in alltools[tool.name]['images']:
-                    # We only store screenshots and logos
-                    continue
                 alltools[tool.name]['images'][img.image_type] \
                     .append({'url': img.image.url, 'full_bleed': img.should_display_full_bleed})
 
     return alltools
 
 
-def get_version_guides():
+def get_version_guides(version_ids=None):
     """
         Retrieve Guides for Version objects
 
+        Args:
+        version_ids: Only retrieve Guides of these Versions. Defaults to None
+            (all Versions)
+
         Returns:
-        A dictionary containing Guides for Version objects
+        A dictionary containing Guides by Version id
     """
 
     guides = Guide.objects.all()
+    if version_ids is not None:
+        guides = guides.filter(version_id__in=version_ids)
+
+    guides = guides.values('id', 'version_id', 'language', 'last_modified', 'headline', 'body', 'order')
+
     version_guides = {}
     for guide in guides:
-        version_name = str(guide.version)
-        if version_name not in version_guides:
-            version_guides[version_name] = []
-
-        version_guides[version_name].append({
-            'id': guide.id,
-            'language': guide.language,
-            'last_modified': guide.last_modified.strftime('%Y-%m-%d %H:%M:%S'),
-            'headline': guide.headline,
-            'body': guide.body,
-            'order': guide.order,
+        if guide['version_id'] not in version_guides:
+            version_guides[guide['version_id']] = []
+
+        version_guides[guide['version_id']].append({
+            'id': guide['id'],
+            'language': guide['language'],
+            'last_modified': guide['last_modified'].strftime('%Y-%m-%d %H:%M:%S'),
+            'headline': guide['headline'],
+            'body': guide['body'],
+            'order': guide['order'],
         })
 
     return version_guides
 
 
-def get_version_tutorials():
+def get_version_tutorials(version_ids=None):
     """
         Retrieve Tutorials for Version objects
 
+        Args:
+        version_ids: Only retrieve Tutorials of these Versions. Defaults to
+            None (all Versions)
+
         Returns:
-        A dictionary containing Tutorials for Version objects
+        A dictionary containing Tutorials by Version id
     """
 
     tutorials = Tutorial.objects.filter(publishable=True)
+    if version_ids is not None:
+        tutorials = tutorials.filter(version_id__in=version_ids)
+
+    # The video file is needed for its URL, but not the Version
+    tutorials = tutorials.only(
+        'id', 'version', 'language', 'last_modified', 'video', 'video_link', 'title', 'order')
+
     version_tutorials = {}
     for tut in tutorials:
-        version_name = str(tut.version)
-
-        if version_name not in version_tutorials:
-            version_tutorials[version_name] = []
+        if tut.version_id not in version_tutorials:
+            version_tutorials[tut.version_id] = []
 
-        version_tutorials[version_name].append({
+        version_tutorials[tut.version_id].append({
             'id': tut.id,
             'language': tut.language,
             'last_modified': tut.last_modified.strftime('%Y-%m-%d %H:%M:%S'),
@@ -195,255 +221,499 @@ def get_version_tutorials():
     return version_tutorials
 
 
-def get_version_faqs():
+def get_faq_entry(faq):
+    return {
+        u'language': faq['language'],
+        u'question': faq['headline'],
+        u'answer': faq['body'],
+        u'order': faq['order'],
+    }
+
+
+def get_version_faqs(tool_versions):
     """
-        Retrieve FAQs for Version objects, concatenating the Version FAQ with
-        Tool FAQ for that Version
+        Retrieve FAQs for Version objects, concatenating the Tool FAQ with
+        the Version FAQ for each Version
+
+        Args:
+        tool_versions: A list of Version objects
 
         Returns:
-        A dictionary containing FAQs for Version objects
+        A dictionary containing FAQs by Version id
     """
 
-    version_faqs = {}
+    faq_fields = ('tool_id', 'version_id', 'language', 'headline', 'body', 'order')
 
+    tool_faqs = {}
     faqs = Faq.objects \
-        .exclude(version__isnull=False) \
-        .prefetch_related('tool__versions')
+        .filter(version__isnull=True, tool_id__in={ver.tool_id for ver in tool_versions}) \
+        .values(*faq_fields)
 
     for faq in faqs:
-        for ver in faq.tool.versions.all():
-            version_name = str(ver)
-            if version_name not in version_faqs:
-                version_faqs[version_name] = []
-
-        version_faqs[version_name].append({
-            u'language': faq.language,
-            u'question': faq.headline,
-            u'answer': faq.body,
-            u'order': faq.order,
-        })
+        if faq['tool_id'] not in tool_faqs:
+            tool_faqs[faq['tool_id']] = []
+
+        tool_faqs[faq['tool_id']].append(get_faq_entry(faq))
+
+    version_faqs = {}
+    faqs = Faq.objects \
+        .filter(version_id__in=[ver.id for ver in tool_versions]) \
+        .values(*faq_fields)
 
-    faqs = Faq.objects.exclude(version__isnull=True)
     for faq in faqs:
-        version_name = str(faq.version)
-        if version_name not in version_faqs:
-            version_faqs[version_name] = []
-
-        version_faqs[version_name].append({
-            u'language': faq.language,
-            u'question': faq.headline,
-            u'answer': faq.body,
-            u'order': faq.order,
-        })
-        if faq.tool.name in version_faqs:
-            version_faqs[version_name].extend(
-                version_faqs[faq.tool.name])
+        if faq['version_id'] not in version_faqs:
+            version_faqs[faq['version_id']] = []
 
-    return version_faqs
+        version_faqs[faq['version_id']].append(get_faq_entry(faq))
 
+    all_version_faqs = {}
+    for ver in tool_versions:
+        faqs = tool_faqs.get(ver.tool_id, []) + version_faqs.get(ver.id, [])
+        if faqs:
+            all_version_faqs[ver.id] = faqs
 
-def update_config_json(internet_shutdown_versions=None):    # noqa: C901
-    """
-        Updates the json configuration file
-    """
+    return all_version_faqs
 
-    if internet_shutdown_versions:
-        tool_info = get_tool_infos(internet_shutdown_filter=True)
-        alltools = get_tools(tool_info, internet_shutdown_filter=True)
-    else:
-        tool_info = get_tool_infos()
-        alltools = get_tools(tool_info)
 
-    version_guides = get_version_guides()
-    version_tutorials = get_version_tutorials()
-    version_faqs = get_version_faqs()
+def get_changed_version_ids(instance):
+    """
+        Return the ids of the Versions whose config entries depend on instance
 
-    # TODO: temporary id numbers for os
-    osind = 0
-    os_new = {}
+        Args:
+        instance: A Tool, Info, Version, VersionCode, Faq, Guide, Tutorial,
+            Image, ToolType or Platform object that has been saved or deleted
 
-    if internet_shutdown_versions:
-        tool_versions = internet_shutdown_versions
-    else:
-        tool_versions = Version.objects.select_related().prefetch_related().all()
+        Returns:
+        A set of Version ids, or None if every Version may be affected
+    """
 
-    allcategories = {}
-    results = {}
-    faq_results = {}
-    gnt_results = {}
+    if isinstance(instance, (ToolType, Platform)):
+        # Categories and platforms are shared by many versions
+        return None
+    elif isinstance(instance, Tool):
+        tool_id = instance.id
+    elif isinstance(instance, Version):
+        return {instance.id}
+    elif isinstance(instance, Image):
+        # Images belong to either a Tool or a Version
+        if instance.content_type.model == 'version':
+            return {instance.object_id}
+        tool_id = instance.object_id
+    elif isinstance(instance, Faq) and instance.version_id is None:
+        # Tool FAQs are included in the FAQs of every version of the tool
+        tool_id = instance.tool_id
+    elif hasattr(instance, 'version_id'):
+        return {instance.version_id} if instance.version_id else set()
+    else:
+        tool_id = getattr(instance, 'tool_id', None)
+        if tool_id is None:
+            return None
+
+    return set(
+        Version.objects
+        .filter(tool_id=tool_id)
+        .values_list('id', flat=True)
+    )
 
-    for ver in tool_versions:
-        if not ver.tool.publishable:
-            continue
 
-        os = ver.supported_os
-        if os.slug_name not in results:
-            results[os.slug_name] = []
-            faq_results[os.slug_name] = []
-            gnt_results[os.slug_name] = []
-
-        if os.slug_name not in os_new:
-            os_new[os.slug_name] = {
-                'id': str(osind),
-                'name': os.name,
-                'display_name': {
-                    language_code: os.display_name_ar if language_code == 'ar' else os.display_name_fa,
-                    'en': os.display_name.replace('_', ' ').capitalize()
-                },
-                'slug_name': os.slug_name,
-            }
-            osind += 1
-
-        url = ver.download_url
-
-        images = {}
-        for img in ver.images.all():
-            if img.image_type not in images:
-                images[img.image_type] = []
-
-            images[img.image_type].append({'url': img.image.url, 'full_bleed': img.should_display_full_bleed})
-
-        version_name = str(ver)
-        ver_cats = []
-        for toolType in ver.tool.tooltype.all():
-            if toolType.id not in allcategories:
-                allcategories[toolType.id] = {}
-                allcategories[toolType.id]['id'] = toolType.id
-                allcategories[toolType.id]['name'] = {
-                    'en': toolType.name,
-                    'fa': toolType.name_fa,
-                    'ar': toolType.name_ar,
-                }
-                allcategories[toolType.id]['icon'] = None if not toolType.icon else {'url': toolType.icon.url, 'full_bleed': False}
-            ver_cats.append(str(toolType.id))
+def get_version_fragment_cache_key(version_id):
+    return u'cache_type=config_version_fragment&version_id={version_id}&'.format(
+        version_id=version_id,
+    )
 
-        tuts = None if version_name not in version_tutorials else version_tutorials[version_name]
-        guides = None if version_name not in version_guides else version_guides[version_name]
-        faqs = None if version_name not in version_faqs else version_faqs[version_name]
 
-        default_download_dict = {
-            's3': '',
-            'url': url,
-            'email': ver.delivery_email
-        }
+def render_version_fragment(ver, version_guides, version_tutorials, version_faqs):    # noqa: C901
+    """
+        Render the apps, faq and gnt config entries of a single Version
 
-        version_dict = {
-            'id': ver.id,
-            'os_id': os_new[os.slug_name]['id'],
-            'app_name': alltools[ver.tool.name]['name'],
-            'tool_id': alltools[ver.tool.name]['id'],
-            'categories': ver_cats,
-            'last_modified': ver.last_modified.strftime('%Y-%m-%d %H:%M:%S'),
-            'version_number': ver.version_number,
-            'release_date': ver.release_date.strftime('%Y-%m-%d %H:%M:%S'),
-            'release_jdate': ver.release_jdate,
-            'release_url': ver.release_url,
-            'package_name': ver.package_name,
-            'permissions': ver.permissions,
-            'images': images,
-            'faq_url': ver.faq_url,
-            'guide_url': ver.guide_url,
-            'version_code': 0,
-            'download_via': default_download_dict,
-            's3_bucket': settings.AWS_STORAGE_BUCKET_NAME,
-            's3_key': '',
-            'checksum': '',
-            'size': 0,
-            'signature_file': '',
-            'is_installable': True,
-        }
+        The entries don't include the os_id, as it depends on the position of
+        the Version's platform in the published documents and is only assigned
+        in splice_version_fragments.
 
-        # preparing list of devices with version code specific info and list of version code info
-        devices_data = []
-        version_code_data = []
+        Args:
+        ver: Version object, with its relations prefetched (see
+            prefetch_version_relations)
+        version_guides: Guides returned by get_version_guides
+        version_tutorials: Tutorials returned by get_version_tutorials
+        version_faqs: FAQs returned by get_version_faqs
 
-        # getting version codes for each tool/ version
-        version_codes = VersionCode.objects.filter(version=ver)
+        Returns:
+        A dictionary containing the Version's config entries, platform slug
+        name and category ids
+    """
 
-        executed = False
-        if ver.is_bundled_app:
-            for version_code in version_codes:
-                download_dict = {
-                    's3': 'https://' + settings.AWS_S3_CUSTOM_DOMAIN + version_code.s3_key,
-                    'url': url,
-                    'email': ver.delivery_email
-                }
-                temp_version_code_dict = {
-                    'version_code': version_code.version_code,
-                    'download_via': download_dict,
-                    's3_bucket': settings.AWS_STORAGE_BUCKET_NAME,
-                    's3_key': version_code.s3_key,
-                    'checksum': version_code.checksum if version_code.checksum else '',
-                    'size': version_code.size,
-                    'signature_file': version_code.sig_file.url if version_code.sig_file else '',
-                }
-                version_code_data.append(temp_version_code_dict)
-
-                # executed flag to run below block only once/for one version code object only
-                if not executed and version_code.uploaded_file:
-                    # non_installable_extensions = ['pdf', 'html']
-                    extension = version_code.uploaded_file.name.split(
-                        '.')[-1].lower()
-                    if extension in settings.NON_INSTALLABLE_FILE_EXTENSIONS:
-                        version_dict['is_installable'] = False
-                        version_dict.update(temp_version_code_dict)
-                    executed = True
-
-                # fetching devices list associated with this version_code
-                device_list = version_code.devices.all()
-                for device in device_list:
-                    if device.properties:
-                        properties = json.loads(device.properties)
-                        device_dict = {
-                            'device': properties.get('build.device', None),
-                            'version_code': version_code.version_code
-                        }
-                        devices_data.append(device_dict)
-
-        elif version_codes:
-            version_code = list(version_codes)[0]
+    os = ver.supported_os
+    url = ver.download_url
+
+    images = {}
+    for img in ver.images.all():
+        if img.image_type not in images:
+            images[img.image_type] = []
+
+        images[img.image_type].append({'url': img.image.url, 'full_bleed': img.should_display_full_bleed})
+
+    category_ids = [toolType.id for toolType in ver.tool.tooltype.all()]
+
+    tuts = version_tutorials.get(ver.id)
+    guides = version_guides.get(ver.id)
+    faqs = version_faqs.get(ver.id)
+
+    default_download_dict = {
+        's3': '',
+        'url': url,
+        'email': ver.delivery_email
+    }
+
+    version_dict = {
+        'id': ver.id,
+        'app_name': ver.tool.name,
+        'tool_id': ver.tool.id,
+        'categories': [str(category_id) for category_id in category_ids],
+        'last_modified': ver.last_modified.strftime('%Y-%m-%d %H:%M:%S'),
+        'version_number': ver.version_number,
+        'release_date': ver.release_date.strftime('%Y-%m-%d %H:%M:%S'),
+        'release_jdate': ver.release_jdate,
+        'release_url': ver.release_url,
+        'package_name': ver.package_name,
+        'permissions': ver.permissions,
+        'images': images,
+        'faq_url': ver.faq_url,
+        'guide_url': ver.guide_url,
+        'version_code': 0,
+        'download_via': default_download_dict,
+        's3_bucket': settings.AWS_STORAGE_BUCKET_NAME,
+        's3_key': '',
+        'checksum': '',
+        'size': 0,
+        'signature_file': '',
+        'is_installable': True,
+    }
+
+    # preparing list of devices with version code specific info and list of version code info
+    devices_data = []
+    version_code_data = []
+
+    # getting version codes for each tool/ version
+    version_codes = ver.version_codes.all()
+
+    executed = False
+    if ver.is_bundled_app:
+        for version_code in version_codes:
             download_dict = {
                 's3': 'https://' + settings.AWS_S3_CUSTOM_DOMAIN + version_code.s3_key,
                 'url': url,
                 'email': ver.delivery_email
             }
-            version_dict['version_code'] = version_code.version_code
-            version_dict['download_via'] = download_dict
-            version_dict['s3_bucket'] = settings.AWS_STORAGE_BUCKET_NAME
-            version_dict['s3_key'] = version_code.s3_key
-            version_dict['checksum'] = version_code.checksum if version_code.checksum else ''
-            version_dict['size'] = version_code.size
-            version_dict['signature_file'] = version_code.sig_file.url if version_code.sig_file else ''
-            if version_code.uploaded_file:
+            temp_version_code_dict = {
+                'version_code': version_code.version_code,
+                'download_via': download_dict,
+                's3_bucket': settings.AWS_STORAGE_BUCKET_NAME,
+                's3_key': version_code.s3_key,
+                'checksum': version_code.checksum if version_code.checksum else '',
+                'size': version_code.size,
+                'signature_file': version_code.sig_file.url if version_code.sig_file else '',
+            }
+            version_code_data.append(temp_version_code_dict)
+
+            # executed flag to run below block only once/for one version code object only
+            if not executed and version_code.uploaded_file:
                 # non_installable_extensions = ['pdf', 'html']
                 extension = version_code.uploaded_file.name.split(
                     '.')[-1].lower()
                 if extension in settings.NON_INSTALLABLE_FILE_EXTENSIONS:
                     version_dict['is_installable'] = False
+                    version_dict.update(temp_version_code_dict)
+                executed = True
+
+            # fetching devices list associated with this version_code
+            device_list = version_code.devices.all()
+            for device in device_list:
+                if device.properties:
+                    properties = json.loads(device.properties)
+                    device_dict = {
+                        'device': properties.get('build.device', None),
+                        'version_code': version_code.version_code
+                    }
+                    devices_data.append(device_dict)
 
-        version_dict['version_codes'] = version_code_data if version_code_data else None
-        version_dict['devices'] = devices_data if devices_data else None
-
-        results[os.slug_name].append(version_dict)
-        faq_results[os.slug_name].append({
+    elif version_codes:
+        version_code = list(version_codes)[0]
+        download_dict = {
+            's3': 'https://' + settings.AWS_S3_CUSTOM_DOMAIN + version_code.s3_key,
+            'url': url,
+            'email': ver.delivery_email
+        }
+        version_dict['version_code'] = version_code.version_code
+        version_dict['download_via'] = download_dict
+        version_dict['s3_bucket'] = settings.AWS_STORAGE_BUCKET_NAME
+        version_dict['s3_key'] = version_code.s3_key
+        version_dict['checksum'] = version_code.checksum if version_code.checksum else ''
+        version_dict['size'] = version_code.size
+        version_dict['signature_file'] = version_code.sig_file.url if version_code.sig_file else ''
+        if version_code.uploaded_file:
+            # non_installable_extensions = ['pdf', 'html']
+            extension = version_code.uploaded_file.name.split(
+                '.')[-1].lower()
+            if extension in settings.NON_INSTALLABLE_FILE_EXTENSIONS:
+                version_dict['is_installable'] = False
+
+    version_dict['version_codes'] = version_code_data if version_code_data else None
+    version_dict['devices'] = devices_data if devices_data else None
+
+    fragment = {
+        'os_slug_name': os.slug_name,
+        'category_ids': category_ids,
+        'version': version_dict,
+        'faq': {
             'id': ver.id,
-            'os_id': os_new[os.slug_name]['id'],
-            'app_name': alltools[ver.tool.name]['name'],
-            'tool_id': alltools[ver.tool.name]['id'],
+            'app_name': ver.tool.name,
+            'tool_id': ver.tool.id,
             'last_modified': ver.last_modified.strftime('%Y-%m-%d %H:%M:%S'),
             'faq': faqs,
             'faq_url': ver.faq_url,
-        })
-        gnt_results[os.slug_name].append({
+        },
+        'gnt': {
             'id': ver.id,
-            'os_id': os_new[os.slug_name]['id'],
-            'app_name': alltools[ver.tool.name]['name'],
-            'tool_id': alltools[ver.tool.name]['id'],
+            'app_name': ver.tool.name,
+            'tool_id': ver.tool.id,
             'last_modified': ver.last_modified.strftime('%Y-%m-%d %H:%M:%S'),
             'tutorial': tuts,
             'guide': guides,
             'guide_url': ver.guide_url
-        })
+        },
+    }
+    return fragment
+
+
+def prefetch_version_relations(tool_versions):
+    """
+        Prefetch the relations of Versions their config entries are rendered
+        from (see render_version_fragment)
+
+        Each relation is retrieved in a single query for all the Versions,
+        so the number of queries doesn't depend on the number of Versions.
+
+        Args:
+        tool_versions: A list of Version objects
+    """
+
+    prefetch_related_objects(
+        tool_versions,
+        'tool',
+        'supported_os',
+        Prefetch('images', queryset=Image.objects.all()),
+        Prefetch('tool__tooltype', queryset=ToolType.objects.only('id')),
+        Prefetch('version_codes', queryset=VersionCode.objects.order_by('id')),
+        Prefetch(
+            'version_codes__devices',
+            queryset=AndroidDeviceProfile.objects.only('id', 'properties'),
+        ),
+    )
+
+
+def render_version_fragments(tool_versions):
+    """
+        Render the config fragments of the given Versions
+
+        Only the Guides, Tutorials and FAQs of the given Versions (and their
+        Tools) are retrieved, so the cost is proportional to the number of
+        Versions rendered rather than to the size of the catalog. The number
+        of queries is fixed.
+
+        Args:
+        tool_versions: An iterable of Version objects
+
+        Returns:
+        A dictionary of fragments (see render_version_fragment) by Version id
+    """
+
+    tool_versions = [ver for ver in tool_versions if ver.tool.publishable]
+    if not tool_versions:
+        return {}
+
+    prefetch_version_relations(tool_versions)
+
+    version_ids = [ver.id for ver in tool_versions]
+
+    version_guides = get_version_guides(version_ids)
+    version_tutorials = get_version_tutorials(version_ids)
+    version_faqs = get_version_faqs(tool_versions)
+
+    return {
+        ver.id: render_version_fragment(ver, version_guides, version_tutorials, version_faqs)
+        for ver in tool_versions
+    }
+
+
+def get_version_fragments(changed_version_ids=None):
+    """
+        Return the config fragments of all publishable Versions
+
+        Fragments are cached per Version. Only the Versions in
+        changed_version_ids and the Versions that have no cached fragment are
+        re-rendered; every other fragment is reused from the cache.
+
+        The cache trusts the signals (see tools.signals.tools_changed) to
+        pass the ids of every Version a change affects: a cached fragment
+        isn't checked against the database. Changes whose affected Versions
+        aren't known pass None, which re-renders every Version.
+
+        Args:
+        changed_version_ids: Ids of the Versions to re-render. Defaults to
+            None (re-render every Version)
+
+        Returns:
+        A list of fragments ordered by Version id
+    """
+
+    version_ids = list(
+        Version.objects
+        .filter(tool__publishable=True)
+        .order_by('id')
+        .values_list('id', flat=True)
+    )
+
+    cached_fragments = cache.get_many(
+        [get_version_fragment_cache_key(version_id) for version_id in version_ids]
+    )
+
+    fragments = {}
+    if changed_version_ids is not None:
+        for version_id in version_ids:
+            cache_key = get_version_fragment_cache_key(version_id)
+            if version_id not in changed_version_ids and cache_key in cached_fragments:
+                fragments[version_id] = cached_fragments[cache_key]
+
+    stale_version_ids = [version_id for version_id in version_ids if version_id not in fragments]
+
+    rendered_fragments = render_version_fragments(
+        Version.objects
+        .filter(id__in=stale_version_ids)
+        .select_related('tool', 'supported_os')
+    )
+
+    cache.set_many(
+        {
+            get_version_fragment_cache_key(version_id): fragment
+            for version_id, fragment in rendered_fragments.items()
+        },
+        settings.CONFIG_VERSION_FRAGMENT_TIMEOUT,
+    )
+
+    logger.info(
+        f'Config fragments: {len(version_ids)} versions, {len(rendered_fragments)} rendered'
+    )
+
+    fragments.update(rendered_fragments)
+
+    return [fragments[version_id] for version_id in version_ids if version_id in fragments]
+
+
+def splice_version_fragments(fragments):
+    """
+        Assemble the apps, faq and gnt config documents' Version entries from
+        Version fragments
+
+        Platforms and categories are retrieved here rather than stored in the
+        fragments, so changes to them are always reflected in the documents.
+
+        Args:
+        fragments: A list of fragments (see render_version_fragment)
+
+        Returns:
+        A tuple of (os_new, allcategories, results, faq_results, gnt_results)
+    """
+
+    os_slug_names = []
+    category_ids = []
+    for fragment in fragments:
+        if fragment['os_slug_name'] not in os_slug_names:
+            os_slug_names.append(fragment['os_slug_name'])
+        for category_id in fragment['category_ids']:
+            if category_id not in category_ids:
+                category_ids.append(category_id)
+
+    platforms = {
+        platform.slug_name: platform
+        for platform in Platform.objects.filter(slug_name__in=os_slug_names)
+    }
+    tool_types = {
+        tool_type.id: tool_type
+        for tool_type in ToolType.objects.filter(id__in=category_ids)
+    }
+
+    # TODO: temporary id numbers for os
+    os_new = {}
+    for osind, slug_name in enumerate(os_slug_names):
+        os = platforms[slug_name]
+        os_new[slug_name] = {
+            'id': str(osind),
+            'name': os.name,
+            'display_name': {
+                language_code: os.display_name_ar if language_code == 'ar' else os.display_name_fa,
+                'en': os.display_name.replace('_', ' ').capitalize()
+            },
+            'slug_name': os.slug_name,
+        }
+
+    allcategories = {}
+    for category_id in category_ids:
+        toolType = tool_types[category_id]
+        allcategories[toolType.id] = {
+            'id': toolType.id,
+            'name': {
+                'en': toolType.name,
+                'fa': toolType.name_fa,
+                'ar': toolType.name_ar,
+            },
+            'icon': None if not toolType.icon else {'url': toolType.icon.url, 'full_bleed': False},
+        }
+
+    results = {}
+    faq_results = {}
+    gnt_results = {}
+
+    for fragment in fragments:
+        slug_name = fragment['os_slug_name']
+        if slug_name not in results:
+            results[slug_name] = []
+            faq_results[slug_name] = []
+            gnt_results[slug_name] = []
+
+        for entries, entry in [
+                (results, fragment['version']),
+                (faq_results, fragment['faq']),
+                (gnt_results, fragment['gnt'])]:
+            spliced_entry = {'id': entry['id'], 'os_id': os_new[slug_name]['id']}
+            spliced_entry.update(entry)
+            entries[slug_name].append(spliced_entry)
+
+    return os_new, allcategories, results, faq_results, gnt_results
+
+
+def update_config_json(internet_shutdown_versions=None, changed_version_ids=None):
+    """
+        Updates the json configuration file
+
+        Args:
+        internet_shutdown_versions: Versions to publish to the internet
+            shutdown directory. Defaults to None
+        changed_version_ids: Ids of the Versions affected by the change that
+            triggered the update. Only these are re-rendered, every other
+            Version entry is spliced in from the fragment cache. Defaults to
+            None (re-render every Version)
+    """
+
+    if internet_shutdown_versions:
+        tool_info = get_tool_infos(internet_shutdown_filter=True)
+        alltools = get_tools(tool_info, internet_shutdown_filter=True)
+        fragments = list(render_version_fragments(internet_shutdown_versions).values())
+    else:
+        tool_info = get_tool_infos()
+        alltools = get_tools(tool_info)
+        fragments = get_version_fragments(changed_version_ids)
+
+    os_new, allcategories, results, faq_results, gnt_results = splice_version_fragments(fragments)
 
     if internet_shutdown_versions:
         S3_APPS_CONFIG_JSON = f'{settings.S3_INTERNET_SHUTDOWN_DIR}/{settings.S3_APPS_CONFIG_JSON}'
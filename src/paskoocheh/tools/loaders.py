@@ -0,0 +1,336 @@
+# -*- coding: utf-8 -*-
+# Paskoocheh - A tool marketplace for Iranian
+#
+# Copyright (C) 2024 ASL19 Organization
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+u"""
+Batch loaders of the ToolNode and VersionNode relations.
+
+Key groups:
+    tool: Tool ids
+    version: Version ids
+    platform: Platform ids
+    tool_platform: (Tool id, Platform id) tuples, the stats records of a
+        version are looked up by its tool and platform slug
+"""
+
+from collections import defaultdict
+from functools import partial
+
+from django.db.models import Count, F, Window
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import RowNumber
+
+from paskoocheh.loaders import (
+    get_batch_loaders,
+    register_batch_loader_primer,
+)
+from preferences.models import Platform
+from stats.models import VersionDownload, VersionRating, VersionReview
+from tools.models import (
+    Faq,
+    Guide,
+    Image,
+    Info,
+    TeamAnalysis,
+    Tool,
+    Tutorial,
+    Version,
+)
+
+
+# ========================
+# === Helper functions ===
+# ========================
+def group_by(objects, key):
+    grouped = defaultdict(list)
+    for obj in objects:
+        grouped[key(obj)].append(obj)
+
+    return grouped
+
+
+def get_platform_slugs(tool_platform_keys):
+    platform_ids = {platform_id for tool_id, platform_id in tool_platform_keys}
+
+    return dict(
+        Platform.objects.filter(id__in=platform_ids).values_list('id', 'slug_name')
+    )
+
+
+def get_keys_by_slug(tool_platform_keys):
+    u"""Map (tool id, platform slug) tuples to (tool id, platform id) keys."""
+    slugs = get_platform_slugs(tool_platform_keys)
+
+    return {
+        (tool_id, slugs.get(platform_id)): (tool_id, platform_id)
+        for tool_id, platform_id in tool_platform_keys
+    }
+
+
+def group_by_tool_platform(objects, tool_platform_keys):
+    u"""Group stats records by the (tool id, platform id) keys they match."""
+    keys_by_slug = get_keys_by_slug(tool_platform_keys)
+
+    grouped = defaultdict(list)
+    for obj in objects:
+        key = keys_by_slug.get((obj.tool_id, obj.platform_name))
+        if key is not None:
+            grouped[key].append(obj)
+
+    return grouped
+
+
+def stats_filter(tool_platform_keys):
+    slugs = get_platform_slugs(tool_platform_keys)
+
+    return {
+        'tool_id__in': {tool_id for tool_id, platform_id in tool_platform_keys},
+        'platform_name__in': set(slugs.values()),
+    }
+
+
+# =================
+# === Load many ===
+# =================
+def load_tools(keys):
+    return Tool.objects.in_bulk(keys)
+
+
+def load_platforms(keys):
+    return Platform.objects.in_bulk(keys)
+
+
+def load_tool_types(keys):
+    through = Tool.tooltype.through.objects \
+        .filter(tool_id__in=keys) \
+        .select_related('tooltype')
+
+    return {
+        tool_id: [row.tooltype for row in rows]
+        for tool_id, rows in group_by(through, lambda row: row.tool_id).items()
+    }
+
+
+def load_tool_images(keys):
+    return group_by(
+        Image.objects.filter(tool_id__in=keys, publish=True),
+        lambda image: image.tool_id)
+
+
+def load_tool_platforms(keys):
+    versions = Version.objects \
+        .filter(tool_id__in=keys, publishable=True) \
+        .values_list('tool_id', 'supported_os__slug_name')
+
+    platforms = defaultdict(list)
+    for tool_id, slug_name in versions:
+        platforms[tool_id].append(slug_name)
+
+    return platforms
+
+
+def load_team_analyses(keys):
+    return {
+        team_analysis.tool_id: team_analysis
+        for team_analysis in TeamAnalysis.objects.filter(tool_id__in=keys, tool__publishable=True)
+    }
+
+
+def load_tool_versions(order, keys):
+    return group_by(
+        Version.objects.filter(tool_id__in=keys, publishable=True).order_by(*order),
+        lambda version: version.tool_id)
+
+
+def load_tool_faqs(order, keys):
+    return group_by(
+        Faq.objects.filter(tool_id__in=keys, tool__publishable=True).order_by(*order),
+        lambda faq: faq.tool_id)
+
+
+def load_tool_infos(order, keys):
+    return group_by(
+        Info.objects.filter(tool_id__in=keys, publishable=True, tool__publishable=True).order_by(*order),
+        lambda info: info.tool_id)
+
+
+def load_version_guides(order, keys):
+    return group_by(
+        Guide.objects.filter(version_id__in=keys, publishable=True).order_by(*order),
+        lambda guide: guide.version_id)
+
+
+def load_version_tutorials(order, keys):
+    return group_by(
+        Tutorial.objects.filter(version_id__in=keys, publishable=True).order_by(*order),
+        lambda tutorial: tutorial.version_id)
+
+
+def load_download_counts(keys):
+    downloads = VersionDownload.objects.filter(**stats_filter(keys)).order_by('id')
+
+    return {
+        key: objects[0].download_count
+        for key, objects in group_by_tool_platform(downloads, keys).items()
+    }
+
+
+def load_ratings(keys):
+    ratings = VersionRating.objects.filter(**stats_filter(keys)).order_by('id')
+
+    return {
+        key: objects[0]
+        for key, objects in group_by_tool_platform(ratings, keys).items()
+    }
+
+
+def load_reviews(order, limit, keys):
+    u"""
+    Load the reviews of every key, only the first limit ones of each if limit
+    isn't None.
+    """
+    # The pk breaks ties, so the numbered and returned orders are the same
+    order = list(order) + ['pk']
+    reviews = VersionReview.objects.filter(**stats_filter(keys))
+
+    if limit is not None:
+        # Number the reviews of every tool and platform in order, and only
+        # load the first ones of each
+        ranked = reviews.annotate(review_number=Window(
+            expression=RowNumber(),
+            partition_by=[F('tool_id'), F('platform_name')],
+            order_by=[
+                F(field[1:]).desc() if field.startswith('-') else F(field).asc()
+                for field in order
+            ],
+        )).values('pk', 'review_number')
+        sql, params = ranked.query.sql_with_params()
+
+        reviews = VersionReview.objects.filter(pk__in=RawSQL(
+            u'SELECT id FROM ({}) AS ranked WHERE review_number <= %s'.format(sql),
+            params + (limit,),
+        ))
+
+    return group_by_tool_platform(reviews.order_by(*order), keys)
+
+
+def load_review_counts(keys):
+    keys_by_slug = get_keys_by_slug(keys)
+    counts = (
+        VersionReview.objects
+        .filter(**stats_filter(keys))
+        .values_list('tool_id', 'platform_name')
+        .annotate(count=Count('id'))
+        .order_by()
+    )
+
+    return {
+        keys_by_slug[(tool_id, platform_name)]: count
+        for tool_id, platform_name, count in counts
+        if (tool_id, platform_name) in keys_by_slug
+    }
+
+
+# ===============
+# === Loaders ===
+# ===============
+def tool_loader():
+    return get_batch_loaders().get('tool', 'tool', load_tools)
+
+
+def platform_loader():
+    return get_batch_loaders().get('platform', 'platform', load_platforms)
+
+
+def tool_types_loader():
+    return get_batch_loaders().get('tool_types', 'tool', load_tool_types, list)
+
+
+def tool_images_loader():
+    return get_batch_loaders().get('tool_images', 'tool', load_tool_images, list)
+
+
+def tool_platforms_loader():
+    return get_batch_loaders().get('tool_platforms', 'tool', load_tool_platforms, list)
+
+
+def team_analysis_loader():
+    return get_batch_loaders().get('team_analysis', 'tool', load_team_analyses)
+
+
+def tool_versions_loader(order):
+    return get_batch_loaders().get(
+        ('tool_versions', tuple(order)), 'tool', partial(load_tool_versions, order), list)
+
+
+def tool_faqs_loader(order):
+    return get_batch_loaders().get(
+        ('tool_faqs', tuple(order)), 'tool', partial(load_tool_faqs, order), list)
+
+
+def tool_infos_loader(order):
+    return get_batch_loaders().get(
+        ('tool_infos', tuple(order)), 'tool', partial(load_tool_infos, order), list)
+
+
+def version_guides_loader(order):
+    return get_batch_loaders().get(
+        ('version_guides', tuple(order)), 'version', partial(load_version_guides, order), list)
+
+
+def version_tutorials_loader(order):
+    return get_batch_loaders().get(
+        ('version_tutorials', tuple(order)), 'version', partial(load_version_tutorials, order), list)
+
+
+def download_count_loader():
+    return get_batch_loaders().get('download_count', 'tool_platform', load_download_counts)
+
+
+def rating_loader():
+    return get_batch_loaders().get('rating', 'tool_platform', load_ratings)
+
+
+def reviews_loader(order, limit=None):
+    return get_batch_loaders().get(
+        ('reviews', tuple(order), limit), 'tool_platform', partial(load_reviews, order, limit), list)
+
+
+def review_count_loader():
+    return get_batch_loaders().get('review_count', 'tool_platform', load_review_counts, int)
+
+
+# ===============
+# === Primers ===
+# ===============
+def prime_tool(tool):
+    return {
+        'tool': [tool.id],
+    }
+
+
+def prime_version(version):
+    return {
+        'tool': [version.tool_id],
+        'version': [version.id],
+        'platform': [version.supported_os_id],
+        'tool_platform': [(version.tool_id, version.supported_os_id)],
+    }
+
+
+register_batch_loader_primer(Tool, prime_tool)
+register_batch_loader_primer(Version, prime_version)
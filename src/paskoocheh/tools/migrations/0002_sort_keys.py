@@ -0,0 +1,46 @@
+# Generated by Django 3.2.23 on 2026-10-18 14:02
+
+import icu
+from django.conf import settings
+from django.db import migrations, models
+
+
+# Copy of paskoocheh.helpers.get_sort_key as of this migration, which mustn't
+# change with it
+def get_sort_key(transliterator, name):
+    return transliterator.transliterate(name or '')
+
+
+def set_sort_keys(apps, schema_editor):
+    transliterator = icu.Transliterator.createInstance(
+        'Arabic-Latin/BGN' if settings.PLATFORM == 'zanga' else 'Persian-Latin/BGN')
+
+    for model_name in ('Tool', 'Info'):
+        model = apps.get_model('tools', model_name)
+
+        objects = list(model.objects.only('id', 'name'))
+        for obj in objects:
+            obj.sort_key = get_sort_key(transliterator, obj.name)
+
+        model.objects.bulk_update(objects, ['sort_key'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tools', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='info',
+            name='sort_key',
+            field=models.CharField(blank=True, default='', editable=False, help_text='Transliterated name, computed on save, tool lists are ordered by', max_length=255, verbose_name='Sort key'),
+        ),
+        migrations.AddField(
+            model_name='tool',
+            name='sort_key',
+            field=models.CharField(blank=True, default='', editable=False, help_text='Transliterated name, computed on save, tool lists are ordered by', max_length=255, verbose_name='Sort key'),
+        ),
+        migrations.RunPython(set_sort_keys, migrations.RunPython.noop),
+    ]
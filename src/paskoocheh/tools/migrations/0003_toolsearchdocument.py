@@ -0,0 +1,113 @@
+# Generated by Django 3.2.23 on 2026-10-18 16:40
+
+import re
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations, models
+import django.db.models.deletion
+
+# Copies of tools.search and paskoocheh.helpers.normalize_search_text as of
+# this migration, which mustn't change with them
+SEARCH_CONFIG = 'simple'
+
+SEARCH_TEXT_TRANSLATION = str.maketrans({
+    '\u064a': '\u06cc',
+    '\u0649': '\u06cc',
+    '\u0643': '\u06a9',
+    '\u200c': ' ',
+    **{chr(0x06f0 + digit): str(digit) for digit in range(10)},
+    **{chr(0x0660 + digit): str(digit) for digit in range(10)},
+})
+
+SEARCH_TEXT_DIACRITICS_REGEX = re.compile('[\u064b-\u065f\u0670\u0640]')
+
+
+def normalize_search_text(text):
+    text = SEARCH_TEXT_DIACRITICS_REGEX.sub('', (text or '').translate(SEARCH_TEXT_TRANSLATION))
+
+    return ' '.join(text.lower().split())
+
+
+def get_document_texts(tool, infos, tags, language):
+    infos = [
+        info
+        for info in infos
+        if info.language in (language, 'en')
+    ]
+
+    names = [tool.name] + [info.name for info in infos]
+    details = (
+        [info.company for info in infos] +
+        [info.description or '' for info in infos] +
+        [tag.name for tag in tags]
+    )
+
+    return (
+        normalize_search_text(' '.join(names)),
+        normalize_search_text(' '.join(details)),
+    )
+
+
+def build_search_documents(apps, schema_editor):
+    from django.contrib.postgres.search import SearchVector
+
+    Tool = apps.get_model('tools', 'Tool')
+    ToolSearchDocument = apps.get_model('tools', 'ToolSearchDocument')
+    languages = [language for language, language_name in ToolSearchDocument._meta.get_field('language').choices]
+
+    documents = []
+    for tool in Tool.objects.prefetch_related('infos', 'tags'):
+        infos = list(tool.infos.all())
+        tags = list(tool.tags.all())
+
+        for language in languages:
+            names, details = get_document_texts(tool, infos, tags, language)
+            documents.append(ToolSearchDocument(
+                tool=tool,
+                language=language,
+                names=names,
+                details=details))
+
+    ToolSearchDocument.objects.bulk_create(documents, batch_size=500)
+    ToolSearchDocument.objects.update(
+        search_vector=(
+            SearchVector('names', weight='A', config=SEARCH_CONFIG) +
+            SearchVector('details', weight='B', config=SEARCH_CONFIG)))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tools', '0002_sort_keys'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.CreateModel(
+            name='ToolSearchDocument',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('language', models.CharField(choices=[('en', 'English'), ('fa', 'Persian'), ('ar', 'Arabic')], max_length=2, verbose_name='Language')),
+                ('names', models.TextField(blank=True, default='', help_text='Tool name and language-specific names', verbose_name='Names')),
+                ('details', models.TextField(blank=True, default='', help_text='Company names, descriptions and tags', verbose_name='Details')),
+                ('search_vector', django.contrib.postgres.search.SearchVectorField(null=True, verbose_name='Search vector')),
+                ('tool', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_documents', to='tools.tool', verbose_name='Tool')),
+            ],
+            options={
+                'verbose_name': 'Tool search document',
+                'verbose_name_plural': 'Tool search documents',
+                'unique_together': {('tool', 'language')},
+            },
+        ),
+        migrations.AddIndex(
+            model_name='toolsearchdocument',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='tools_search_vector_gin'),
+        ),
+        migrations.AddIndex(
+            model_name='toolsearchdocument',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['names'], name='tools_search_names_trgm', opclasses=['gin_trgm_ops']),
+        ),
+        migrations.RunPython(build_search_documents, migrations.RunPython.noop),
+    ]
@@ -28,8 +28,11 @@ from django.contrib.contenttypes.fields import (
     GenericRelation
 )
 from django.conf import settings
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
 from django.db.models.signals import (
+    m2m_changed,
     post_save,
     post_delete,
 )
@@ -51,6 +54,10 @@ from preferences.models import (
 from .signals import (
     faqs_changed,
     guides_changed,
+    search_documents_changed,
+    tag_search_documents_changed,
+    tool_relations_changed,
+    tool_tags_search_documents_changed,
     tools_changed,
     version_code_changed,
     version_code_deleted,
@@ -61,11 +68,13 @@ from .tools_settings import (
     VIDEO_PATH,
     SPLITS_PATH,
 )
-from pyskoocheh import crypto
 from paskoocheh.mixins import ImageWithCachedDimensionsMixin
+from paskoocheh.s3 import get_signer
+from pyskoocheh.crypto import hash_file
 from paskoocheh.helpers import (
     SingletonModel,
     get_hashed_filename,
+    get_sort_key,
     validate_slug_strict)
 from webfrontend.caches.responses.signal_handlers import (
     purge_faq,
@@ -187,6 +196,10 @@ class Image(models.Model, ImageWithCachedDimensionsMixin):
         ordering = ['image_type']
 
 
+post_save.connect(tools_changed, sender=Image)
+post_delete.connect(tools_changed, sender=Image)
+
+
 class Tool(models.Model):
     """
     Tool model
@@ -210,6 +223,13 @@ class Tool(models.Model):
         max_length=50,
         help_text=_('This is just a latin name for admin panel only'),
         verbose_name=_('Tool name'))
+    sort_key = models.CharField(
+        max_length=255,
+        blank=True,
+        default='',
+        editable=False,
+        help_text=_('Transliterated name, computed on save, tool lists are ordered by'),
+        verbose_name=_('Sort key'))
     slug = models.SlugField(
         max_length=75,
         unique=True,
@@ -295,6 +315,11 @@ class Tool(models.Model):
         name = re.compile(r'\W+', re.U)
         return name.sub('', self.name.lower())
 
+    def save(self, *args, **kwargs):
+        self.sort_key = get_sort_key(self.name)
+
+        super(Tool, self).save(*args, **kwargs)
+
     def __str__(self):
         """
             Return unicode representation of Tool
@@ -313,6 +338,7 @@ class Tool(models.Model):
 
 post_save.connect(tools_changed, sender=Tool)
 post_delete.connect(tools_changed, sender=Tool)
+m2m_changed.connect(tool_relations_changed, sender=Tool.tooltype.through)
 post_save.connect(purge_info_tool_version, sender=Tool)
 post_delete.connect(purge_info_tool_version, sender=Tool)
 
@@ -389,6 +415,13 @@ class Info(models.Model):
         unique=True,
         verbose_name=_('Language-specific name'),
         help_text=_('Name of the tool in the corresponding language'))
+    sort_key = models.CharField(
+        max_length=255,
+        blank=True,
+        default='',
+        editable=False,
+        help_text=_('Transliterated name, computed on save, tool lists are ordered by'),
+        verbose_name=_('Sort key'))
     company = models.CharField(
         max_length=100,
         verbose_name=_('Company name'))
@@ -415,6 +448,11 @@ class Info(models.Model):
 
         return u'{0}'.format(self.name)
 
+    def save(self, *args, **kwargs):
+        self.sort_key = get_sort_key(self.name)
+
+        super(Info, self).save(*args, **kwargs)
+
     def get_tool_name(self):
         return self.tool.name
     get_tool_name.short_description = 'Corresponding tool'
@@ -436,6 +474,68 @@ post_save.connect(purge_info_tool_version, sender=Info)
 post_delete.connect(purge_info_tool_version, sender=Info)
 
 
+class ToolSearchDocument(models.Model):
+    """
+        Denormalized, normalized (see paskoocheh.helpers.normalize_search_text)
+        searchable text of a tool in a language, computed from the tool,
+        its infos and tags (see tools.search)
+    """
+
+    tool = models.ForeignKey(
+        Tool,
+        related_name='search_documents',
+        verbose_name=_('Tool'),
+        on_delete=models.CASCADE)
+    language = models.CharField(
+        max_length=2,
+        choices=settings.LANGUAGE_SUPPORTED_CHOICES,
+        verbose_name=_('Language'))
+    names = models.TextField(
+        blank=True,
+        default='',
+        verbose_name=_('Names'),
+        help_text=_('Tool name and language-specific names'))
+    details = models.TextField(
+        blank=True,
+        default='',
+        verbose_name=_('Details'),
+        help_text=_('Company names, descriptions and tags'))
+    search_vector = SearchVectorField(
+        null=True,
+        verbose_name=_('Search vector'))
+
+    def __str__(self):
+        """
+            Return unicode representation of ToolSearchDocument
+        """
+
+        return u'{0} ({1})'.format(self.tool_id, self.language)
+
+    class Meta(object):
+
+        unique_together = (
+            'tool',
+            'language')
+        indexes = [
+            GinIndex(
+                fields=['search_vector'],
+                name='tools_search_vector_gin'),
+            GinIndex(
+                fields=['names'],
+                name='tools_search_names_trgm',
+                opclasses=['gin_trgm_ops']),
+        ]
+        verbose_name = _('Tool search document')
+        verbose_name_plural = _('Tool search documents')
+
+
+post_save.connect(search_documents_changed, sender=Tool)
+post_save.connect(search_documents_changed, sender=Info)
+post_delete.connect(search_documents_changed, sender=Info)
+post_save.connect(tag_search_documents_changed, sender=Tag)
+m2m_changed.connect(tool_tags_search_documents_changed, sender=Tool.tags.through)
+
+
 def update_filename(instance, filename):
     """
         A method for upload_to for the version
@@ -658,6 +758,8 @@ class Version(models.Model):
         verbose_name_plural = _('Versions')
 
 
+post_save.connect(tools_changed, sender=Version)
+post_delete.connect(tools_changed, sender=Version)
 post_save.connect(purge_info_tool_version, sender=Version)
 post_delete.connect(purge_info_tool_version, sender=Version)
 
@@ -790,6 +892,12 @@ class VersionCode(models.Model):
 
     def save(self, *args, **kwargs):
 
+        # The file uploaded_file has just been saved from (e.g. a bundle in the
+        # updater's APK cache, see tools.apk_cache) can be passed as release_file
+        # so that it's read instead of the stored file. If it has been hashed
+        # while it was written (digest), it isn't read at all.
+        release_file = kwargs.pop('release_file', None)
+
         # To restrict creation of more than one Version Code per specific Version (non-android platforms)
         if self.version.supported_os.slug_name != 'android' and VersionCode.objects.filter(version=self.version) and self.pk is None:
             from django.core.exceptions import ValidationError
@@ -810,21 +918,24 @@ class VersionCode(models.Model):
             if ((has_splits is True and extension == 'zip') or
                     (has_splits is False and extension == 'apk') or
                     (has_splits is False and extension == 'pdf')):
-                signer = crypto.SignatureManager(
-                    settings.PGP_PRIVATE_KEY, settings.PGP_KEY_PASSWORD)
-
-                try:
-                    logger.info(f"Calculating signature for [{self.uploaded_file.name}]...")
-                    self.signature = signer.calc_signature(self.uploaded_file)
-                except Exception as e:
-                    logger.error(f"Error calculating signature of the file: ({str(e)})")
+                digest = getattr(release_file, 'digest', None)
 
+                # The checksum is saved even if the file can't be signed
                 try:
-                    logger.info(f"Computing checksum for [{self.uploaded_file.name}]...")
-                    self.checksum = signer.calc_compute_checksum(
-                        self.uploaded_file)
+                    if digest is None:
+                        logger.info(f"Calculating checksum for [{self.uploaded_file.name}]...")
+                        digest = hash_file(release_file or self.uploaded_file)
+                    self.checksum = digest.hexdigest()
                 except Exception as e:
                     logger.error(f"Error calculating checksum of the file: ({str(e)})")
+                    digest = None
+
+                if digest is not None:
+                    try:
+                        logger.info(f"Calculating signature for [{self.uploaded_file.name}] from its hash...")
+                        self.signature = get_signer().sign_digest(digest)
+                    except Exception as e:
+                        logger.error(f"Error calculating signature of the file: ({str(e)})")
 
         super(VersionCode, self).save(*args, **kwargs)
 
@@ -833,6 +944,7 @@ post_save.connect(version_code_changed, sender=VersionCode)
 post_delete.connect(version_code_deleted, sender=VersionCode)
 post_save.connect(purge_info_tool_version, sender=VersionCode)
 post_delete.connect(purge_info_tool_version, sender=VersionCode)
+m2m_changed.connect(tool_relations_changed, sender=VersionCode.devices.through)
 
 
 class AndroidSplitFile(models.Model):
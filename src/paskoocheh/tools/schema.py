@@ -28,7 +28,7 @@ import strawberry_django
 from django.conf import settings
 from django.core.exceptions import FieldError
 
-from paskoocheh.utils import Connection, IsAuthenticatedMutation
+from paskoocheh.utils import Connection, IsAuthenticatedMutation, cached_count, get_connection_node_limit
 from preferences.schema import PlatformNode, ToolTypeNode
 from stats.schema import RatingCategoryNode
 
@@ -39,10 +39,26 @@ from tools.models import (CategoryAnalysis, Faq, Guide,
                           Image, Info, StepModel, TeamAnalysis, Tool, Tutorial,
                           HomeFeaturedTool, Version, ToolType)
 from accounts.models import UserProfile
-from stats.models import (
-    VersionDownload, VersionRating, VersionReview)
 from stats.schema import (
     VersionRatingNode, VersionReviewNode)
+from tools.loaders import (
+    download_count_loader,
+    platform_loader,
+    rating_loader,
+    review_count_loader,
+    reviews_loader,
+    team_analysis_loader,
+    tool_faqs_loader,
+    tool_images_loader,
+    tool_infos_loader,
+    tool_loader,
+    tool_platforms_loader,
+    tool_types_loader,
+    tool_versions_loader,
+    version_guides_loader,
+    version_tutorials_loader,
+)
+from tools.search import search_tools
 from tools.utils import (
     get_ordered_tools_by_platform,
     get_object_by_tool_pk_or_slug,
@@ -112,18 +128,15 @@ class ToolNode(strawberry.relay.Node):
 
     @strawberry.field
     def available_platforms(self) -> Optional[List[Optional[str]]]:
-        versions = Version.objects.filter(
-            publishable=True,
-            tool=self).select_related('supported_os')
-        return [version.supported_os.slug_name for version in versions]
+        return tool_platforms_loader().load(self.id)
 
     @strawberry.field
     def tool_types(self) -> Optional[List[Optional[ToolTypeNode]]]:
-        return self.tooltype.all()
+        return tool_types_loader().load(self.id)
 
     @strawberry.field
     def images(self) -> Optional[List[Optional[ToolImageNode]]]:
-        return self.images.filter(publish=True)
+        return tool_images_loader().load(self.id)
 
     @strawberry.field
     def versions(
@@ -137,9 +150,7 @@ class ToolNode(strawberry.relay.Node):
         order_by: Optional[List[Optional[str]]] = strawberry.UNSET,
     ) -> Optional[Connection['VersionNode']]:
         order = [] if order_by is strawberry.UNSET else order_by
-        versions = Version.objects.filter(
-            publishable=True,
-            tool=self).order_by(*order)
+        versions = tool_versions_loader(order).load(self.id)
         return Connection['VersionNode'].resolve_connection(
             info=info,
             nodes=versions,
@@ -151,13 +162,7 @@ class ToolNode(strawberry.relay.Node):
 
     @strawberry.field
     def team_analysis(self) -> Optional['TeamAnalysisNode']:
-        try:
-            team_analysis = TeamAnalysis.objects.get(
-                tool=self,
-                tool__publishable=True)
-        except TeamAnalysis.DoesNotExist:
-            return None
-        return team_analysis
+        return team_analysis_loader().load(self.id)
 
     @strawberry.field
     def faqs(
@@ -171,9 +176,7 @@ class ToolNode(strawberry.relay.Node):
         order_by: Optional[List[Optional[str]]] = strawberry.UNSET,
     ) -> Optional[Connection['FaqNode']]:
         order = [] if order_by is strawberry.UNSET else order_by
-        faqs = Faq.objects.filter(
-            tool=self,
-            tool__publishable=True).order_by(*order)
+        faqs = tool_faqs_loader(order).load(self.id)
         return Connection['FaqNode'].resolve_connection(
             info=info,
             nodes=faqs,
@@ -195,10 +198,7 @@ class ToolNode(strawberry.relay.Node):
         order_by: Optional[List[Optional[str]]] = strawberry.UNSET,
     ) -> Optional[Connection['InfoNode']]:
         order = [] if order_by is strawberry.UNSET else order_by
-        tool_info = Info.objects.filter(
-            publishable=True,
-            tool=self,
-            tool__publishable=True).order_by(*order)
+        tool_info = tool_infos_loader(order).load(self.id)
         return Connection['InfoNode'].resolve_connection(
             info=info,
             nodes=tool_info,
@@ -277,11 +277,11 @@ class VersionNode(strawberry.relay.Node):
 
     @strawberry.field
     def tool(self) -> Optional[ToolNode]:
-        return self.tool
+        return tool_loader().load(self.tool_id)
 
     @strawberry.field
     def platform(self) -> Optional[PlatformNode]:
-        return self.supported_os
+        return platform_loader().load(self.supported_os_id)
 
     @strawberry.field
     def can_generate_temp_s3_url(self) -> bool:
@@ -306,9 +306,7 @@ class VersionNode(strawberry.relay.Node):
     ) -> Optional[Connection['GuideNode']]:
         order = [] if order_by is strawberry.UNSET else order_by
 
-        guides = Guide.objects.filter(
-            version=self,
-            publishable=True).order_by(*order)
+        guides = version_guides_loader(order).load(self.id)
         return Connection['GuideNode'].resolve_connection(
             info=info,
             nodes=guides,
@@ -330,9 +328,7 @@ class VersionNode(strawberry.relay.Node):
         order_by: Optional[List[Optional[str]]] = strawberry.UNSET,
     ) -> Optional[Connection['TutorialNode']]:
         order = [] if order_by is strawberry.UNSET else order_by
-        tutorials = Tutorial.objects.filter(
-            publishable=True,
-            version=self).order_by(*order)
+        tutorials = version_tutorials_loader(order).load(self.id)
         return Connection['TutorialNode'].resolve_connection(
             info=info,
             nodes=tutorials,
@@ -346,25 +342,13 @@ class VersionNode(strawberry.relay.Node):
     def download_count(
         self
     ) -> Optional[int]:
-        try:
-            download = VersionDownload.objects.get(
-                tool=self.tool,
-                platform_name=self.supported_os.slug_name).download_count
-        except VersionDownload.DoesNotExist:
-            return None
-        return download
+        return download_count_loader().load((self.tool_id, self.supported_os_id))
 
     @strawberry.field
     def average_rating(
         self,
     ) -> Optional[VersionRatingNode]:
-        try:
-            rating = VersionRating.objects.get(
-                tool=self.tool,
-                platform_name=self.supported_os.slug_name)
-        except VersionRating.DoesNotExist:
-            return None
-        return rating
+        return rating_loader().load((self.tool_id, self.supported_os_id))
 
     @strawberry.field
     def reviews(
@@ -378,9 +362,12 @@ class VersionNode(strawberry.relay.Node):
         order_by: Optional[List[Optional[str]]] = strawberry.UNSET
     ) -> Optional[Connection[VersionReviewNode]]:
         order = [] if order_by is strawberry.UNSET else order_by
-        reviews = VersionReview.objects.filter(
-            tool=self.tool,
-            platform_name=self.supported_os.slug_name).order_by(*order)
+        key = (self.tool_id, self.supported_os_id)
+        # Only the reviews up to the end of the page are loaded, so they
+        # are counted separately
+        limit = get_connection_node_limit(
+            info, before=before, after=after, first=first, last=last, offset=offset)
+        reviews = reviews_loader(order, limit).load(key)
         return Connection[VersionReviewNode].resolve_connection(
             info=info,
             nodes=reviews,
@@ -388,7 +375,8 @@ class VersionNode(strawberry.relay.Node):
             first=first,
             last=last,
             after=after,
-            before=before)
+            before=before,
+            count=lambda nodes: review_count_loader().load(key))
 
 
 @strawberry.django.filters.filter(StepModel, lookups=True)
@@ -593,6 +581,8 @@ class ToolsQuery:
         last: Optional[int] = None,
         offset: Optional[int] = None,
         order_by: Optional[List[Optional[str]]] = strawberry.UNSET,
+        search: Optional[str] = strawberry.UNSET,
+        language: Optional[str] = strawberry.UNSET,
     ) -> Optional[Connection[ToolNode]]:
         order = [] if order_by is strawberry.UNSET else order_by
         if order_by_platform is not strawberry.UNSET:
@@ -602,6 +592,16 @@ class ToolsQuery:
         else:
             tools = Tool.objects.filter(
                 publishable=True).prefetch_related().order_by(*order)
+        if search:
+            searched_tools = search_tools(
+                search,
+                language or settings.LANGUAGE_SUPPORTED_DEFAULT,
+                tools)
+            # Results are ordered by relevance unless ordered otherwise
+            if order_by_platform is strawberry.UNSET and not order:
+                tools = searched_tools
+            else:
+                tools = tools.filter(pk__in=searched_tools.values('pk'))
         return Connection[ToolNode].resolve_connection(
             info=info,
             nodes=tools,
@@ -714,7 +714,9 @@ class ToolsQuery:
             first=first,
             last=last,
             after=after,
-            before=before)
+            before=before,
+            keyset=True,
+            count=cached_count)
 
     @strawberry.field
     def temp_s3_url(
@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+# Paskoocheh - A tool marketplace for Iranian
+#
+# Copyright (C) 2024 ASL19 Organization
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+u"""
+Tool search.
+
+Every tool has a search document (tools.models.ToolSearchDocument) per
+language, holding the normalized text of its name and the names of its infos
+in the language and in English (weighted A), and of their company names,
+descriptions and the tool's tags (weighted B). Documents are rebuilt when a
+tool, its infos or tags are saved, once the change is committed (see
+tools.signals).
+
+Tools match a query when their document matches the prefixes of all of its
+words (GIN-indexed tsvector), or when their names contain the query
+(trigram-indexed LIKE). They are ranked by text rank plus trigram
+similarity of the names to the query.
+"""
+
+import re
+from django.conf import settings
+from django.contrib.postgres.search import (
+    SearchQuery,
+    SearchRank,
+    SearchVector,
+    TrigramSimilarity,
+)
+from django.db.models import F, OuterRef, Q, Subquery
+from paskoocheh.helpers import normalize_search_text
+from tools.models import Info, Tool, ToolSearchDocument
+
+# Languages are mixed in documents (Latin tool names, Persian or Arabic
+# infos), so they aren't stemmed
+SEARCH_CONFIG = 'simple'
+
+WORD_REGEX = re.compile(r'\w+')
+
+
+# ========================
+# === Helper functions ===
+# ========================
+def get_document_texts(tool, infos, tags, language):
+    u"""
+    Return the normalized names and details text of the search document of a
+    tool in a language.
+    """
+    infos = [
+        info
+        for info in infos
+        if info.language in (language, 'en')
+    ]
+
+    names = [tool.name] + [info.name for info in infos]
+    details = (
+        [info.company for info in infos] +
+        [info.description or u'' for info in infos] +
+        [tag.name for tag in tags]
+    )
+
+    return (
+        normalize_search_text(u' '.join(names)),
+        normalize_search_text(u' '.join(details)),
+    )
+
+
+def get_search_query(normalized_query):
+    u"""
+    Return the SearchQuery matching the prefixes of all the words of a
+    normalized query, or None if it has no words.
+    """
+    words = WORD_REGEX.findall(normalized_query)
+    if not words:
+        return None
+
+    return SearchQuery(
+        u' & '.join(u'{}:*'.format(word) for word in words),
+        config=SEARCH_CONFIG,
+        search_type='raw',
+    )
+
+
+# ================
+# === Indexing ===
+# ================
+def update_search_documents(tool):
+    """
+    Rebuild the search documents of a tool.
+
+    Args:
+        tool (Tool)
+
+    Returns:
+        None
+    """
+    infos = list(Info.objects.filter(tool=tool))
+    tags = list(tool.tags.all())
+
+    for language, language_name in settings.LANGUAGE_SUPPORTED_CHOICES:
+        names, details = get_document_texts(tool, infos, tags, language)
+
+        ToolSearchDocument.objects.update_or_create(
+            tool=tool,
+            language=language,
+            defaults={
+                'names': names,
+                'details': details,
+            },
+        )
+
+    # The vector is computed by the database from the stored texts
+    ToolSearchDocument.objects.filter(tool=tool).update(
+        search_vector=(
+            SearchVector('names', weight='A', config=SEARCH_CONFIG) +
+            SearchVector('details', weight='B', config=SEARCH_CONFIG)
+        ),
+    )
+
+
+def update_tools_search_documents(tool_ids):
+    u"""Rebuild the search documents of the tools that still exist among tool_ids."""
+    for tool in Tool.objects.filter(pk__in=tool_ids).prefetch_related('tags'):
+        update_search_documents(tool)
+
+
+def update_all_search_documents():
+    u"""Rebuild the search documents of every tool, return the number of tools."""
+    tools = Tool.objects.prefetch_related('tags')
+
+    for tool in tools:
+        update_search_documents(tool)
+
+    return len(tools)
+
+
+# ==============
+# === Search ===
+# ==============
+def search_tools(search_query, language, tools=None):
+    """
+    Search tools.
+
+    Args:
+        search_query (str): Query, as entered
+        language (str): Language of the searched documents
+        tools (QuerySet): Tools to search. Defaults to all tools
+
+    Returns:
+        QuerySet: Matching tools, annotated with their search_rank and
+            ordered by it, then by sort key
+    """
+    if tools is None:
+        tools = Tool.objects.all()
+
+    normalized_query = normalize_search_text(search_query)
+    if not normalized_query:
+        return tools.none()
+
+    documents = ToolSearchDocument.objects.filter(language=language)
+
+    match = Q(names__contains=normalized_query)
+    rank = TrigramSimilarity('names', normalized_query)
+
+    ts_query = get_search_query(normalized_query)
+    if ts_query is not None:
+        match |= Q(search_vector=ts_query)
+        rank = rank + SearchRank(F('search_vector'), ts_query)
+
+    # Tools have a single document per language
+    search_ranks = (
+        documents
+        .filter(tool=OuterRef('pk'))
+        .annotate(rank=rank)
+        .values('rank')[:1]
+    )
+
+    return (
+        tools
+        .filter(pk__in=documents.filter(match).values('tool_id'))
+        .annotate(search_rank=Subquery(search_ranks))
+        .order_by('-search_rank', 'sort_key')
+    )
@@ -27,10 +27,38 @@ from paskoocheh.tasks import enable_latest_cloudfront_state_invalidate_flag
 def tools_changed(sender, instance, **kwargs):
 
     if settings.BUILD_ENV != 'local':
-        from tools.tasks import update_json_config
+        from paskoocheh.config_updates import schedule_config_update
+        from tools.configfile import get_changed_version_ids
 
-        update_json_config()
-        enable_latest_cloudfront_state_invalidate_flag()
+        schedule_config_update('tools', get_changed_version_ids(instance))
+
+
+def tool_relations_changed(sender, instance, action, reverse, model, pk_set, **kwargs):
+    """
+        Regenerate the config entries of the versions whose tool categories
+        or version code devices changed
+    """
+
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+
+    if settings.BUILD_ENV != 'local':
+        from paskoocheh.config_updates import schedule_config_update
+        from tools.configfile import get_changed_version_ids
+
+        if not reverse:
+            version_ids = get_changed_version_ids(instance)
+        elif pk_set:
+            # model is the Tool or VersionCode side of the relation
+            version_ids = set()
+            for related in model.objects.filter(pk__in=pk_set):
+                version_ids |= get_changed_version_ids(related)
+        else:
+            # Cleared from the category or device side, the affected
+            # versions aren't known
+            version_ids = None
+
+        schedule_config_update('tools', version_ids)
 
 
 @disable_for_loaddata
@@ -41,9 +69,15 @@ def version_code_changed(sender, instance, **kwargs):
 
     if settings.BUILD_ENV != 'local':
 
+        from paskoocheh.config_updates import schedule_config_update
         from tools.tasks import upload_file_to_s3
 
-        upload_file_to_s3(instance.id)
+        try:
+            upload_file_to_s3(instance.id)
+        finally:
+            # Even if the upload was skipped or failed, the version's config
+            # entry has to reflect the saved version code
+            schedule_config_update('tools', {instance.version_id})
         enable_latest_cloudfront_state_invalidate_flag()
 
 
@@ -61,6 +95,10 @@ def version_code_deleted(sender, instance, **kwargs):
             version_code=instance.version_code)
 
         delete_s3_dir(settings.AWS_STORAGE_BUCKET_NAME, path)
+
+        from paskoocheh.config_updates import schedule_config_update
+
+        schedule_config_update('tools', {instance.version_id})
         enable_latest_cloudfront_state_invalidate_flag()
 
 
@@ -74,10 +112,10 @@ def faqs_changed(sender, instance, **kwargs):
             'click_count' in kwargs['update_fields']):
         return
 
-    from tools.tasks import update_faq
+    from paskoocheh.config_updates import schedule_config_update
+    from tools.configfile import get_changed_version_ids
 
-    update_faq(instance.id)
-    enable_latest_cloudfront_state_invalidate_flag()
+    schedule_config_update('tools', get_changed_version_ids(instance))
 
 
 @disable_for_loaddata
@@ -85,7 +123,61 @@ def guides_changed(sender, instance, **kwargs):
 
     if settings.BUILD_ENV != 'local':
 
-        from tools.tasks import update_guide
+        from paskoocheh.config_updates import schedule_config_update
+        from tools.configfile import get_changed_version_ids
 
-        update_guide(instance.id)
-        enable_latest_cloudfront_state_invalidate_flag()
+        schedule_config_update('tools', get_changed_version_ids(instance))
+
+
+def schedule_search_documents_update(tool_ids):
+    """
+        Rebuild the search documents of tools once the current transaction
+        has been committed, so a tool deleted in the transaction (along
+        with its infos) isn't given new documents
+    """
+
+    from django.db import transaction
+    from tools.search import update_tools_search_documents
+
+    tool_ids = set(tool_ids)
+    if tool_ids:
+        transaction.on_commit(lambda: update_tools_search_documents(tool_ids))
+
+
+@disable_for_loaddata
+def search_documents_changed(sender, instance, **kwargs):
+    """
+        Rebuild the search documents of a saved tool, or of the tool
+        of a saved or deleted info
+    """
+
+    from tools.models import Tool
+
+    if isinstance(instance, Tool):
+        schedule_search_documents_update([instance.id])
+    else:
+        schedule_search_documents_update([instance.tool_id])
+
+
+@disable_for_loaddata
+def tag_search_documents_changed(sender, instance, **kwargs):
+    """
+        Rebuild the search documents of the tools of a saved tag
+    """
+
+    schedule_search_documents_update(instance.tools.values_list('id', flat=True))
+
+
+def tool_tags_search_documents_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+        Rebuild the search documents of the tools whose tags changed
+    """
+
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+
+    if not reverse:
+        schedule_search_documents_update([instance.id])
+    elif pk_set:
+        schedule_search_documents_update(pk_set)
+    # Cleared from the tag side, the removed tools aren't known
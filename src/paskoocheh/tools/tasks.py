@@ -20,6 +20,7 @@
 from __future__ import absolute_import, unicode_literals
 import boto3
 import logging
+from boto3.s3.transfer import TransferConfig
 from django.conf import settings
 from django.core.files.base import ContentFile
 
@@ -27,44 +28,40 @@ from django.core.files.base import ContentFile
 logger = logging.getLogger('tools')
 
 
-def update_json_config():
+def update_json_config(changed_version_ids=None):
 
     if settings.BUILD_ENV != 'local':
 
         from tools.configfile import update_config_json
 
-        update_config_json()
+        update_config_json(changed_version_ids=changed_version_ids)
 
 
-def update_faq(instanceid):
+def get_transfer_config():
+    u"""Return the multipart transfer settings of release file uploads."""
+    return TransferConfig(
+        multipart_threshold=settings.S3_MULTIPART_THRESHOLD,
+        multipart_chunksize=settings.S3_MULTIPART_CHUNKSIZE,
+        max_concurrency=settings.S3_MULTIPART_MAX_CONCURRENCY,
+        use_threads=settings.S3_MULTIPART_MAX_CONCURRENCY > 1)
 
-    if settings.BUILD_ENV != 'local':
 
-        from tools.configfile import (
-            update_config_json,
-            # update_faqs_telegraph,
-        )
+def open_release_file(instance):
+    u"""
+    Open the release file of a VersionCode for upload, from the updater's APK
+    cache (memory-mapped) if it's there, from the storage otherwise.
+    """
+    from tools import apk_cache
 
-        # update_faqs_telegraph(instanceid)
-        update_config_json()
+    if apk_cache.has_blob(instance.checksum):
+        return apk_cache.open_file(instance.checksum, instance.uploaded_file.name)
 
-
-def update_guide(instanceid):
-
-    if settings.BUILD_ENV != 'local':
-
-        from tools.configfile import (
-            update_config_json,
-            # update_guides_telegraph,
-        )
-
-        # update_guides_telegraph(instanceid)
-        update_config_json()
+    instance.uploaded_file.seek(0)
+    return instance.uploaded_file
 
 
 def upload_file_to_s3(instanceid):
     from tools.models import VersionCode
-    from tools.configfile import update_config_json
 
     boto3.set_stream_logger('boto3.resources', logging.WARNING)
 
@@ -112,11 +109,16 @@ def upload_file_to_s3(instanceid):
         )
 
         logger.info(f"[INFO] (Task) Writing uploaded file ({instance.version.tool.name}) to s3: {settings.AWS_STORAGE_BUCKET_NAME}{instance.s3_key}")
-        s3_res.Bucket(settings.AWS_STORAGE_BUCKET_NAME).put_object(
-            ContentType=content_type,
-            StorageClass='REDUCED_REDUNDANCY',
-            Key=instance.s3_key.strip('/'),
-            Body=instance.uploaded_file.read())
+        # Stream the file in multipart chunks instead of reading it into memory
+        with open_release_file(instance) as release_file:
+            s3_res.Bucket(settings.AWS_STORAGE_BUCKET_NAME).upload_fileobj(
+                release_file,
+                instance.s3_key.strip('/'),
+                ExtraArgs={
+                    'ContentType': content_type,
+                    'StorageClass': 'REDUCED_REDUNDANCY',
+                },
+                Config=get_transfer_config())
 
         sig_file_name = instance.uploaded_file.name + '.asc'
 
@@ -140,8 +142,6 @@ def upload_file_to_s3(instanceid):
         else:
             logger.error(f"[ERROR] (Task) Writing signature file ({sig_file_name}) to s3 has failed! (No signature was found to create the asc file)")
 
-    update_config_json()
-
 
 def update_binaries():
 
@@ -16,14 +16,18 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
-from unittest import skipIf
+from unittest import mock, skipIf
 
 from django.conf import settings
-from django.test import TestCase
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from strawberry.relay.utils import to_base64
 from paskoocheh.schema import schema
 
-from tools.models import Tool, ToolType, Version, VersionCode, HomeFeaturedTool
-from stats.models import VersionDownload, VersionRating
+from tools.configfile import get_tool_infos, get_tools, get_version_fragments, splice_version_fragments
+from tools.models import Faq, Guide, Tool, ToolType, Version, VersionCode, HomeFeaturedTool
+from stats.models import VersionDownload, VersionRating, VersionReview
 from preferences.models import Platform
 
 
@@ -153,6 +157,53 @@ class ToolAPITestCase(TestCase):
             version=self.version,
             **verison_code_dict)
 
+        self.tool_dict = tool_dict
+        self.version_dict = version_dict
+
+    def create_tool_with_stats(self, index):
+        tool_dict = self.tool_dict.copy()
+        tool_dict['name'] = f'Extra Tool {index}'
+        tool_dict['slug'] = f'extratool{index}'
+        tool = Tool.objects.create(**tool_dict)
+        tool.tooltype.add(self.tool_type)
+
+        Version.objects.create(
+            tool=tool,
+            supported_os=self.platform,
+            **self.version_dict)
+        VersionDownload.objects.create(
+            tool_name=tool.name,
+            tool=tool,
+            platform_name='android',
+            download_count=index)
+        VersionRating.objects.create(
+            tool_name=tool.name,
+            tool=tool,
+            platform_name='android',
+            star_rating='3.0')
+
+        return tool
+
+    def count_queries(self, query, variable_values=None):
+        with CaptureQueriesContext(connection) as queries:
+            response = schema.execute_sync(query, variable_values=variable_values)
+
+        self.assertIsNone(response.errors)
+
+        return len(queries)
+
+    def assertQueryCountIndependentOfNodes(self, query, variable_values=None):
+        """
+        Assert that a query doesn't issue more SQL queries when it resolves
+        more nodes (i.e. that nested relations are batched)
+        """
+        query_count = self.count_queries(query, variable_values)
+
+        for index in range(5):
+            self.create_tool_with_stats(index)
+
+        self.assertEqual(self.count_queries(query, variable_values), query_count)
+
     def test_versions_query(self):
         versions_query = """
             query(
@@ -550,3 +601,240 @@ class ToolAPITestCase(TestCase):
         HomeFeaturedTool.objects.update(tool=None)
         response = schema.execute_sync(home_page_featured_tool_query)
         self.assertEqual(response.data['homePageFeaturedTool'], None)
+
+    def test_tools_query_count(self):
+        tools_query = """
+            {
+                tools(first: 50) {
+                    edges {
+                        node {
+                            name
+                            availablePlatforms
+                            toolTypes {
+                                slug
+                            }
+                            images {
+                                image
+                            }
+                            teamAnalysis {
+                                review
+                            }
+                            faqs {
+                                edges {
+                                    node {
+                                        headline
+                                    }
+                                }
+                            }
+                            info {
+                                edges {
+                                    node {
+                                        name
+                                    }
+                                }
+                            }
+                            versions {
+                                edges {
+                                    node {
+                                        versionNumber
+                                        downloadCount
+                                        averageRating {
+                                            starRating
+                                        }
+                                        platform {
+                                            slugName
+                                        }
+                                    }
+                                }
+                            }
+                        }
+                    }
+                }
+            }
+            """
+
+        self.assertQueryCountIndependentOfNodes(tools_query)
+
+    def test_versions_query_count(self):
+        versions_query = """
+            query($platformSlug: String) {
+                versions(platformSlug: $platformSlug, first: 50) {
+                    edges {
+                        node {
+                            versionNumber
+                            downloadCount
+                            averageRating {
+                                starRating
+                            }
+                            platform {
+                                slugName
+                            }
+                            tool {
+                                name
+                                toolTypes {
+                                    slug
+                                }
+                                images {
+                                    image
+                                }
+                            }
+                            guides {
+                                edges {
+                                    node {
+                                        headline
+                                    }
+                                }
+                            }
+                            tutorials {
+                                edges {
+                                    node {
+                                        title
+                                    }
+                                }
+                            }
+                            reviews {
+                                edges {
+                                    node {
+                                        rating
+                                    }
+                                }
+                            }
+                        }
+                    }
+                }
+            }
+            """
+
+        self.assertQueryCountIndependentOfNodes(
+            versions_query,
+            {'platformSlug': 'android'})
+
+    def test_versions_reviews_page(self):
+        """
+        Assert that a page of reviews holds the right reviews of every
+        version, and counts all of them
+        """
+        for tool in (self.tool, self.tool_1):
+            for rating in ('1.0', '2.0', '3.0', '4.0'):
+                VersionReview.objects.create(
+                    tool_name=tool.name,
+                    tool=tool,
+                    platform_name='android',
+                    rating=rating)
+
+        reviews_query = """
+            query($after: String) {
+                versions(platformSlug: "android", first: 50) {
+                    edges {
+                        node {
+                            tool {
+                                slug
+                            }
+                            reviews(first: 2, after: $after, orderBy: ["-rating"]) {
+                                totalCount
+                                pageInfo {
+                                    hasNextPage
+                                }
+                                edges {
+                                    node {
+                                        rating
+                                    }
+                                }
+                            }
+                        }
+                    }
+                }
+            }
+            """
+
+        for after, ratings, has_next_page in ((None, ['4.0', '3.0'], True),
+                                              (to_base64('arrayconnection', 1), ['2.0', '1.0'], False)):
+            response = schema.execute_sync(reviews_query, variable_values={'after': after})
+            self.assertIsNone(response.errors)
+
+            reviews = {
+                edge['node']['tool']['slug']: edge['node']['reviews']
+                for edge in response.data['versions']['edges']
+            }
+
+            for slug in ('tool', 'tool1'):
+                self.assertEqual(reviews[slug]['totalCount'], 4)
+                self.assertEqual(reviews[slug]['pageInfo']['hasNextPage'], has_next_page)
+                self.assertEqual(
+                    [str(edge['node']['rating']) for edge in reviews[slug]['edges']],
+                    ratings)
+
+            self.assertEqual(reviews['tool2']['totalCount'], 0)
+
+    def count_config_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            get_tools(get_tool_infos())
+            splice_version_fragments(get_version_fragments())
+
+        return len(queries)
+
+    def test_config_query_count(self):
+        """
+        Assert that building the config documents doesn't issue more SQL
+        queries for a larger catalog
+        """
+        query_count = self.count_config_queries()
+
+        for index in range(5):
+            tool = self.create_tool_with_stats(index)
+            version = tool.versions.get()
+
+            VersionCode.objects.create(
+                version=version,
+                version_code=index,
+                uploaded_file='',
+                checksum=None,
+                size=0,
+                signature=None,
+                sig_file='')
+            Faq.objects.create(tool=tool, headline='Tool question', body='Answer')
+            Faq.objects.create(tool=tool, version=version, headline='Version question', body='Answer')
+            Guide.objects.create(version=version, headline='Step', body='Body')
+
+        self.assertEqual(self.count_config_queries(), query_count)
+
+    def get_fragments(self, changed_version_ids=None):
+        return {
+            fragment['version']['id']: fragment
+            for fragment in get_version_fragments(changed_version_ids)
+        }
+
+    def test_version_change_rerenders_fragment(self):
+        """
+        Assert that saving a Version schedules the re-rendering of its config
+        fragment
+        """
+        self.get_fragments()
+
+        self.version.version_number = '001'
+        with override_settings(BUILD_ENV='production'), \
+                mock.patch('paskoocheh.config_updates.schedule_config_update') as schedule_config_update:
+            self.version.save()
+
+        schedule_config_update.assert_called_once_with('tools', {self.version.id})
+
+        fragments = self.get_fragments(schedule_config_update.call_args[0][1])
+        self.assertEqual(fragments[self.version.id]['version']['version_number'], '001')
+
+    def test_version_fragments_reused(self):
+        """
+        Assert that only the fragments of changed Versions are re-rendered,
+        and that every fragment is re-rendered when the changed Versions
+        aren't known
+        """
+        self.get_fragments()
+
+        # Changed without signals, so that the cached fragments are stale
+        Version.objects.filter(id__in=[self.version.id, self.version_1.id]).update(version_number='001')
+
+        fragments = self.get_fragments({self.version.id})
+        self.assertEqual(fragments[self.version.id]['version']['version_number'], '001')
+        self.assertEqual(fragments[self.version_1.id]['version']['version_number'], '000')
+
+        fragments = self.get_fragments()
+        self.assertEqual(fragments[self.version_1.id]['version']['version_number'], '001')
@@ -17,20 +17,24 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 import os
-import hashlib
 import pytz
 import socket
 import requests
 import logging
 import time
 import math
+import shutil
+import threading
 import zipfile
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from datetime import datetime
 from pyaxmlparser import APK as apk_parser
 from tools.tools_settings import TOOLS_PATH, SPLITS_PATH
 from django.conf import settings
-from django.core.files import File
-from tempfile import SpooledTemporaryFile
+from django.db import connection
+from tools import apk_cache
 from tools.libs.gpapi.googleplay import GooglePlayAPI
 from tools.models import Version, AndroidSplitFile, VersionCode
 from preferences.models import (
@@ -50,6 +54,31 @@ ABI_SPLIT_TYPES = ['arm64_v8a', 'armeabi_v7a', 'armeabi', 'x86_64', 'x86']
 logger = logging.getLogger('updater')
 
 
+class RateLimiter(object):
+    """
+        Spaces out calls made from several threads so that
+        at most rate calls are made per second
+    """
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate > 0 else 0
+        self.next_call = 0
+        self.lock = threading.Lock()
+
+    def wait(self):
+        """
+            Block until the next call is allowed
+        """
+
+        with self.lock:
+            now = time.monotonic()
+            delay = self.next_call - now
+            self.next_call = max(now, self.next_call) + self.interval
+
+        if delay > 0:
+            time.sleep(delay)
+
+
 class Updater(object):
     """
         Class to download latest versions of
@@ -70,6 +99,35 @@ class Updater(object):
         self.device_codename = None
         self.device_name = None
 
+        # Shared by the worker threads updating the apps of a device
+        self.rate_limiter = RateLimiter(settings.UPDATER_REQUESTS_PER_SECOND)
+
+        # Seconds spent in each phase of update_apks
+        self.timings = defaultdict(float)
+
+    @contextmanager
+    def timed(self, phase):
+        """
+            Add the time spent in the block to the timing of a phase
+        """
+
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.timings[phase] += time.monotonic() - started
+
+    def report_timings(self):
+        """
+            Log and add the time spent in each phase of update_apks to the messages
+        """
+
+        timings = ', '.join(
+            f"{phase}: {seconds:.1f}s" for phase, seconds in self.timings.items())
+        msg = f"[INFO] Time spent per phase ({timings})"
+        logger.info(msg)
+        self.messages.append(msg)
+
     def first_login(self, user, password):
         """
             Login to Google Play Store without a token
@@ -234,7 +292,8 @@ class Updater(object):
                     if not self.logged_in:
                         logger.warning(f"Not logged in, logging in as [{self.device_name} | {self.device_codename}]")
                         retry_again = True
-                        rc = self.login(self.device_codename)
+                        with self.timed('login'):
+                            rc = self.login(self.device_codename)
                         if rc < 0:
                             msg = f"[ERROR] Unable to login to google as [{self.device_codename}]. " \
                                 "Unlocking the account might be needed from: " \
@@ -245,28 +304,26 @@ class Updater(object):
                             continue
                         self.logged_in = True
 
-                    # update each android version
-                    for j, tool in enumerate(android_tools, start=1):
-                        toolname = tool.tool.name
-                        if tool.tool.publishable is False:
-                            continue
-                        # TODO: since we have to add each device to their respected version code,
-                        # we have to run the download tool part, check whether this can be optimized or not?
-                        # if (toolname in updated_apps and tool.is_bundled_app is False):
-                        #     msg = f"[INFO] [{toolname}] is an unbundled app that has already been " \
-                        #         "updated from a previous device. No need to update it again!"
-                        #     logger.info(msg)
-                        #     self.messages.append(msg)
-                        #     continue
-
-                        logger.info(f"### [{j}] {toolname} ###\n"
-                                    f"=> Attempting to update the existing version of {toolname} ...")
-                        app = self.download_tool(tool)
+                    publishable_tools = [tool for tool in android_tools if tool.tool.publishable is not False]
+
+                    # Skip the apps whose latest version code has already been
+                    # downloaded, they only need the device to be added
+                    with self.timed('details'):
+                        up_to_date = self.get_up_to_date_version_codes(publishable_tools)
+                        self.add_device_to_version_codes(up_to_date.values(), device)
+
+                    pending_tools = [tool for tool in publishable_tools if tool.id not in up_to_date]
+
+                    # update each remaining android version, a few at a time
+                    with self.timed('download'):
+                        with ThreadPoolExecutor(max_workers=settings.UPDATER_MAX_WORKERS) as executor:
+                            apps = list(executor.map(self.update_tool, pending_tools))
+
+                    for tool, app in zip(pending_tools, apps):
                         if app:
-                            updated_apps.append(toolname)
+                            updated_apps.append(tool.tool.name)
                         if app and tool.is_bundled_app:
                             updated_bundled_apps.append(tool)
-                        time.sleep(1)
 
                     if retry_again:
                         retry_again = False
@@ -277,7 +334,6 @@ class Updater(object):
                     self.logged_in = False
                     prefs.token = None
                     prefs.save()
-                    time.sleep(5)
 
         if len(updated_bundled_apps) > 0:
             msg = "\n[INFO] Updating for all devices has finished. Moving on to zipping (bundling) updated bundled apps..."
@@ -292,8 +348,9 @@ class Updater(object):
             for bundled_app in updated_bundled_apps:
                 version_codes = VersionCode.objects.filter(version=bundled_app)
                 for version_code_obj in version_codes:
-                    zf = self.create_bundle(bundled_app, version_code_obj)
-                    size = zf.tell()
+                    with self.timed('bundle'):
+                        zf = self.create_bundle(bundled_app, version_code_obj)
+                    size = zf.size
                     logger.info(f"Size of zip file = {size}")
                     if size > 0:
                         appname = bundled_app.tool.get_app_name()
@@ -303,10 +360,13 @@ class Updater(object):
 
                         version_code_obj.size = size
                         version_code_obj.uploaded_file.name = filepath
-                        # This save will calculate the PGP signature and checksum
-                        # for the bundled app based on the zip file
-                        version_code_obj.uploaded_file.save(
-                            filepath, File(zf), save=True)
+                        # This save will calculate the PGP signature and checksum for
+                        # the bundled app from the hash of the zip file calculated
+                        # while it was written
+                        with zf:
+                            version_code_obj.uploaded_file.save(
+                                filepath, zf, save=False)
+                            version_code_obj.save(release_file=zf)
 
                         extension = version_code_obj.uploaded_file.name.split(
                             '.')[-1].lower()
@@ -322,6 +382,8 @@ class Updater(object):
         # remove duplicate elements
         updated_apps = list(set(updated_apps))
 
+        self.report_timings()
+
         # send summary email
         self.conclude(updated_apps, self.messages)
 
@@ -340,7 +402,7 @@ class Updater(object):
             bundled_app: A bundled app object (Version object)
 
             Returns:
-            A zip file (bundle) as a SpooledTemporaryFile
+            The zip file (bundle) as an apk_cache.MappedFile
         """
         toolname = bundled_app.tool.name
         logger.info(f"[INFO] Zipping the base apk along with all splits for [{toolname}] and version code [{version_code.version_code}]...")
@@ -357,80 +419,112 @@ class Updater(object):
         # Add the base to the splits list
         splits.append(base)
 
-        temp = SpooledTemporaryFile(max_size=60000000)  # 60 MB
         added_types = []
 
-        # Writing files to a zipfile
-        with zipfile.ZipFile(temp, 'w', zipfile.ZIP_DEFLATED) as zip:
-            # Writing each file one by one (base + splits)
-            for apk in splits:
-                arcname = apk.name.split('/')[-1]
-                split_type = arcname.split('.')[1]
-
-                # This will ensure that there is always ONLY one split for each
-                # split type (e.g. No 2 versions of arm64_v8a.apk) written in
-                # the zip file, otherwise, the zip file will not be installable
-                if split_type in added_types:
-                    continue
-
-                # Ensure that the largest split variation will be picked
-                # as it is needed to make the zip file installable for all devices
-                # regardless of the 'extractNativeLibs' value of the AndroidManifest.xml
-                # of the base.apk
-                if split_type in ABI_SPLIT_TYPES:
-                    variations = [
-                        split for split in splits if split_type in split.name]
+        # Writing files to a zipfile, streamed into the cache entry by entry
+        # and hashed (size and checksum) as it's written
+        with apk_cache.BlobWriter() as writer:
+            with zipfile.ZipFile(writer, 'w', zipfile.ZIP_DEFLATED) as zip:
+                # Writing each file one by one (base + splits)
+                for apk in splits:
+                    arcname = apk.name.split('/')[-1]
+                    split_type = arcname.split('.')[1]
+
+                    # This will ensure that there is always ONLY one split for each
+                    # split type (e.g. No 2 versions of arm64_v8a.apk) written in
+                    # the zip file, otherwise, the zip file will not be installable
+                    if split_type in added_types:
+                        continue
+
+                    # Ensure that the largest split variation will be picked
+                    # as it is needed to make the zip file installable for all devices
+                    # regardless of the 'extractNativeLibs' value of the AndroidManifest.xml
+                    # of the base.apk
+                    if split_type in ABI_SPLIT_TYPES:
+                        variations = [
+                            split for split in splits if split_type in split.name]
+
+                        if len(variations) > 0:
+                            apk = max(variations, key=attrgetter('size'))
+                            arcname = apk.name.split('/')[-1]
+
+                    logger.info(f"Zipping [{apk.name}] as [{arcname}]...")
+
+                    name = 'base' if apk == base else arcname
+                    checksum = Updater.get_bundle_file_checksum(bundled_app, version_code, apk, name)
+                    if checksum is None:
+                        logger.error(f"Zipping [{apk.name}] as [{arcname}] has failed!")
+                    else:
+                        # Copy the cached apk into the zip file without
+                        # reading it into memory
+                        with apk_cache.open_file(checksum) as apk_file, zip.open(arcname, 'w') as entry:
+                            shutil.copyfileobj(apk_file, entry, apk_cache.CHUNK_SIZE)
 
-                    if len(variations) > 0:
-                        apk = max(variations, key=attrgetter('size'))
-                        arcname = apk.name.split('/')[-1]
+                    added_types.append(split_type)
 
-                logger.info(f"Zipping [{apk.name}] as [{arcname}]...")
+            checksum = writer.commit()
 
-                if settings.BUILD_ENV == 'local':
-                    apk_path = f"{settings.MEDIA_ROOT}/{apk.name}"
-                    zip.write(apk_path, arcname)
-                else:
-                    # HTTP GET the apk from S3 and then create a file
-                    # out of the content (data) of the response
-                    # into the zip file
-                    r = requests.get(apk.url)
-                    if r.status_code == 200:
-                        zip.writestr(arcname, r.content)
-                    else:
-                        logger.error(f"Zipping [{apk.name}] as [{arcname}] has failed!")
+        logger.info(f"[INFO] Zip file (bundle) of [{writer.size}] bytes written with checksum [{checksum}]")
+        apk_cache.link(bundled_app.package_name, version_code.version_code, 'bundle', checksum)
+
+        bundle = apk_cache.open_file(checksum)
+
+        # Lets VersionCode.save sign the bundle without reading it again
+        bundle.digest = writer.digest
+
+        return bundle
+
+    @staticmethod
+    def get_bundle_file_checksum(bundled_app, version_code, apk, name):
+        """
+            Return the checksum of a file (base or split) of a bundle
+            in the APK cache, fetching it into the cache if needed
+
+            Args:
+            bundled_app: A bundled app object (Version object)
+            version_code: The VersionCode object of the bundle
+            apk: The FieldFile of the base or split
+            name: 'base' or the name of the split
 
-                added_types.append(split_type)
+            Returns:
+            The checksum of the cached file, None if it couldn't be fetched
+        """
+
+        package = bundled_app.package_name
+        checksum = apk_cache.get_checksum(package, version_code.version_code, name)
+        if checksum is not None:
+            return checksum
+
+        if settings.BUILD_ENV == 'local':
+            with open(f"{settings.MEDIA_ROOT}/{apk.name}", 'rb') as apk_file:
+                checksum = apk_cache.store(iter(lambda: apk_file.read(apk_cache.CHUNK_SIZE), b''))
+        else:
+            # HTTP GET the apk from S3 and stream the
+            # content (data) of the response into the cache
+            with requests.get(apk.url, stream=True) as r:
+                if r.status_code != 200:
+                    return None
+                checksum = apk_cache.store(r.iter_content(chunk_size=apk_cache.CHUNK_SIZE))
 
-        temp.flush()
+        apk_cache.link(package, version_code.version_code, name, checksum)
 
-        return temp
+        return checksum
 
     @staticmethod
-    def download_file(url, tempfile):
+    def download_file(url):
         """
-            Download a file from a URL
+            Download a file from a URL into the APK cache
 
             Args:
             url: the URL to download from
-            tempfile: a file object to store the content
 
             Returns:
             checksum of the file in case of success, None otherwise
         """
-        if not tempfile:
-            return None
-
-        hasher = hashlib.sha256()
-        r = requests.get(url)
-        if r.status_code == 200:
-            for chunk in r.iter_content(chunk_size=1024):
-                if chunk:       # filter out keep-alive new chunks
-                    hasher.update(chunk)
-                    tempfile(chunk)
 
-            tempfile.flush()
-            return hasher.hexdigest()
+        with requests.get(url, stream=True) as r:
+            if r.status_code == 200:
+                return apk_cache.store(r.iter_content(chunk_size=apk_cache.CHUNK_SIZE))
 
         return None
 
@@ -536,28 +630,6 @@ class Updater(object):
         s = round(size_bytes / p, 2)
         return f"{s} {size_name[i]}"
 
-    def write_temp_file_to_memory(self, data, max_size=50000000):
-        """
-            Write file data into a temporary file in memory
-
-            Args:
-            data: The data to be written into a temporary file
-            max_size: The size of the file to be created
-                in memory in bytes with a default of 50 MB
-
-            Returns:
-            The temporary file created in memory
-        """
-
-        temp = SpooledTemporaryFile(max_size=max_size)
-
-        # Write temp file in memory
-        for chunk in data:
-            temp.write(chunk)
-        temp.flush()
-
-        return temp
-
     def get_latest_from_url(self, tool):
         """
             Download the latest APK from a URL
@@ -575,19 +647,19 @@ class Updater(object):
             self.messages.append(msg)
             return False
 
-        temp = SpooledTemporaryFile(max_size=153600)
-        checksum = Updater.download_file(tool.download_url, temp)
+        checksum = Updater.download_file(tool.download_url)
         if checksum is None:
             msg = f'[ERROR] Error in downloading file for tool {tool}'
             logger.error(msg)
             self.messages.append(msg)
             return
 
-        downloaded_apk = apk_parser.APK(temp.name)
+        downloaded_apk = apk_parser.APK(apk_cache.get_blob_path(checksum))
         ver_str = downloaded_apk.get_androidversion_name()
         ver_code = int(downloaded_apk.get_androidversion_code())
         permissions = ','.join(downloaded_apk.get_permissions())
-        size = os.fstat(temp.fileno()).st_size
+        size = os.path.getsize(apk_cache.get_blob_path(checksum))
+        apk_cache.link(tool.package_name, ver_code, 'base', checksum)
         rel_date = datetime.now()
         rel_date = pytz.timezone('Iran').localize(rel_date, is_dst=None)
 
@@ -644,11 +716,12 @@ class Updater(object):
             if version_code_obj.uploaded_file.storage.exists(filename):
                 version_code_obj.uploaded_file.storage.delete(filename)
 
-        version_code_obj.uploaded_file.save(filename, File(temp), save=False)
-        version_code_obj.uploaded_file.name = filename
-        version_code_obj.checksum = checksum
-        version_code_obj.size = size
-        version_code_obj.save()
+        with apk_cache.open_file(checksum) as apk_file:
+            version_code_obj.uploaded_file.save(filename, apk_file, save=False)
+            version_code_obj.uploaded_file.name = filename
+            version_code_obj.checksum = checksum
+            version_code_obj.size = size
+            version_code_obj.save(release_file=apk_file)
 
         # Updating tool
         tool.permissions = permissions
@@ -687,6 +760,7 @@ class Updater(object):
 
         details = None
         try:
+            self.rate_limiter.wait()
             details = self.api.details(app)
         except Exception as error:
             if "not found" in str(error):
@@ -738,6 +812,7 @@ class Updater(object):
 
         # Getting app data from google
         try:
+            self.rate_limiter.wait()
             app_data = self.api.delivery(app, ver_code, offer)
         except Exception as e:
             msg = f"[ERROR] {toolname} [{app}] Unable to download app due to: [{e}]"
@@ -860,12 +935,12 @@ class Updater(object):
                 current_split_size = self.convert_size(int(splitfile.size))
 
                 if created:
-                    split_temp = self.write_temp_file_to_memory(
-                        data=split_data, max_size=50000000)
-                    logger.info(f"Split temp file created in memory: {split_temp}")
+                    split_checksum = apk_cache.cache_file(app, ver_code, splitname, split_data)
+                    logger.info(f"Split file cached: {split_checksum}")
 
-                    splitfile.split_file.save(
-                        split_path, File(split_temp), save=False)
+                    with apk_cache.open_file(split_checksum) as split_file:
+                        splitfile.split_file.save(
+                            split_path, split_file, save=False)
                     splitfile.split_file.name = split_path
 
                     logger.info(f"A new SplitFile object has been created with the name: [{splitname}] "
@@ -906,10 +981,9 @@ class Updater(object):
             logger.warning(f"{toolname} [{app}] updating base file into version code {version_code_obj.version_code}...")
 
             base_data = app_data.get('file').get('data')
-            base_temp = self.write_temp_file_to_memory(
-                data=base_data, max_size=100000000)
+            base_checksum = apk_cache.cache_file(app, ver_code, 'base', base_data)
 
-            logger.info(f"Base temp file created in memory: {base_temp}")
+            logger.info(f"Base file cached: {base_checksum}")
 
             new_size = self.convert_size(int(size))
 
@@ -925,8 +999,10 @@ class Updater(object):
             # This save will calculate the PGP signature and checksum, based on the uploaded_file,
             # for unbundled apps only. Bundeld apps (zipped) will have their signautres and checksums
             # calculated in the bundling (zipping) stage
-            version_code_obj.uploaded_file.save(
-                filename, File(base_temp), save=True)
+            with apk_cache.open_file(base_checksum) as base_file:
+                version_code_obj.uploaded_file.save(
+                    filename, base_file, save=False)
+                version_code_obj.save(release_file=base_file)
 
             msg = f"[INFO] Updated the version [{tool.version_number}] in database successfully for [{filename}] " \
                 f"for version code [{version_code_obj.version_code}] size ({new_size}) " \
@@ -942,22 +1018,120 @@ class Updater(object):
 
             Args,
             app_list: a list of the package_names to be downloaded
+
+            Returns,
+            A dict of the app details by package name, for the apps found
         """
 
         if len(app_list) == 0:
-            return False
+            return {}
+
+        self.rate_limiter.wait()
+        docs = self.api.bulkDetails(app_list)
+
+        app_details = {}
+        for app, doc in zip(app_list, docs):
+            if not doc:
+                continue
+
+            app_details[app] = doc['details']['appDetails']
+            logger.info(f"\t{app}: versionString = {app_details[app].get('versionString', None)} | "
+                        f"versionCode = {app_details[app].get('versionCode', None)}")
+
+        return app_details
+
+    def get_up_to_date_version_codes(self, tools):
+        """
+            Find the Google Play Store versions whose latest version code
+            has already been downloaded, with a single bulkDetails request
+
+            Args:
+            tools: Version objects to check
+
+            Returns:
+            A dict of the downloaded VersionCode objects by Version id
+        """
+
+        google_tools = [
+            tool for tool in tools
+            if tool.package_name and '//play.google.com/' in tool.download_url
+        ]
+
+        try:
+            app_details = self.get_latest_version_bulk([tool.package_name for tool in google_tools])
+        except Exception as e:
+            logger.error(f"[ERROR] Retrieving bulk details failed, checking every app one by one (error={e})")
+            return {}
+
+        latest_version_codes = {}
+        for tool in google_tools:
+            details = app_details.get(tool.package_name)
+            if details and details.get('versionString', None) == tool.version_number:
+                latest_version_codes[tool.id] = details.get('versionCode', None)
+
+        up_to_date = {}
+        for version_code_obj in VersionCode.objects \
+                .filter(version_id__in=latest_version_codes) \
+                .select_related('version'):
+            if latest_version_codes[version_code_obj.version_id] != version_code_obj.version_code:
+                continue
+
+            # Bundled apps without a bundle (zip file) yet are still checked
+            # for more distinct splits by get_latest_from_google
+            extension = version_code_obj.uploaded_file.name.split('.')[-1].lower()
+            if version_code_obj.version.is_bundled_app and extension == 'apk':
+                continue
 
-        details = self.api.bulkDetails(app_list)
-        for d in details.entry:
-            doc = d.doc
-            app_details = doc['details']['appDetails']
-            ver_str = app_details.get('versionString', None)
-            ver_code = app_details.get('versionCode', None)
-            offer_type = doc['offer'][0]['offerType']
-            logger.info(doc)
-            logger.info(f'\tversionString = {ver_str}')
-            logger.info(f'\tversionCode = {ver_code}')
-            logger.info(f'\tofferType = {offer_type}')
+            up_to_date[version_code_obj.version_id] = version_code_obj
+
+        return up_to_date
+
+    def add_device_to_version_codes(self, version_codes, device):
+        """
+            Add a device to the devices of up-to-date version codes,
+            as get_latest_from_google would have
+
+            Args:
+            version_codes: VersionCode objects
+            device: AndroidDeviceProfile object
+        """
+
+        for version_code_obj in version_codes:
+            try:
+                version_code_obj.devices.add(device)
+            except Exception as e:
+                logger.error(f"Unable to add the current device to the devices of the version code [{version_code_obj.version_code}] due to:\n{e}")
+                continue
+
+            msg = f"[INFO] {version_code_obj.version.tool.name} [{version_code_obj.version.package_name}] is up-to-date " \
+                f"(version: {version_code_obj.version.version_number}) | (version code: {version_code_obj.version_code})"
+            logger.info(msg)
+            self.messages.append(msg)
+
+    def update_tool(self, tool):
+        """
+            Download a tool from a worker thread of update_apks
+
+            Args:
+            tool: A version instance of the tool to be downloaded
+
+            Returns:
+            True if updated, None or False otherwise (see download_tool)
+        """
+
+        toolname = tool.tool.name
+        logger.info(f"### {toolname} ###\n"
+                    f"=> Attempting to update the existing version of {toolname} ...")
+        try:
+            return self.download_tool(tool)
+        except Exception as e:
+            msg = f"[ERROR] Updating {toolname} has failed due to: {e}"
+            logger.error(msg)
+            self.messages.append(msg)
+            return None
+        finally:
+            # Worker threads get their own database connections
+            connection.close()
 
     def download_tool(self, tool):
         """
@@ -19,16 +19,30 @@
 u"""webfrontend responses cache decorator."""
 
 from django.conf import settings
-from django.utils.decorators import method_decorator
-from fancy_cache import cache_page
-from webfrontend.caches.utils import cache_key_data_to_cache_key
+from django.core.cache import cache
+from django.utils.cache import get_cache_key, learn_cache_key
+from django.utils.decorators import (
+    decorator_from_middleware_with_args,
+    method_decorator,
+)
+from fancy_cache.middleware import FancyCacheMiddleware
+from webfrontend.caches.responses.revalidation import (
+    schedule_revalidation,
+    store_request_data,
+)
+from webfrontend.caches.utils import (
+    cache_key_data_to_cache_key,
+    get_stale_response_cache_key,
+    index_cached_response,
+)
 from webfrontend.utils.general import is_request_user_agent_noop
+from webfrontend.utils.response import add_response_splice_plan
 
 
 # =======================
 # === Cache decorator ===
 # =======================
-def get_cache_key_prefix(request):
+def get_cache_key_data(request):
     # Data included in every key
     cache_key_data = {
         u'cache_type': u'response',
@@ -48,18 +62,74 @@ def get_cache_key_prefix(request):
         cache_key_data_key = u'q_{key}'.format(key=key)
         cache_key_data[cache_key_data_key] = request.GET[key]
 
+    return cache_key_data
+
+
+def get_cache_key_prefix(request):
     # Compile cache key
-    cache_key_prefix = cache_key_data_to_cache_key(cache_key_data)
+    cache_key_prefix = cache_key_data_to_cache_key(get_cache_key_data(request))
 
     return cache_key_prefix
 
 
+def get_post_process_response(timeout):
+    def post_process_response(response, request):
+        response = add_response_splice_plan(response, request)
+
+        # Index the key fancy_cache is about to store the response under, so
+        # it can be purged without scanning the keyspace. Only the page key
+        # is indexed: once it is deleted, the header key left behind can't
+        # produce a hit and expires on its own.
+        cache_key_data = get_cache_key_data(request)
+        cache_key = learn_cache_key(
+            request,
+            response,
+            timeout,
+            cache_key_data_to_cache_key(cache_key_data),
+        )
+        index_cached_response(cache_key_data, cache_key, timeout)
+
+        if settings.WEBFRONTEND_CACHE_RESPONSE_REWARM:
+            store_request_data(cache_key, request, timeout)
+
+        return response
+
+    return post_process_response
+
+
+class StaleWhileRevalidateCacheMiddleware(FancyCacheMiddleware):
+    u"""
+    fancy_cache middleware that revalidates stale cached responses (see
+    webfrontend.caches.utils.mark_cached_responses_stale) in the background
+    while serving them.
+    """
+
+    def process_request(self, request):
+        # Revalidation requests (see revalidation.py) bypass the cached
+        # response so the view renders and caches a fresh one
+        if getattr(request, 'pk_cache_revalidate', False):
+            request._cache_update_cache = True
+            return None
+
+        response = super().process_request(request)
+
+        if response is not None and settings.WEBFRONTEND_CACHE_RESPONSE_STALE_WHILE_REVALIDATE:
+            cache_key = get_cache_key(request, self.key_prefix(request), 'GET', cache=self.cache)
+
+            if cache_key is not None and cache.get(get_stale_response_cache_key(cache_key)):
+                schedule_revalidation(cache_key, request)
+
+        return response
+
+
 def pk_cache_response(timeout=settings.WEBFRONTEND_CACHE_RESPONSE_TIMEOUT):
     if settings.WEBFRONTEND_CACHE_RESPONSE_ENABLED:
         return method_decorator(
-            cache_page(
-                timeout,
+            decorator_from_middleware_with_args(StaleWhileRevalidateCacheMiddleware)(
+                page_timeout=timeout,
+                cache_alias=None,
                 key_prefix=get_cache_key_prefix,
+                post_process_response=get_post_process_response(timeout),
             )
         )
     else:
@@ -0,0 +1,206 @@
+# coding: utf-8
+# Paskoocheh - A tool marketplace for Iranian
+#
+# Copyright (C) 2024 ASL19 Organization
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+u"""
+webfrontend responses cache revalidation.
+
+Stale responses (see webfrontend.caches.utils.mark_cached_responses_stale)
+are re-rendered by replaying the request they were cached for through the
+full middleware stack in a background thread, so the request that found the
+stale response (and every other one until the revalidation is done) is
+served the stale copy. A lock makes sure a response is only re-rendered by
+one worker at a time.
+"""
+
+import logging
+import threading
+from django.conf import settings
+from django.core.cache import cache
+from django.core.handlers.wsgi import WSGIHandler
+from django.db import connections
+from django.test import RequestFactory
+from webfrontend.caches.utils import (
+    delete_cached_response,
+    get_response_request_cache_key,
+    get_response_revalidation_lock_cache_key,
+)
+
+logger = logging.getLogger(__name__)
+
+_handler = None
+_handler_lock = threading.Lock()
+
+
+# ========================
+# === Helper functions ===
+# ========================
+def get_handler():
+    global _handler
+
+    with _handler_lock:
+        if _handler is None:
+            _handler = WSGIHandler()
+
+    return _handler
+
+
+def get_request_data(request):
+    u"""
+    Return what is needed to replay a request for its cached response.
+
+    Cookies are dropped except for the global_platform cookie, which is part
+    of the response cache key.
+    """
+    meta = {
+        key: value
+        for key, value in request.META.items()
+        if key.startswith('HTTP_') and key != 'HTTP_COOKIE'
+    }
+
+    global_platform_cookie = request.COOKIES.get('global_platform')
+    if global_platform_cookie is not None:
+        meta['HTTP_COOKIE'] = u'global_platform={}'.format(global_platform_cookie)
+
+    return {
+        'path': request.path,
+        'query_string': request.META.get('QUERY_STRING', ''),
+        'secure': request.is_secure(),
+        'meta': meta,
+    }
+
+
+def store_request_data(cache_key, request, timeout):
+    u"""Store the request a response is cached for, to rewarm it later."""
+    cache.set(get_response_request_cache_key(cache_key), get_request_data(request), timeout)
+
+
+# ====================
+# === Revalidation ===
+# ====================
+def acquire_revalidation_lock(cache_key):
+    return cache.add(
+        get_response_revalidation_lock_cache_key(cache_key),
+        True,
+        settings.WEBFRONTEND_CACHE_RESPONSE_REVALIDATION_LOCK_TIMEOUT,
+    )
+
+
+def revalidate_response(cache_key, request_data):
+    """
+    Re-render a stale response and release its revalidation lock. The stale
+    response is deleted if the re-rendered one isn't a 200 response.
+
+    Args:
+        cache_key (str): Cache key of the response (its revalidation lock
+            must be held, see acquire_revalidation_lock)
+        request_data (dict): Request the response was cached for (see
+            get_request_data)
+
+    Returns:
+        None
+    """
+    try:
+        request = RequestFactory().get(
+            request_data['path'],
+            secure=request_data['secure'],
+            QUERY_STRING=request_data['query_string'],
+            **request_data['meta']
+        )
+
+        # Makes the cache middleware skip the (stale) cached response and
+        # cache the re-rendered one
+        request.pk_cache_revalidate = True
+
+        response = get_handler().get_response(request)
+
+        # The re-rendered response isn't cached (e.g. the tool has been
+        # unpublished or deleted), so the stale one mustn't be served
+        if response.status_code != 200:
+            delete_cached_response(cache_key)
+
+        logger.info(u'Revalidated {path} ({status_code})'.format(
+            path=request_data['path'],
+            status_code=response.status_code,
+        ))
+    except Exception as exc:
+        logger.error(u'Revalidating {path} failed (error={exc})'.format(
+            path=request_data['path'],
+            exc=exc,
+        ))
+    finally:
+        cache.delete(get_response_revalidation_lock_cache_key(cache_key))
+
+
+def run_revalidations(revalidations, locked):
+    try:
+        for cache_key, request_data in revalidations:
+            if locked or acquire_revalidation_lock(cache_key):
+                revalidate_response(cache_key, request_data)
+    finally:
+        # Revalidation threads get their own database connections
+        connections.close_all()
+
+
+def schedule_revalidations(revalidations, locked=False):
+    u"""
+    Run revalidations, (cache key, request data) tuples, in the background.
+    Responses already being revalidated by another worker are skipped,
+    unless their locks have already been acquired (locked).
+    """
+    thread = threading.Thread(target=run_revalidations, args=[list(revalidations), locked])
+    thread.daemon = True
+    thread.start()
+
+
+def schedule_revalidation(cache_key, request):
+    """
+    Revalidate the stale response served to a request in the background,
+    unless another worker already does.
+
+    Args:
+        cache_key (str): Cache key of the response
+        request (WSGIRequest)
+
+    Returns:
+        None
+    """
+    if acquire_revalidation_lock(cache_key):
+        schedule_revalidations([(cache_key, get_request_data(request))], locked=True)
+
+
+def schedule_rewarm(cache_keys):
+    """
+    Revalidate stale responses in the background without waiting for them to
+    be requested.
+
+    Args:
+        cache_keys (set): Cache keys of the responses
+
+    Returns:
+        None
+    """
+    request_data_by_key = cache.get_many([
+        get_response_request_cache_key(cache_key)
+        for cache_key in cache_keys
+    ])
+
+    schedule_revalidations(
+        (cache_key, request_data_by_key[get_response_request_cache_key(cache_key)])
+        for cache_key in cache_keys
+        if get_response_request_cache_key(cache_key) in request_data_by_key
+    )
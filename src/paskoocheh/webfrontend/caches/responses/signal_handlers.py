@@ -241,3 +241,40 @@ def purge_versionreview(sender, **kwargs):
             u'p_platform_slug': platform_slug
         },
     )
+
+
+def purge_versionreviews(tool_platforms):
+    u"""
+    Purge the cached responses of the reviews of tool/platform pairs.
+
+    Bulk review ingestion doesn't send post_save, so this replaces the
+    per-review purge_versionreview with one purge per tool/platform pair.
+
+    Args:
+        tool_platforms (set): (tool_id, platform_slug) tuples
+
+    Returns:
+        None
+    """
+    logger.info(u'purge_versionreviews')
+
+    patterns = []
+    for tool_id, platform_slug in tool_platforms:
+        patterns.extend((
+            {
+                u'url_name': u'toolversion',
+                u'p_tool_id': tool_id,
+                u'p_platform_slug': platform_slug,
+            }, {
+                u'url_name': u'toolversionreview',
+                u'p_tool_id': tool_id,
+                u'p_platform_slug': platform_slug,
+            }, {
+                u'url_name': u'toolversionreviews',
+                u'p_tool_id': tool_id,
+                u'p_platform_slug': platform_slug
+            },
+        ))
+
+    if patterns:
+        delete_cached_responses_matching_patterns(*patterns)
@@ -21,16 +21,37 @@ u"""webfrontend stats cache signal handlers."""
 import logging
 import math
 from collections import defaultdict
-from django.core.cache import cache
+from django.db.models import (
+    Case,
+    CharField,
+    ExpressionWrapper,
+    F,
+    FloatField,
+    Sum,
+    Value,
+    When,
+)
 from stats.models import VersionDownload, VersionRating
 from webfrontend.caches.utils import (
     cache_key_data_to_cache_key,
     delete_cached_responses_matching_patterns,
+    publish_stats,
 )
 
 logger = logging.getLogger(__name__)
 
 
+# Platform slug names whose stats are displayed as an aggregate
+NORMALIZED_PLATFORM_SLUG_NAMES = {
+    'linux32': 'linux',
+    'linux_32': 'linux',
+    'linux64': 'linux',
+    'linux_64': 'linux',
+    'windows32': 'windows',
+    'windows64': 'windows',
+}
+
+
 # ========================
 # === Helper functions ===
 # ========================
@@ -45,33 +66,48 @@ def get_normalized_platform_slug_name(slug_name):
     Args:
         slug_name (str): Platform.slug_name
     """
-    if slug_name in ['linux32', 'linux_32', 'linux64', 'linux_64']:
-        return 'linux'
-    elif slug_name in ['windows32', 'windows64']:
-        return 'windows'
+    return NORMALIZED_PLATFORM_SLUG_NAMES.get(slug_name, slug_name)
 
-    return slug_name
 
+def get_normalized_platform_slug_name_expression():
+    """
+    Database counterpart of get_normalized_platform_slug_name, normalizing the
+    platform_name field of stats records.
 
-def get_tool_id_platform_key(versiondownload):
+    Returns:
+        Case
     """
-    Given a versiondownload object, return a
-    "{tool_id}_{platform_slug_name}" key.
+    slug_names_by_normalized = defaultdict(list)
+    for slug_name, normalized in NORMALIZED_PLATFORM_SLUG_NAMES.items():
+        slug_names_by_normalized[normalized].append(slug_name)
+
+    return Case(
+        *[
+            When(platform_name__in=slug_names, then=Value(normalized))
+            for normalized, slug_names in slug_names_by_normalized.items()
+        ],
+        default=F('platform_name'),
+        output_field=CharField(),
+    )
 
-    This key format is exclusively used within the stats cache for download
-    count aggregation.
 
-    Args:
-        versiondownload (VersionDownload)
+def get_stat_cache_key(cache_type, tool_id, platform_slug_name):
+    return cache_key_data_to_cache_key({
+        u'cache_type': cache_type,
+        u'tool_id': tool_id,
+        u'platform_slug_name': platform_slug_name,
+    })
 
-    Returns:
-        unicode
-    """
-    return u'{tool_id}_{platform_slug_name}'.format(
-        tool_id=versiondownload.tool_id,
-        platform_slug_name=(
-            get_normalized_platform_slug_name(versiondownload.platform_name)
-        ),
+
+def format_average_rating(total_rating, rating_count):
+    u"""Return the average rating floored to 1 decimal, as a string."""
+    if not rating_count:
+        return '0.0'
+
+    average_rating = float(total_rating) / rating_count
+
+    return '{:.1f}'.format(
+        math.floor(average_rating * 10) / 10
     )
 
 
@@ -82,53 +118,36 @@ def update_versiondownload_cache_values(sender, **kwargs):
     """
     Update versiondownload stats cache values (signal receiver).
 
-    Gets all VersionDownload objects, aggregates download totals, and
-    writes values to cache. Overwrites existing data.
+    Aggregates download totals by tool and normalized platform, and by tool,
+    in the database and publishes them (see publish_stats).
     """
     logger.info(u'VersionDownload post_batch_update signal recieved')
 
-    versiondownloads = VersionDownload.objects.all()
-
-    downloads_by_tool_id = {}
-    downloads_by_tool_id_platform = {}
-
-    for versiondownload in versiondownloads:
-        versiondownload.id_platform_key = get_tool_id_platform_key(versiondownload)
+    downloads_by_tool_id_platform = VersionDownload.objects \
+        .values('tool_id', platform_slug_name=get_normalized_platform_slug_name_expression()) \
+        .annotate(total=Sum('download_count')) \
+        .order_by()
 
-        if versiondownload.id_platform_key in downloads_by_tool_id_platform:
-            downloads_by_tool_id_platform[versiondownload.id_platform_key] += versiondownload.download_count
-        else:
-            downloads_by_tool_id_platform[versiondownload.id_platform_key] = versiondownload.download_count
-
-        if versiondownload.tool_id in downloads_by_tool_id:
-            downloads_by_tool_id[versiondownload.tool_id] += versiondownload.download_count
-        else:
-            downloads_by_tool_id[versiondownload.tool_id] = versiondownload.download_count
+    downloads_by_tool_id = VersionDownload.objects \
+        .values('tool_id') \
+        .annotate(total=Sum('download_count')) \
+        .order_by()
 
     cache_data = {}
 
-    for versiondownload in versiondownloads:
-        cache_key = cache_key_data_to_cache_key({
-            u'cache_type': u'stat_versiondownload',
-            u'tool_id': versiondownload.tool_id,
-            u'platform_slug_name': (
-                get_normalized_platform_slug_name(versiondownload.platform_name)
-            )
-        })
-
-        if cache_key not in cache_data:
-            cache_data[cache_key] = downloads_by_tool_id_platform[versiondownload.id_platform_key]
+    for row in downloads_by_tool_id_platform:
+        cache_data[get_stat_cache_key(
+            u'stat_versiondownload',
+            row['tool_id'],
+            row['platform_slug_name'],
+        )] = row['total']
 
-    for tool_id in downloads_by_tool_id:
-        cache_key = cache_key_data_to_cache_key({
-            u'cache_type': u'stat_versiondownload',
-            u'tool_id': tool_id,
-            u'platform_slug_name': 'all'
-        })
+    for row in downloads_by_tool_id:
+        cache_data[get_stat_cache_key(u'stat_versiondownload', row['tool_id'], 'all')] = row['total']
 
-        cache_data[cache_key] = downloads_by_tool_id[tool_id]
+    changed = publish_stats([u'stat_versiondownload'], cache_data)
 
-    cache.set_many(cache_data, None)
+    logger.info(u'{changed} versiondownload stats cache values changed'.format(changed=changed))
 
 
 def update_versionrating_cache_values(sender, **kwargs):
@@ -136,72 +155,45 @@ def update_versionrating_cache_values(sender, **kwargs):
     Update versionrating and versionrating_count stats cache values (signal
     receiver).
 
-    Gets all VersionRating objects; writes all versionrating and
-    versionrating_count values to cache. Overwrites existing data.
+    Reads the rating of every tool and platform, aggregates the rating
+    averages and counts of every tool in the database, and publishes them
+    (see publish_stats).
     """
     logger.info(u'VersionRating post_batch_update signal recieved')
 
-    cache_data = {}
-
-    versionratings = VersionRating.objects.all()
-
-    total_rating_by_tool_id = defaultdict(float)
-    total_rating_count_by_tool_id = defaultdict(int)
-
-    for versionrating in versionratings:
-        versionrating_cache_key = cache_key_data_to_cache_key({
-            u'cache_type': u'stat_versionrating',
-            u'tool_id': versionrating.tool_id,
-            u'platform_slug_name': versionrating.platform_name,
-        })
-
-        cache_data[versionrating_cache_key] = versionrating.star_rating
+    versionratings = VersionRating.objects \
+        .values_list('tool_id', 'platform_name', 'star_rating', 'rating_count')
 
-        versionrating_count_cache_key = cache_key_data_to_cache_key({
-            u'cache_type': u'stat_versionrating_count',
-            u'tool_id': versionrating.tool_id,
-            u'platform_slug_name': versionrating.platform_name,
-        })
+    ratings_by_tool_id = VersionRating.objects \
+        .values('tool_id') \
+        .annotate(
+            total_rating=Sum(
+                ExpressionWrapper(F('star_rating') * F('rating_count'), output_field=FloatField())
+            ),
+            total_rating_count=Sum('rating_count'),
+        ) \
+        .order_by()
 
-        cache_data[versionrating_count_cache_key] = versionrating.rating_count
-
-        total_rating_by_tool_id[versionrating.tool.id] += (
-            float(versionrating.star_rating * versionrating.rating_count)
-        )
-        total_rating_count_by_tool_id[versionrating.tool.id] += (
-            int(versionrating.rating_count)
-        )
+    cache_data = {}
 
-    for tool_id in total_rating_by_tool_id:
-        versionrating_cache_key = cache_key_data_to_cache_key({
-            u'cache_type': u'stat_versionrating',
-            u'tool_id': tool_id,
-            u'platform_slug_name': 'all',
-        })
+    for tool_id, platform_name, star_rating, rating_count in versionratings:
+        cache_data[get_stat_cache_key(u'stat_versionrating', tool_id, platform_name)] = star_rating
+        cache_data[get_stat_cache_key(u'stat_versionrating_count', tool_id, platform_name)] = rating_count
 
-        average_rating = (
-            total_rating_by_tool_id[tool_id] / total_rating_count_by_tool_id[tool_id]
+    for row in ratings_by_tool_id:
+        cache_data[get_stat_cache_key(u'stat_versionrating', row['tool_id'], 'all')] = (
+            format_average_rating(row['total_rating'], row['total_rating_count'])
         )
-
-        average_rating_1_decimal_floor = (
-            '{:.1f}'.format(
-                math.floor(average_rating * 10) / 10
-            )
+        cache_data[get_stat_cache_key(u'stat_versionrating_count', row['tool_id'], 'all')] = (
+            row['total_rating_count']
         )
 
-        cache_data[versionrating_cache_key] = average_rating_1_decimal_floor
-
-        versionrating_count_cache_key = cache_key_data_to_cache_key({
-            u'cache_type': u'stat_versionrating_count',
-            u'tool_id': tool_id,
-            u'platform_slug_name': 'all',
-        })
-
-        cache_data[versionrating_count_cache_key] = total_rating_count_by_tool_id[tool_id]
+    changed = publish_stats([u'stat_versionrating', u'stat_versionrating_count'], cache_data)
 
-    cache.set_many(cache_data, None)
+    logger.info(u'{changed} versionrating stats cache values changed'.format(changed=changed))
 
-    purge_index_and_search()
+    if changed:
+        purge_index_and_search()
 
 
 def purge_index_and_search():
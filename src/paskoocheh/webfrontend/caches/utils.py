@@ -18,9 +18,35 @@
 
 u"""webfrontend cache utility functions."""
 
+import re
+import time
+from collections import defaultdict
+from django.conf import settings
 from django.core.cache import cache
+from django_redis import get_redis_connection
 from webfrontend import __version__ as webfrontend_version
 
+STATS_GENERATION_CACHE_KEY_DATA = {
+    u'cache_type': u'stats_generation',
+}
+
+STATS_PUBLISH_LOCK_CACHE_KEY_DATA = {
+    u'cache_type': u'stats_publish_lock',
+}
+
+# How long the stats cache values of a replaced generation are kept
+STATS_RETIRED_GENERATION_TIMEOUT = 60
+
+# Cached response key data fields the response index is kept by, from the
+# most to the least selective. Every response has a cache_type, so purges by
+# any other field are looked up in the cache_type index.
+RESPONSE_INDEX_FIELDS = (
+    u'p_tool_id',
+    u'url_name',
+    u'p_platform_slug',
+    u'cache_type',
+)
+
 
 def cache_key_data_to_cache_key(cache_key_data):
     cache_key_data[u'app_name'] = u'webfrontend'
@@ -37,9 +63,93 @@ def cache_key_data_to_cache_key(cache_key_data):
     return cache_key
 
 
+def get_response_index_cache_key(field, value):
+    return cache_key_data_to_cache_key({
+        u'cache_type': u'response_index',
+        u'field': field,
+        u'value': value,
+    })
+
+
+def get_stale_response_cache_key(cache_key):
+    return u'cache_type=stale_response&cache_key={cache_key}&'.format(
+        cache_key=cache_key,
+    )
+
+
+def get_response_revalidation_lock_cache_key(cache_key):
+    return u'cache_type=response_revalidation_lock&cache_key={cache_key}&'.format(
+        cache_key=cache_key,
+    )
+
+
+def get_response_request_cache_key(cache_key):
+    return u'cache_type=response_request&cache_key={cache_key}&'.format(
+        cache_key=cache_key,
+    )
+
+
+def get_response_index_candidates(pattern_dict):
+    u"""
+    Return the index field a pattern is looked up by and the fields the
+    members of that index still have to be filtered by.
+    """
+    # Patterns always have a cache_type, so a field is always found
+    field = next(field for field in RESPONSE_INDEX_FIELDS if field in pattern_dict)
+
+    return field, [key for key in pattern_dict if key != field]
+
+
+def index_cached_response(cache_key_data, cache_key, timeout):
+    """
+    Add a cached response key to the response index.
+
+    The key is added to one sorted set per RESPONSE_INDEX_FIELDS field of the
+    response, scored by its expiry time. Expired members are trimmed
+    whenever a set is written to, so the sets only hold live responses.
+
+    Args:
+        cache_key_data (dict): Data the response cache key prefix was
+            compiled from (see get_cache_key_prefix)
+        cache_key (str): Cache key the response is stored under
+        timeout (int): Cache timeout of the response
+
+    Returns:
+        None
+    """
+    now = time.time()
+    expiry = now + timeout if timeout else float('inf')
+
+    with get_redis_connection().pipeline(transaction=False) as pipeline:
+        for field in RESPONSE_INDEX_FIELDS:
+            if field not in cache_key_data:
+                continue
+
+            index_key = cache.make_key(
+                get_response_index_cache_key(field, cache_key_data[field])
+            )
+
+            pipeline.zadd(index_key, {cache_key: expiry})
+            pipeline.zremrangebyscore(index_key, u'-inf', now)
+            if timeout:
+                pipeline.expire(index_key, int(timeout) + 1)
+
+        # The response is fresh again
+        pipeline.delete(cache.make_key(get_stale_response_cache_key(cache_key)))
+
+        pipeline.execute()
+
+
 def delete_cached_responses_matching_patterns(*delete_pattern_dicts):
     """
-    Delete all keys matching provided dict patterns.
+    Delete all cached responses matching provided dict patterns.
+
+    Patterns are looked up in the response index (see index_cached_response)
+    instead of scanning the keyspace, so the cost depends on the number of
+    matching responses rather than on the number of cached responses.
+
+    With WEBFRONTEND_CACHE_RESPONSE_STALE_WHILE_REVALIDATE, matching responses
+    are marked stale instead (see mark_cached_responses_stale).
 
     Args:
         delete_pattern_dicts (dict): Dictionaries describing keys to delete
@@ -48,13 +158,116 @@ def delete_cached_responses_matching_patterns(*delete_pattern_dicts):
     Returns:
         None
     """
-    for delete_pattern_dict in delete_pattern_dicts:
-        delete_keys_matching_pattern(delete_pattern_dict)
+    lookups = []
+
+    with get_redis_connection().pipeline(transaction=False) as pipeline:
+        for delete_pattern_dict in delete_pattern_dicts:
+            delete_pattern_dict = delete_pattern_dict.copy()
+            delete_pattern_dict[u'cache_type'] = u'response'
+
+            field, filter_fields = get_response_index_candidates(delete_pattern_dict)
+            index_key = cache.make_key(
+                get_response_index_cache_key(field, delete_pattern_dict[field])
+            )
+
+            pipeline.zrangebyscore(index_key, time.time(), u'+inf')
+            lookups.append((index_key, [
+                u'&{key}={value}&'.format(key=key, value=delete_pattern_dict[key])
+                for key in filter_fields
+            ]))
+
+        members_by_lookup = pipeline.execute()
+
+    cache_keys_by_index_key = defaultdict(set)
+    for (index_key, filters), members in zip(lookups, members_by_lookup):
+        for member in members:
+            cache_key = member.decode() if isinstance(member, bytes) else member
+            if all(key_filter in cache_key for key_filter in filters):
+                cache_keys_by_index_key[index_key].add(cache_key)
+
+    cache_keys = set().union(*cache_keys_by_index_key.values())
+    if not cache_keys:
+        return
+
+    if settings.WEBFRONTEND_CACHE_RESPONSE_STALE_WHILE_REVALIDATE:
+        mark_cached_responses_stale(cache_keys)
+        return
+
+    cache.delete_many(list(cache_keys))
+
+    with get_redis_connection().pipeline(transaction=False) as pipeline:
+        for index_key, index_cache_keys in cache_keys_by_index_key.items():
+            pipeline.zrem(index_key, *index_cache_keys)
+
+        pipeline.execute()
+
+
+def delete_cached_response(cache_key):
+    """
+    Delete a cached response, its stale mark and stored request, and remove
+    it from the response index.
+
+    The index fields of the response are read back from its cache key,
+    which contains the key prefix it was compiled from.
+
+    Args:
+        cache_key (str): Cache key the response is stored under
+
+    Returns:
+        None
+    """
+    cache.delete_many([
+        cache_key,
+        get_stale_response_cache_key(cache_key),
+        get_response_request_cache_key(cache_key),
+    ])
+
+    with get_redis_connection().pipeline(transaction=False) as pipeline:
+        for field in RESPONSE_INDEX_FIELDS:
+            match = re.search(u'&{field}=([^&]*)&'.format(field=re.escape(field)), cache_key)
+            if match is None:
+                continue
+
+            pipeline.zrem(
+                cache.make_key(get_response_index_cache_key(field, match.group(1))),
+                cache_key,
+            )
+
+        pipeline.execute()
+
+
+def mark_cached_responses_stale(cache_keys):
+    """
+    Mark cached responses stale.
+
+    Stale responses are still served, the first request for one of them
+    triggers its revalidation (see webfrontend.caches.responses.revalidation).
+    With WEBFRONTEND_CACHE_RESPONSE_REWARM, the responses are revalidated
+    right away.
+
+    Args:
+        cache_keys (set): Cache keys of the responses
+
+    Returns:
+        None
+    """
+    from webfrontend.caches.responses.revalidation import schedule_rewarm
+
+    cache.set_many(
+        {
+            get_stale_response_cache_key(cache_key): True
+            for cache_key in cache_keys
+        },
+        settings.WEBFRONTEND_CACHE_RESPONSE_TIMEOUT,
+    )
+
+    if settings.WEBFRONTEND_CACHE_RESPONSE_REWARM:
+        schedule_rewarm(cache_keys)
 
 
 def delete_keys_matching_pattern(delete_pattern_dict):
     """
-    Delete all keys matching a dict pattern.
+    Delete all cached responses matching a dict pattern.
 
     Args:
         delete_pattern_dict (dict): Dictionary describing keys to delete
@@ -63,12 +276,7 @@ def delete_keys_matching_pattern(delete_pattern_dict):
     Returns:
         None
     """
-    delete_pattern_dict = delete_pattern_dict.copy()
-    delete_pattern_dict[u'cache_type'] = u'response'
-
-    cache.delete_pattern(
-        pattern_dict_to_pattern_glob(delete_pattern_dict)
-    )
+    delete_cached_responses_matching_patterns(delete_pattern_dict)
 
 
 def pattern_dict_to_pattern_glob(pattern_dict):
@@ -84,3 +292,119 @@ def pattern_dict_to_pattern_glob(pattern_dict):
         )
 
     return pattern_glob
+
+
+def get_stats_cache_key(generation):
+    return cache_key_data_to_cache_key({
+        u'cache_type': u'stats',
+        u'generation': generation,
+    })
+
+
+def get_stats_generation():
+    """
+    Get the stats cache generation.
+
+    The stats cache values of every generation are stored in their own hash
+    (see publish_stats), and the generation points readers to the current
+    one. Readers that keep a copy of the stats can cheaply check whether it
+    is still current.
+
+    Returns:
+        int (0 if the stats cache has never been written)
+    """
+    return cache.get(
+        cache_key_data_to_cache_key(STATS_GENERATION_CACHE_KEY_DATA.copy()),
+        0,
+    )
+
+
+def get_stats(generation):
+    """
+    Get the stats cache values of a generation.
+
+    Args:
+        generation (int): See get_stats_generation
+
+    Returns:
+        dict: Values (str) by stat cache key
+    """
+    stats = get_redis_connection().hgetall(
+        cache.make_key(get_stats_cache_key(generation))
+    )
+
+    return {
+        field.decode(): value.decode()
+        for field, value in stats.items()
+    }
+
+
+def publish_stats(cache_types, cache_data):
+    """
+    Replace the stats cache values of some stat cache types.
+
+    The values of the current generation are copied into a new generation
+    hash with the values of cache_types replaced by cache_data. The new
+    generation is then made current by renaming a pointer key over the
+    generation key, so readers always get a complete generation, never a
+    half-updated one. Nothing is written if no value changed.
+
+    Args:
+        cache_types (list): Stat cache types (e.g. stat_versiondownload)
+            cache_data replaces
+        cache_data (dict): Values by stat cache key
+
+    Returns:
+        int: Number of values that changed
+    """
+    redis = get_redis_connection()
+    generation_cache_key = cache.make_key(
+        cache_key_data_to_cache_key(STATS_GENERATION_CACHE_KEY_DATA.copy())
+    )
+    type_filters = [
+        u'&cache_type={cache_type}&'.format(cache_type=cache_type)
+        for cache_type in cache_types
+    ]
+
+    with cache.lock(cache_key_data_to_cache_key(STATS_PUBLISH_LOCK_CACHE_KEY_DATA.copy()), timeout=60):
+        generation = get_stats_generation()
+        current_stats = get_stats(generation)
+
+        stats = {
+            field: value
+            for field, value in current_stats.items()
+            if not any(type_filter in field for type_filter in type_filters)
+        }
+        stats.update({
+            cache_key: str(value)
+            for cache_key, value in cache_data.items()
+        })
+
+        changed = len([
+            field
+            for field in stats.keys() | current_stats.keys()
+            if stats.get(field) != current_stats.get(field)
+        ])
+        if not changed:
+            return 0
+
+        stats_cache_key = cache.make_key(get_stats_cache_key(generation + 1))
+        pointer_cache_key = generation_cache_key + u'&pointer'
+
+        with redis.pipeline() as pipeline:
+            pipeline.delete(stats_cache_key)
+            if stats:
+                pipeline.hset(stats_cache_key, mapping=stats)
+            pipeline.set(pointer_cache_key, generation + 1)
+            pipeline.rename(pointer_cache_key, generation_cache_key)
+
+            # Readers that have just read the previous generation can still
+            # get its values for a while
+            pipeline.expire(
+                cache.make_key(get_stats_cache_key(generation)),
+                STATS_RETIRED_GENERATION_TIMEOUT,
+            )
+
+            pipeline.execute()
+
+    return changed
@@ -1,21 +1,26 @@
 import re
+import threading
+import time
+from collections import defaultdict
 from copy import deepcopy
 from django.conf import settings
-from django.core.cache import cache
 from django.http import HttpResponseForbidden
 from django.middleware import csrf
 from django.utils.cache import add_never_cache_headers
 from django.utils.deprecation import MiddlewareMixin
 from django.utils.translation import npgettext, pgettext
 from django.shortcuts import redirect
-from functools import partial
-from webfrontend.caches.utils import pattern_dict_to_pattern_glob
+from webfrontend.caches.utils import (
+    get_stats,
+    get_stats_generation,
+)
 from webfrontend.utils.general import (
     enforce_required_args,
     get_ua_default_platform_slug_name_os,
     replace_wa_numerals_with_pa_numerals,
     SUPPORTED_PLATFORM_SLUG_NAMES,
 )
+from webfrontend.utils.response import build_response_splice_plan
 
 u"""Webfrontend-specific middleware (registered globally by necessity)."""
 
@@ -104,8 +109,6 @@ class ResponseManipulationMiddleware(object):       # noqa C901
     Middleware that manipulates webfrontend responses.
     """
     cache_versionratings = {}
-    inline_style_tag_pattern = re.compile(r'(<style.*>(([^<]|\n)*)<\/style>)')
-    stat_placeholder_pattern = re.compile(r'\[stat_([\w_]+)_(\d+)_(\w+)\]')
     versiondownload_none_translation = pgettext(
         u'Tool version download count',
         u'None',
@@ -118,19 +121,25 @@ class ResponseManipulationMiddleware(object):       # noqa C901
     def __init__(self, get_response):
         self.get_response = get_response
 
-    def get_stat_placeholder_replacement(self, match, request=None):        # noqa C901
+    def get_stat_placeholder_replacement(self, cache_type, tool_id, platform_slug_name, request=None):        # noqa C901
         u"""
-        Given a stat_placeholder_pattern match, get an appropriate response.
+        Given the parts of a [stat_*] placeholder, get an appropriate
+        response.
 
         Args:
-            MatchObject (from stat_placeholder_pattern)
+            cache_type (unicode)
+            tool_id (unicode)
+            platform_slug_name (unicode)
 
         Returns:
             Unicode
         """
         try:
-            cache_type, tool_id, platform_slug_name = match.groups()
-            placeholder = match.group()
+            placeholder = '[stat_{cache_type}_{tool_id}_{platform_slug_name}]'.format(
+                cache_type=cache_type,
+                tool_id=tool_id,
+                platform_slug_name=platform_slug_name,
+            )
 
             # For Zanga, replace values with Western Arabic numerals (e.g. 4.6)
             # For Paskoocheh, replace values with Perso-Arabic numerals (e.g. ۴.۶)
@@ -236,33 +245,18 @@ class ResponseManipulationMiddleware(object):       # noqa C901
 
             add_never_cache_headers(response)
 
-            # =========================================
-            # === Replace [csrf_token] placeholders ===
-            # =========================================
-            # Replace all insances of "[csrf_token]" with a request-specific
-            # token. This is necessary because most views’ responses are
-            # cached, and we need these caches to be shareable between
-            # different clients. See README for more details.
+            # ====================================
+            # === Get the response splice plan ===
+            # ====================================
+            # The response body is tokenized once into static segments and
+            # the placeholders between them (see build_response_splice_plan).
+            # Cached responses carry the plan computed when they were cached,
+            # so it only has to be built here for uncached responses.
 
-            csrf_token_for_request = csrf.get_token(request).encode()
-
-            response.content = response.content.replace(
-                b'[csrf_token]',
-                csrf_token_for_request
-            )
-
-            # =====================================
-            # === Replace [stat_*] placeholders ===
-            # =====================================
-            # Replace all stat placeholders with values from
-            # request.webfrontend_stats['values_by_placeholder'] (which is set in
-            # RequestProcessingAndInterceptionMiddleware)
+            splice_plan = getattr(response, 'pk_splice_plan', None)
 
-            response.content = re.sub(
-                self.stat_placeholder_pattern,
-                partial(self.get_stat_placeholder_replacement, request=request),
-                response.content.decode(),
-            ).encode()
+            if splice_plan is None or splice_plan['length'] != len(response.content):
+                splice_plan = build_response_splice_plan(response.content)
 
             # ==============================
             # === Populate inline styles ===
@@ -288,9 +282,9 @@ class ResponseManipulationMiddleware(object):       # noqa C901
             # -----------------------------------------------------------------
             # --- Gather all all <style> content into single <head> <style> ---
             # -----------------------------------------------------------------
-            # Find and removes every <style> element, then consolidating the
-            # contained styles into a single <style> element at the end of the
-            # <head>.
+            # Every <style> element is removed from the splice plan’s
+            # segments, and the contained styles are consolidated into a
+            # single <style> element at the end of the <head>.
             #
             # This is useful because it lets us calculate styles inside template
             # tags, which don’t have access to the outside context and therefore
@@ -301,25 +295,42 @@ class ResponseManipulationMiddleware(object):       # noqa C901
             # pre-caculate styles outside of component template code to work
             # around the template tag isolation.
 
-            style_element_matches = re.findall(self.inline_style_tag_pattern, response.content.decode())
-
-            if style_element_matches:
-                for style_element_match in style_element_matches:
-                    # Group 0: Full style tag match ("<style>[…]</style>")
-                    # Group 1: Inline styles (CSS)
-                    # Group 2: Internal-use group, used to match newlines
-                    if len(style_element_match) == 3:
-                        inline_styles += style_element_match[1]
-                        response.content = response.content.replace(
-                            style_element_match[0].encode(),
-                            b''
-                        )
+            inline_styles += splice_plan['styles']
 
             if len(inline_styles) > 0:
-                response.content = response.content.replace(
-                    b'</head>',
-                    b'<style type="text/css">' + inline_styles.encode() + b'</style>\n</head>'
-                )
+                head_end = b'<style type="text/css">' + inline_styles.encode() + b'</style>\n</head>'
+            else:
+                head_end = b'</head>'
+
+            # ================================
+            # === Replace the placeholders ===
+            # ================================
+            # Replace all insances of "[csrf_token]" with a request-specific
+            # token. This is necessary because most views’ responses are
+            # cached, and we need these caches to be shareable between
+            # different clients. See README for more details.
+            #
+            # Replace all stat placeholders with values from
+            # request.webfrontend_stats['values_by_placeholder'] (which is set in
+            # RequestProcessingAndInterceptionMiddleware)
+
+            csrf_token_for_request = csrf.get_token(request).encode()
+
+            content = [splice_plan['segments'][0]]
+
+            for token, segment in zip(splice_plan['tokens'], splice_plan['segments'][1:]):
+                if token[0] == 'csrf_token':
+                    content.append(csrf_token_for_request)
+                elif token[0] == 'stat':
+                    content.append(
+                        self.get_stat_placeholder_replacement(*token[1:], request=request).encode()
+                    )
+                else:
+                    content.append(head_end)
+
+                content.append(segment)
+
+            response.content = b''.join(content)
 
         return response
 
@@ -328,6 +339,9 @@ class RequestProcessingAndInterceptionMiddleware(MiddlewareMixin):
     u"""
     Middleware that runs before Django calls view.
     """
+    # Per-process stats snapshot, see populate_cache_stats
+    stats_snapshot = None
+    stats_snapshot_lock = threading.Lock()
 
     def process_view(self, request, view_func, view_args, view_kwargs):
         u"""
@@ -481,14 +495,15 @@ class RequestProcessingAndInterceptionMiddleware(MiddlewareMixin):
 
     def populate_cache_stats(self, request):
         u"""
-        Populate request.webfrontend_stats from Redis cache. For efficiency’s
-        sake, the cache is accessed once and shared throughout the request.
+        Populate request.webfrontend_stats from Redis cache.
 
-        It would be more efficient to store webfrontend_stats as a middleware
-        attribute and keep it in memory between requests, however managing and
-        refreshing this would introduce complexity and potential avenues for
-        race conditions depending on the threading model on the server(?). If
-        this turns out to be a performance issue, it would be worth looking at.
+        The parsed stats are kept in a per-process snapshot which is shared
+        (read-only) by all requests. The snapshot is trusted for
+        WEBFRONTEND_STATS_SNAPSHOT_TTL seconds; after that the stats
+        generation (bumped by the stats cache post_batch_update receivers) is
+        checked and the stats are only re-read from Redis if it has changed.
+        This way most requests don’t hit Redis at all, and the stats hash is
+        only read once per process per stats update.
 
         Args:
             request (WSGIRequest)
@@ -498,17 +513,46 @@ class RequestProcessingAndInterceptionMiddleware(MiddlewareMixin):
         """
         enforce_required_args(locals(), 'request')
 
-        cache_stats = cache.get_many(
-            cache.keys(
-                pattern_dict_to_pattern_glob({
-                    'cache_type': 'stat_*'
-                })
-            )
-        )
+        now = time.monotonic()
+        snapshot = self.stats_snapshot
+
+        if snapshot is None or now >= snapshot['expires']:
+            with self.stats_snapshot_lock:
+                snapshot = self.stats_snapshot
+
+                if snapshot is None or now >= snapshot['expires']:
+                    stats_generation = get_stats_generation()
+
+                    if snapshot is None or snapshot['generation'] != stats_generation:
+                        snapshot = {
+                            'generation': stats_generation,
+                            'stats': self.get_cache_stats(stats_generation),
+                        }
+                    else:
+                        snapshot = snapshot.copy()
 
-        request.webfrontend_stats = {
+                    snapshot['expires'] = now + settings.WEBFRONTEND_STATS_SNAPSHOT_TTL
+
+                    RequestProcessingAndInterceptionMiddleware.stats_snapshot = snapshot
+
+        request.webfrontend_stats = snapshot['stats']
+
+    def get_cache_stats(self, stats_generation):
+        u"""
+        Read and parse all stat values of a stats generation from Redis cache.
+
+        Args:
+            stats_generation (int): See get_stats_generation
+
+        Returns:
+            dict ('values_by_placeholder' and 'download_counts_by_platform',
+                the download counts by tool id by platform slug name)
+        """
+        cache_stats = get_stats(stats_generation)
+
+        webfrontend_stats = {
             'values_by_placeholder': {},
-            'versiondownload_values_by_key': {},
+            'download_counts_by_platform': defaultdict(dict),
         }
 
         for cache_stat_key in cache_stats:
@@ -518,8 +562,8 @@ class RequestProcessingAndInterceptionMiddleware(MiddlewareMixin):
                 stat_cache_type, platform_slug_name, tool_id = match.groups()
 
                 if stat_cache_type == 'versiondownload':
-                    request.webfrontend_stats['versiondownload_values_by_key'][cache_stat_key] = (
-                        cache_stats[cache_stat_key]
+                    webfrontend_stats['download_counts_by_platform'][platform_slug_name][int(tool_id)] = (
+                        int(cache_stats[cache_stat_key])
                     )
 
                 placeholder = '[stat_{stat_cache_type}_{tool_id}_{platform_slug_name}]'.format(
@@ -528,6 +572,13 @@ class RequestProcessingAndInterceptionMiddleware(MiddlewareMixin):
                     platform_slug_name=platform_slug_name,
                 )
 
-                request.webfrontend_stats['values_by_placeholder'][placeholder] = (
+                webfrontend_stats['values_by_placeholder'][placeholder] = (
                     cache_stats[cache_stat_key]
                 )
+
+        # The stats are shared by the requests of a stats generation, so
+        # reading a missing platform mustn't add it
+        webfrontend_stats['download_counts_by_platform'] = dict(
+            webfrontend_stats['download_counts_by_platform'])
+
+        return webfrontend_stats
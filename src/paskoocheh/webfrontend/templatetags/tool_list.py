@@ -18,17 +18,15 @@
 
 u"""Registers webfrontend’s custom Django template tags."""
 
-import icu
 from django import template
 from operator import attrgetter
+from paskoocheh.helpers import get_sort_key
 from webfrontend.templatetags.tool_list_item import ToolListItemContext
 from webfrontend.utils.general import enforce_required_args
 from django.conf import settings
 
 register = template.Library()
 
-app = settings.PLATFORM
-
 
 @register.inclusion_tag('webfrontend/tags/tool_list.html')
 def tool_list(tool_list_item_contexts, is_preview=False, in_search_view=False):
@@ -40,6 +38,7 @@ def tool_list(tool_list_item_contexts, is_preview=False, in_search_view=False):
 
 
 def construct_tool_list_item_context_list(  # noqa: C901
+    keep_order=False,
     order_by=None,
     order_reverse=False,
     request=None,
@@ -48,7 +47,8 @@ def construct_tool_list_item_context_list(  # noqa: C901
 ):
     u"""
     Processes a list of tools into a list of ToolListItemContext ordered by
-    order_by, or by transliterated name if no order provided.
+    order_by, or by transliterated name (the stored sort key of the Info or
+    Tool) if no order provided and the order of tools isn’t kept.
 
     Required args:
         request (WSGIRequest)
@@ -58,6 +58,8 @@ def construct_tool_list_item_context_list(  # noqa: C901
         tools (iterable of Tool)
 
     Optional args:
+        keep_order (bool): Keep the order of tools (e.g. search results
+            ordered by relevance) if no order provided?
         order_by (str): ToolListItemContext sorting key
         order_reverse (bool): Reverse sorting order?
 
@@ -71,6 +73,9 @@ def construct_tool_list_item_context_list(  # noqa: C901
     # =============================================
     tool_list_item_contexts = []
 
+    # Download counts by tool id by platform slug name
+    download_counts = request.webfrontend_stats['download_counts_by_platform']
+
     for tool in tools:
         # Don’t include tool if it isn’t publishable or has no (publishable)
         # versions
@@ -116,8 +121,14 @@ def construct_tool_list_item_context_list(  # noqa: C901
 
         if tool_info is not None:
             name = tool_info.name
+            sort_key = tool_info.sort_key
         else:
             name = tool.name
+            sort_key = tool.sort_key
+
+        # Rows saved before sort keys were stored
+        if not sort_key:
+            sort_key = get_sort_key(name)
 
         should_display_all_platform_stats = (
             stats_for_platform_slug_name == 'all'
@@ -126,14 +137,10 @@ def construct_tool_list_item_context_list(  # noqa: C901
         # ---------------------------------------------------
         # --- Find version download count in cache values ---
         # ---------------------------------------------------
-        download_count = 0
-        for key in request.webfrontend_stats['versiondownload_values_by_key']:
-            if (
-                'tool_id={}&'.format(tool.id) in key and
-                'platform_slug_name={}&'.format('all' if should_display_all_platform_stats else version.supported_os.slug_name) in key
-            ):
-                download_count = int(request.webfrontend_stats['versiondownload_values_by_key'][key])
-                break
+        download_count = download_counts.get(
+            'all' if should_display_all_platform_stats else version.supported_os.slug_name,
+            {},
+        ).get(tool.id, 0)
 
         in_search_view = ('query' in request.GET)
 
@@ -145,6 +152,7 @@ def construct_tool_list_item_context_list(  # noqa: C901
                 download_count=download_count,
                 logo=logo,
                 name=name,
+                sort_key=sort_key,
                 platform_slug=version.supported_os.slug_name,
                 should_display_browser_badge=should_display_browser_badge,
                 should_display_all_platform_stats=should_display_all_platform_stats,
@@ -161,13 +169,13 @@ def construct_tool_list_item_context_list(  # noqa: C901
                 reverse=order_reverse
             )
         )
+    elif keep_order:
+        sorted_tool_list_item_contexts = tool_list_item_contexts
     else:
-        icu_transliterator = icu.Transliterator.createInstance('Arabic-Latin/BGN' if app == 'zanga' else 'Persian-Latin/BGN')
-
         sorted_tool_list_item_contexts = (
             sorted(
                 tool_list_item_contexts,
-                key=lambda tool_list_item: icu_transliterator.transliterate(tool_list_item.name)
+                key=attrgetter('sort_key')
             )
         )
 
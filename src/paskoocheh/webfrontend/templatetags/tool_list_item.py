@@ -40,6 +40,8 @@ class ToolListItemContext(object):
         download_count (int)
         logo (Image)
         name (unicode)
+        sort_key (unicode): Transliterated name (see
+            paskoocheh.helpers.get_sort_key)
         platform_slug (unicode)
         should_display_browser_badge (bool)
         version (Version)
@@ -49,6 +51,7 @@ class ToolListItemContext(object):
     logo = attr.ib()
     name = attr.ib()
     name_inner_html = attr.ib(init=False)
+    sort_key = attr.ib()
     platform_slug = attr.ib()
     should_display_all_platform_stats = attr.ib()
     should_display_browser_badge = attr.ib()
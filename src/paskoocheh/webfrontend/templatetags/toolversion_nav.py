@@ -18,8 +18,8 @@
 
 u"""Registers toolversion_nav Django template tag."""
 
-import icu
 from django import template
+from paskoocheh.helpers import get_sort_key
 from webfrontend.utils.general import enforce_required_args
 from django.conf import settings
 
@@ -54,11 +54,6 @@ def toolversion_nav(
         'tool_name_localized',
     )
 
-    if app == 'zanga':
-        icu_transliterator = icu.Transliterator.createInstance('Arabic-Latin/BGN')
-    else:
-        icu_transliterator = icu.Transliterator.createInstance('Persian-Latin/BGN')
-
     extension_platforms = ['chrome', 'firefox']
     if extensions_only:
         available_versions = [v for v in available_versions if v.supported_os.slug_name in extension_platforms]
@@ -68,7 +63,7 @@ def toolversion_nav(
     sorted_available_versions = (
         sorted(
             available_versions,
-            key=lambda version: icu_transliterator.transliterate(version.supported_os.display_name_ar or version.supported_os.display_name if app == 'zanga' else version.supported_os.display_name_fa)
+            key=lambda version: get_sort_key(version.supported_os.display_name_ar or version.supported_os.display_name if app == 'zanga' else version.supported_os.display_name_fa)
         )
     )
 
@@ -0,0 +1,112 @@
+# coding: utf-8
+# Paskoocheh - A tool marketplace for Iranian
+#
+# Copyright (C) 2024 ASL19 Organization
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+u"""webfrontend response utilities."""
+
+import re
+
+# Everything in a response body that ResponseManipulationMiddleware replaces:
+# [csrf_token] and [stat_*] placeholders, inline <style> elements (which are
+# moved to the end of the <head>) and </head>.
+RESPONSE_TOKEN_PATTERN = re.compile(
+    rb'(?P<csrf_token>\[csrf_token\])|'
+    rb'(?P<stat>\[stat_(?P<stat_cache_type>[\w_]+)_(?P<stat_tool_id>\d+)_(?P<stat_platform_slug_name>\w+)\])|'
+    rb'(?P<style><style.*>(?P<style_content>([^<]|\n)*)<\/style>)|'
+    rb'(?P<head_end></head>)'
+)
+
+
+def build_response_splice_plan(content):
+    u"""
+    Tokenize a response body into a splice plan.
+
+    The plan consists of the static segments of the body and the tokens
+    (placeholders and </head>) between them, so rendering the body for a
+    request only requires joining the segments with the request-specific
+    token values. Inline <style> elements are removed from the segments and
+    their contents are collected in the plan’s styles.
+
+    Args:
+        content (bytes): Response body
+
+    Returns:
+        dict: {
+            'segments': [bytes] (one more than there are tokens),
+            'tokens': [tuple] (('csrf_token',), ('head_end',) or
+                ('stat', cache_type, tool_id, platform_slug_name)),
+            'styles': unicode,
+            'length': int (length of content),
+        }
+    """
+    segments = []
+    tokens = []
+    styles = []
+
+    pieces = []
+    position = 0
+
+    for match in RESPONSE_TOKEN_PATTERN.finditer(content):
+        pieces.append(content[position:match.start()])
+        position = match.end()
+
+        if match.group('style') is not None:
+            styles.append(match.group('style_content'))
+            continue
+
+        segments.append(b''.join(pieces))
+        pieces = []
+
+        if match.group('csrf_token') is not None:
+            tokens.append(('csrf_token',))
+        elif match.group('stat') is not None:
+            tokens.append((
+                'stat',
+                match.group('stat_cache_type').decode(),
+                match.group('stat_tool_id').decode(),
+                match.group('stat_platform_slug_name').decode(),
+            ))
+        else:
+            tokens.append(('head_end',))
+
+    pieces.append(content[position:])
+    segments.append(b''.join(pieces))
+
+    return {
+        'segments': segments,
+        'tokens': tokens,
+        'styles': b''.join(styles).decode(),
+        'length': len(content),
+    }
+
+
+def add_response_splice_plan(response, request):
+    u"""
+    Attach a splice plan (see build_response_splice_plan) to a response
+    before it’s cached, so it’s only computed once per cached response.
+
+    Args:
+        response (HttpResponse)
+        request (WSGIRequest)
+
+    Returns:
+        HttpResponse
+    """
+    if not getattr(response, 'streaming', False):
+        response.pk_splice_plan = build_response_splice_plan(response.content)
+
+    return response
@@ -17,12 +17,12 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 from copy import deepcopy
-from django.db.models import Q
 from django.shortcuts import redirect, render
 from django.utils.translation import pgettext
 from django.views import View
 from preferences.models import Platform, ToolType
 from tools.models import Tool
+from tools.search import search_tools
 from webfrontend.caches.responses.decorators import pk_cache_response
 from webfrontend.templatetags.pk_meta_tags import PkViewMetadata
 from webfrontend.templatetags.tool_list import (
@@ -45,32 +45,25 @@ app = settings.PLATFORM
 class SearchView(View):
     u"""View for search page (/?)."""
 
-    def get_base_tool_search_queryset(self, filter_args, search_query):
+    def get_base_tool_search_queryset(self, filter_args, search_query, exclude_args=None):
         u"""
-        Returns a queryset for searching with a search query. Queries on both
-        the name and infos.name (localized name), and excludes duplicates.
-
-        TODO: Handle different combinations of `language` once localization is
-        set up.
+        Returns a queryset for searching with a search query, ordered by
+        relevance (see tools.search). Searches the documents of the request’s
+        language, which cover both the name and the localized and English
+        infos.name. Tools are filtered in a subquery, so filters across
+        versions don’t produce duplicates.
 
         Returns:
             search_queryset (QuerySet)
         """
-        search_queryset = (
-            Tool.objects
-            .filter(
-                (
-                    Q(name__icontains=search_query) |
-                    (
-                        Q(infos__name__icontains=search_query) &
-                        (
-                            Q(infos__language=self.request.LANGUAGE_CODE) |
-                            Q(infos__language='en')
-                        )
-                    )
-                ) &
-                Q(**filter_args)
-            )
+        filtered_tools = Tool.objects.filter(**filter_args)
+        if exclude_args:
+            filtered_tools = filtered_tools.exclude(**exclude_args)
+
+        search_queryset = search_tools(
+            search_query,
+            self.request.LANGUAGE_CODE,
+            Tool.objects.filter(pk__in=filtered_tools.values('pk')),
         )
 
         return search_queryset
@@ -245,7 +238,7 @@ class SearchView(View):
                     ),
                     request,
                     platform.slug_name if platform else None,
-                ).distinct('name')
+                )
             )
         else:
             filtered_tools = (
@@ -258,6 +251,7 @@ class SearchView(View):
 
         filtered_tools_list_item_contexts = (
             construct_tool_list_item_context_list(
+                keep_order=(search_query is not None),
                 order_by=order_by,
                 order_reverse=order_reverse,
                 request=request,
@@ -277,20 +271,18 @@ class SearchView(View):
                 # main results
                 other_platform_tools = (
                     add_prefetch_related_to_tools_queryset(
-                        (
-                            self.get_base_tool_search_queryset(
-                                other_platform_filter_args,
-                                search_query
-                            )
-                            .exclude(
-                                versions__supported_os__slug_name__in=(
+                        self.get_base_tool_search_queryset(
+                            other_platform_filter_args,
+                            search_query,
+                            exclude_args={
+                                'versions__supported_os__slug_name__in': (
                                     get_filter_platform_slugs(platform.slug_name)
-                                )
-                            )
+                                ),
+                            },
                         ),
                         request
                     )
-                ).distinct('name')
+                )
             else:
                 other_platform_tools = (
                     add_prefetch_related_to_tools_queryset(
@@ -308,6 +300,7 @@ class SearchView(View):
 
             other_platform_tools_list_item_contexts = (
                 construct_tool_list_item_context_list(
+                    keep_order=(search_query is not None),
                     order_by=order_by,
                     order_reverse=order_reverse,
                     request=request,